@@ -0,0 +1,281 @@
+"""
+Fleet throughput benchmark. \n
+Runs mu in a subprocess against a fleet of simulated RouterOS devices
+(mu.simulator) for every combination of fleet size and number of jobs
+and reports devices/hour, per-phase p50/p95, peak RSS and CPU time
+of the mu process. \n
+Example: \n
+python -m benchmarks.fleet_bench --sizes 10,50 --jobs 1,8 --latency 0.02
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Sequence
+from typing import Any
+
+import paramiko
+import yaml
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from mu.simulator import Fleet
+from mu.timing import percentile
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent
+MODES = {
+    'dry-run': ['--dry-run'],
+    'backup': ['--backup-only'],
+    'update': ['--update-only'],
+    'full': [],
+}
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(',') if v]
+
+
+def write_key(path: pathlib.Path) -> None:
+    """Write an Ed25519 private key in the OpenSSH format mu loads."""
+    key = Ed25519PrivateKey.generate()
+    path.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.OpenSSH,
+            serialization.NoEncryption(),
+        ),
+    )
+    path.chmod(0o600)
+
+
+def phase_stats(json_log: pathlib.Path) -> dict[str, dict[str, float]]:
+    """Per-phase count, p50, p95 and max from a mu JSON lines log."""
+    durations: dict[str, list[float]] = {}
+    try:
+        with open(json_log) as stream:
+            for line in stream:
+                record = json.loads(line)
+                if 'phase' in record and 'duration' in record:
+                    durations.setdefault(record['phase'], []).append(
+                        record['duration'],
+                    )
+    except OSError:
+        pass
+    return {
+        phase: {
+            'count': len(values),
+            'p50': round(percentile(values, 50), 4),
+            'p95': round(percentile(values, 95), 4),
+            'max': round(max(values), 4),
+        }
+        for phase, values in durations.items()
+    }
+
+
+def run_case(
+        size: int,
+        jobs: int,
+        args: argparse.Namespace,
+        workdir: pathlib.Path,
+        key_file: pathlib.Path,
+        host_key: paramiko.PKey,
+) -> dict[str, Any]:
+    """Run mu once against a fresh fleet and return the measurements."""
+    case_dir = workdir / f'{size}-{jobs}'
+    case_dir.mkdir(parents=True, exist_ok=True)
+    fleet = Fleet(
+        size,
+        host_key=host_key,
+        boot_time=args.boot_time,
+        boot_jitter=args.boot_jitter,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        backup_size=args.backup_size,
+        firmware='7.12' if args.firmware else None,
+    )
+    with fleet:
+        config = fleet.config(
+            private_key_file=str(key_file),
+            backup_dir=str(case_dir / 'backups'),
+            log_dir=str(case_dir),
+            log_json=True,
+            update_firmware=args.firmware,
+            reboot_timeout=args.reboot_timeout,
+        )
+        config_file = case_dir / 'mu.yaml'
+        config_file.write_text(yaml.safe_dump(config))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            p for p in (str(REPO_ROOT), env.get('PYTHONPATH')) if p
+        )
+        with open(case_dir / 'mu.out', 'w') as out:
+            start = time.perf_counter()
+            proc = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'mu',
+                    *MODES[args.mode],
+                    '-j', str(jobs),
+                    str(config_file),
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=out,
+                stderr=subprocess.STDOUT,
+                env=env,
+            )
+            # wait4 gives the resource usage of this child only
+            _, status, usage = os.wait4(proc.pid, 0)
+            wall = time.perf_counter() - start
+        proc.returncode = exit_code = os.waitstatus_to_exitcode(status)
+    max_rss = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024
+    return {
+        'size': size,
+        'jobs': jobs,
+        'exit_code': exit_code,
+        'wall_s': round(wall, 3),
+        'devices_per_hour': round(size / wall * 3600, 1),
+        'cpu_user_s': round(usage.ru_utime, 3),
+        'cpu_system_s': round(usage.ru_stime, 3),
+        'max_rss_kib': max_rss,
+        'reboots': sum(r.reboots for r in fleet.routers),
+        'phases': phase_stats(case_dir / 'mikrotik_update.jsonl'),
+    }
+
+
+def median_run(runs: Sequence[dict[str, Any]]) -> dict[str, Any]:
+    """The run with the median wall time, with the spread of all runs."""
+    ordered = sorted(runs, key=lambda r: r['wall_s'])
+    result = dict(ordered[(len(ordered) - 1) // 2])
+    result['runs'] = len(runs)
+    result['wall_s_all'] = [r['wall_s'] for r in runs]
+    return result
+
+
+def compare(
+        results: Sequence[dict[str, Any]],
+        baseline: Sequence[dict[str, Any]],
+        tolerance: float,
+) -> list[str]:
+    """
+    Return a message for every case whose devices/hour dropped more
+    than tolerance (fraction) below the baseline.
+    """
+    reference = {(r['size'], r['jobs']): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = reference.get((r['size'], r['jobs']))
+        if not base:
+            continue
+        limit = base['devices_per_hour'] * (1 - tolerance)
+        if r['devices_per_hour'] < limit:
+            regressions.append(
+                f'size={r["size"]} jobs={r["jobs"]}: '
+                f'{r["devices_per_hour"]:.1f} devices/hour, '
+                f'baseline {base["devices_per_hour"]:.1f}',
+            )
+    return regressions
+
+
+def table_lines(results: Sequence[dict[str, Any]]) -> list[str]:
+    lines = [
+        f'{"size":>5} {"jobs":>5} {"exit":>4} {"wall s":>9} '
+        f'{"dev/hour":>10} {"cpu s":>8} {"rss MiB":>8} '
+        f'{"p50 conn":>9} {"p95 conn":>9}',
+    ]
+    for r in results:
+        connect = r['phases'].get('connect', {})
+        lines.append(
+            f'{r["size"]:>5} {r["jobs"]:>5} {r["exit_code"]:>4} '
+            f'{r["wall_s"]:>9.2f} {r["devices_per_hour"]:>10.1f} '
+            f'{r["cpu_user_s"] + r["cpu_system_s"]:>8.2f} '
+            f'{r["max_rss_kib"] / 1024:>8.1f} '
+            f'{connect.get("p50", 0):>9.3f} {connect.get("p95", 0):>9.3f}',
+        )
+    return lines
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='fleet_bench',
+        description='Benchmark mu against simulated RouterOS fleets.',
+    )
+    parser.add_argument('--sizes', type=_int_list, default=[10, 50])
+    parser.add_argument('--jobs', type=_int_list, default=[1, 8])
+    parser.add_argument('--mode', choices=MODES, default='full')
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--boot-time', type=float, default=2.0)
+    parser.add_argument('--boot-jitter', type=float, default=0.0)
+    parser.add_argument(
+        '--bandwidth', type=int, default=0,
+        help='bytes per second, 0 is unlimited',
+    )
+    parser.add_argument('--backup-size', type=int, default=64 * 1024)
+    parser.add_argument('--firmware', action='store_true')
+    parser.add_argument('--reboot-timeout', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument(
+        '--baseline',
+        help='JSON results of an earlier run to compare devices/hour with',
+    )
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--workdir', help='keep logs and configs here')
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+    host_key = paramiko.RSAKey.generate(2048)
+    with tempfile.TemporaryDirectory(prefix='mu-bench-') as tmp:
+        workdir = pathlib.Path(args.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        key_file = workdir / 'id_ed25519'
+        write_key(key_file)
+        results = []
+        for size in args.sizes:
+            for jobs in args.jobs:
+                runs = [
+                    run_case(size, jobs, args, workdir, key_file, host_key)
+                    for _ in range(args.repeat)
+                ]
+                result = median_run(runs)
+                results.append(result)
+                print(
+                    f'size={size} jobs={jobs} '
+                    f'{result["devices_per_hour"]:.1f} devices/hour',
+                    flush=True,
+                )
+    for line in table_lines(results):
+        print(line)
+    if args.output:
+        data = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': {
+                k: v for k, v in vars(args).items()
+                if k not in ('output', 'baseline', 'workdir')
+            },
+            'results': results,
+        }
+        pathlib.Path(args.output).write_text(json.dumps(data, indent=2))
+    status = 0
+    if any(r['exit_code'] for r in results):
+        print('mu failed in some runs, see mu.out in the workdir')
+        status = 1
+    if args.baseline:
+        baseline = json.loads(pathlib.Path(args.baseline).read_text())
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for message in regressions:
+            print(f'regression: {message}')
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+"""
+Microbenchmarks of the RouterOS output parsers and version comparison. \n
+Every case calls one parser (Device getters, UserRegistrator checks,
+version comparison) on large synthetic outputs produced by mu.simulator,
+or on outputs recorded with mu --record, and reports the time per call
+and the peak memory allocated during one call. \n
+Example: \n
+python -m benchmarks.parsers_bench --output parsers.json
+python -m benchmarks.parsers_bench --baseline parsers.json
+"""
+import argparse
+import functools
+import json
+import pathlib
+import platform
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from collections.abc import Sequence
+from typing import Any
+from unittest.mock import MagicMock
+
+import paramiko
+
+from mu.config import Config
+from mu.device import Device
+from mu.logger import Logger
+from mu.replay import Recording
+from mu.replay import ReplayClient
+from mu.routeros import RouterOSVersion
+from mu.simulator import SimulatedRouter
+from mu.userregistrator import UserRegistrator
+
+VERSIONS = [
+    f'{major}.{minor}{suffix}'
+    for major in (6, 7)
+    for minor in range(1, 21)
+    for suffix in ('', '.1', '.2', 'beta3', 'rc1')
+]
+# the commands each Device parser needs, for recorded outputs
+DEVICE_CASES: dict[str, tuple[str, ...]] = {
+    'get_installed_packages': ('system package print terse',),
+    '_get_channel': ('system package update print',),
+    'refresh_update_info': (
+        'system package update print',
+        'system package update check-for-updates',
+    ),
+    'refresh_firmware_info': ('system routerboard print',),
+}
+
+
+def _recording(outputs: dict[str, list[str]]) -> Recording:
+    return Recording([
+        {'type': 'exec', 'cmd': cmd, 'out': [f'{line}\r\n' for line in out]}
+        for cmd, out in outputs.items()
+    ])
+
+
+def _device(recording: Recording) -> Device:
+    d = Device(
+        conf=MagicMock(spec=Config),
+        name='bench',
+        address='127.0.0.1',
+        port=22,
+        username='bench',
+        update_type='online',
+        logger=MagicMock(spec=Logger),
+    )
+    d.client = ReplayClient(recording)  # type: ignore[assignment]
+    return d
+
+
+def _registrator(recording: Recording, key_file: str) -> UserRegistrator:
+    ur = UserRegistrator(
+        dev_name='bench',
+        dev_address='127.0.0.1',
+        dev_port=22,
+        username='user0499',
+        public_key_file=key_file,
+    )
+    ur.client = ReplayClient(recording)  # type: ignore[assignment]
+    return ur
+
+
+def synthetic_router(
+        packages: int = 40,
+        files: int = 2000,
+        users: int = 500,
+) -> SimulatedRouter:
+    """A simulated router with many packages, files and users."""
+    router = SimulatedRouter(
+        'bench',
+        extra_packages=[f'package{i:02d}' for i in range(packages - 1)],
+        host_key=paramiko.RSAKey.generate(1024),
+    )
+    for i in range(files):
+        router.files[f'flash/file{i:05d}.txt'] = b''
+    router.files['id_ed25519.pub'] = b''
+    router.users = {f'user{i:04d}': '' for i in range(users)}
+    return router
+
+
+def synthetic_cases(
+        router: SimulatedRouter,
+) -> dict[str, Callable[[], Any]]:
+    """Benchmark cases on the outputs of the simulated router."""
+    outputs = {
+        cmd: router.execute(cmd)[0]
+        for cmd in (
+            'system package print terse',
+            'system package update print',
+            'system package update check-for-updates',
+            'system routerboard print',
+            'file print terse',
+            'user print terse',
+        )
+    }
+    recording = _recording(outputs)
+    d = _device(recording)
+    ur = _registrator(recording, 'id_ed25519.pub')
+    packages = len(router.packages)
+    return {
+        f'get_installed_packages[{packages}]': d.get_installed_packages,
+        '_get_channel': d._get_channel,
+        'refresh_update_info': d.refresh_update_info,
+        'refresh_firmware_info': d.refresh_firmware_info,
+        'version_is_lower': functools.partial(
+            d.version_is_lower, '7.16beta3', '7.16.2',
+        ),
+        f'sort_versions[{len(VERSIONS)}]': functools.partial(
+            sorted, VERSIONS, key=RouterOSVersion.parse,
+        ),
+        f'check_key_file[{len(router.files)}]': ur.check_key_file,
+        f'user_exists[{len(router.users)}]': ur.user_exists,
+    }
+
+
+def recorded_cases(directory: str) -> dict[str, Callable[[], Any]]:
+    """Benchmark cases on the outputs recorded with mu --record."""
+    cases: dict[str, Callable[[], Any]] = {}
+    for path in sorted(pathlib.Path(directory).glob('*.jsonl.gz')):
+        recording = Recording.load(path)
+        device = path.name.removesuffix('.jsonl.gz')
+        d = _device(recording)
+        for method, commands in DEVICE_CASES.items():
+            if all(cmd in recording.exec for cmd in commands):
+                cases[f'recorded:{device}:{method}'] = getattr(d, method)
+    return cases
+
+
+def measure(
+        func: Callable[[], Any],
+        repeat: int = 5,
+        min_time: float = 0.2,
+) -> dict[str, float]:
+    """Best time per call (ns) and peak allocation of one call (bytes)."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    tracemalloc.start()
+    try:
+        func()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'ns_per_call': round(best * 1e9, 1),
+        'peak_bytes': peak - before,
+        'calls': number * repeat,
+    }
+
+
+def compare(
+        results: dict[str, dict[str, float]],
+        baseline: dict[str, dict[str, float]],
+        tolerance: float,
+) -> list[str]:
+    """
+    Return a message for every case which is slower than the baseline
+    by more than tolerance (fraction).
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result['ns_per_call'] / base['ns_per_call']
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f'{name}: {result["ns_per_call"]:.0f} ns/call, '
+                f'baseline {base["ns_per_call"]:.0f} ({ratio:.2f}x)',
+            )
+    return regressions
+
+
+def table_lines(
+        results: dict[str, dict[str, float]],
+        baseline: dict[str, dict[str, float]] | None = None,
+) -> list[str]:
+    width = max(len('case'), *(len(name) for name in results))
+    lines = [
+        f'{"case":<{width}} {"us/call":>10} {"peak KiB":>9} {"vs base":>8}',
+    ]
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        ratio = (
+            f'{result["ns_per_call"] / base["ns_per_call"]:.2f}x'
+            if base else ''
+        )
+        lines.append(
+            f'{name:<{width}} {result["ns_per_call"] / 1000:>10.2f} '
+            f'{result["peak_bytes"] / 1024:>9.1f} {ratio:>8}',
+        )
+    return lines
+
+
+def run(
+        recordings: str | None = None,
+        select: str | None = None,
+        repeat: int = 5,
+        min_time: float = 0.2,
+) -> dict[str, dict[str, float]]:
+    cases = synthetic_cases(synthetic_router())
+    if recordings:
+        cases.update(recorded_cases(recordings))
+    return {
+        name: measure(func, repeat=repeat, min_time=min_time)
+        for name, func in cases.items()
+        if not select or select in name
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='parsers_bench',
+        description='Microbenchmarks of the RouterOS output parsers.',
+    )
+    parser.add_argument(
+        '--recordings',
+        metavar='DIR',
+        help='also benchmark outputs recorded with mu --record DIR',
+    )
+    parser.add_argument('-k', dest='select', help='only cases containing')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--min-time', type=float, default=0.2,
+        help='approximate seconds per repetition',
+    )
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    results = run(args.recordings, args.select, args.repeat, args.min_time)
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(
+            pathlib.Path(args.baseline).read_text(),
+        )['results']
+    for line in table_lines(results, baseline):
+        print(line)
+    if args.output:
+        pathlib.Path(args.output).write_text(
+            json.dumps(
+                {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'results': results,
+                },
+                indent=2,
+            ),
+        )
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f'regression: {message}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,27 +1,65 @@
 import pathlib
+from collections.abc import Sequence
 
-import paramiko
+from mu.watchdog import TIMEOUTS
+
+# seconds to wait for a rebooted device when neither the configuration
+# nor the history (see mu.history) give a timeout
+REBOOT_TIMEOUT = 240
 
 
 class Config:
     def __init__(
             self,
             backup_dir: str = '',
-            private_key_file: str = '',
+            private_key_file: str | Sequence[str] = '',
+            use_ssh_agent: bool = False,
     ) -> None:
         self.username = ''
         self.public_key_file: str | None = None
         self.public_key_owner: str | None = None
         self.port: int | None = None
         self.log_dir: str = ''
+        self.log_fsync = 'never'
+        self.log_json = False
+        self.log_per_device = False
+        self.log_max_bytes = 0
+        self.log_rotate = 'none'
+        self.log_backup_count = 10
+        self.log_compress = True
         self.delete_backup_after_download = False
         self.update_firmware = False
         self.update_type = 'online'
         self.online_update_channel = 'stable'
-        self.reboot_timeout = 240
+        # the wait for a reboot, None to learn it from history.json
+        self.reboot_timeout: float | None = None
+        self.reboot_first_probe: float | None = None
+        self.reboot_poll_interval: float | None = None
+        self.adaptive_reboot = True
+        self.textfile: str | None = None
+        # seconds of the TCP prescan of all devices, 0 to skip it
+        self.prescan_timeout: float = 0
+        # ssh timeouts, see mu.watchdog
+        self.connect_timeout: float = TIMEOUTS['connect_timeout']
+        self.banner_timeout: float = TIMEOUTS['banner_timeout']
+        self.auth_timeout: float = TIMEOUTS['auth_timeout']
+        self.command_timeout: float = TIMEOUTS['command_timeout']
+        self.session_timeout: float = TIMEOUTS['session_timeout']
+        # rolling update, see mu.waves
+        self.waves: list[int | str] = []
+        self.site_concurrency = 0
+        self.max_failure_rate = 0.1
+        self.max_timeout_rate = 1.0
+        self.wave_pause = 0.0
         self.backup_dir = pathlib.Path(backup_dir)
+        # one or more key files, '' lets paramiko look for the keys
         self.private_key_file = private_key_file
-        if len(self.private_key_file) > 0:
-            self.key = paramiko.Ed25519Key.from_private_key_file(
-                self.private_key_file,
-            )
+        if isinstance(private_key_file, str):
+            key_files = [private_key_file] if private_key_file else []
+        else:
+            key_files = list(private_key_file)
+        self.use_ssh_agent = use_ssh_agent
+        # mu.keys imports paramiko, only needed once devices are loaded
+        from mu.keys import KeyProvider
+        # shared by all devices, the keys are loaded on first use
+        self.keys: KeyProvider = KeyProvider(key_files, use_ssh_agent)
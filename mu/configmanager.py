@@ -1,17 +1,35 @@
 from typing import List
+from typing import TYPE_CHECKING
 
 import yaml
 
 from mu.config import Config
-from mu.device import Device
+from mu.logger import FSYNC_POLICIES
 from mu.logger import Logger
+from mu.logger import ROTATE_INTERVALS
+from mu.topology import check_topology
+from mu.topology import upstream_names
+from mu.watchdog import TIMEOUTS
+
+if TYPE_CHECKING:
+    from mu.device import Device
+
+# seconds, allowed globally and per device
+REBOOT_OPTIONS = (
+    'reboot_timeout',
+    'reboot_first_probe',
+    'reboot_poll_interval',
+)
 
 
 class ConfigManager:
     def __init__(self, filename: str) -> None:
         self.filename = filename
+        self.config: Config | None = None
 
-    def load_config(self) -> tuple[List[Device], Logger]:
+    def load_config(self) -> tuple[List['Device'], Logger]:
+        # mu.device pulls in paramiko, keep it off the check_config_file path
+        from mu.device import Device
         devices: List[Device] = []
         with open(self.filename) as stream:
             try:
@@ -23,6 +41,7 @@ class ConfigManager:
         cfg = Config(
             backup_dir=gl['backup_dir'],
             private_key_file=gl['private_key_file'],
+            use_ssh_agent=gl.get('use_ssh_agent', False),
         )
         cfg.username = gl.get('username')
         cfg.public_key_file = gl.get('public_key_file')
@@ -30,10 +49,29 @@ class ConfigManager:
         cfg.port = gl.get('port')
         cfg.log_dir = gl.get('log_dir')
         cfg.reboot_timeout = gl.get('reboot_timeout')
+        cfg.reboot_first_probe = gl.get('reboot_first_probe')
+        cfg.reboot_poll_interval = gl.get('reboot_poll_interval')
+        cfg.adaptive_reboot = gl.get('adaptive_reboot', True)
         cfg.delete_backup_after_download = gl.get(
             'delete_backup_after_download',
         )
-        logger = Logger(cfg.log_dir)
+        cfg.log_fsync = gl.get('log_fsync', 'never')
+        cfg.log_json = gl.get('log_json', False)
+        cfg.log_per_device = gl.get('log_per_device', False)
+        cfg.log_max_bytes = gl.get('log_max_bytes', 0)
+        cfg.log_rotate = gl.get('log_rotate', 'none')
+        cfg.log_backup_count = gl.get('log_backup_count', 10)
+        cfg.log_compress = gl.get('log_compress', True)
+        logger = Logger(
+            cfg.log_dir,
+            fsync=cfg.log_fsync,
+            json_lines=cfg.log_json,
+            per_device=cfg.log_per_device,
+            max_bytes=cfg.log_max_bytes,
+            rotate=cfg.log_rotate,
+            backup_count=cfg.log_backup_count,
+            compress=cfg.log_compress,
+        )
         # renamed online_upgrade_channel to online_update_channel in 0.2.0
         if gl.get('online_upgrade_channel'):
             print(
@@ -49,6 +87,16 @@ class ConfigManager:
             cfg.online_update_channel = gl.get('online_update_channel')
         cfg.update_type = gl.get('update_type')
         cfg.update_firmware = gl.get('update_firmware', False)
+        cfg.textfile = gl.get('textfile')
+        cfg.waves = gl.get('waves') or []
+        cfg.site_concurrency = gl.get('site_concurrency', 0)
+        cfg.max_failure_rate = gl.get('max_failure_rate', 0.1)
+        cfg.max_timeout_rate = gl.get('max_timeout_rate', 1.0)
+        cfg.wave_pause = gl.get('wave_pause', 0)
+        cfg.prescan_timeout = gl.get('prescan_timeout', 0)
+        for option, seconds in TIMEOUTS.items():
+            setattr(cfg, option, gl.get(option, seconds))
+        self.config = cfg
 
         devs = data['devices']
         for dev in devs:
@@ -108,6 +156,29 @@ class ConfigManager:
             )
             new_device.online_update_channel = online_update_channel
             new_device.update_firmware = update_firmware
+            new_device.canary = bool(dev.get('canary', False))
+            new_device.site = str(dev.get('site', ''))
+            new_device.upstream = upstream_names(dev.get('upstream'))
+            # reboot wait from device, global or learned (see mu.history)
+            new_device.reboot_first_probe = dev.get(
+                'reboot_first_probe',
+                cfg.reboot_first_probe,
+            )
+            new_device.reboot_poll_interval = dev.get(
+                'reboot_poll_interval',
+                cfg.reboot_poll_interval,
+            )
+            new_device.reboot_timeout = dev.get(
+                'reboot_timeout',
+                cfg.reboot_timeout,
+            )
+            # ssh timeouts from device, global or default
+            for option in TIMEOUTS:
+                setattr(
+                    new_device,
+                    option,
+                    dev.get(option, getattr(cfg, option)),
+                )
             devices.append(new_device)
         return (devices, logger)
 
@@ -145,6 +216,63 @@ class ConfigManager:
                 print('Missing mandatory options:')
                 for mo in missing_options:
                     print(mo)
+            log_fsync = data['global'].get('log_fsync', 'never')
+            if log_fsync not in FSYNC_POLICIES:
+                print(
+                    f'Invalid log_fsync value {log_fsync}! ' +
+                    f'Use one of {", ".join(FSYNC_POLICIES)}.',
+                )
+                ok = False
+            log_rotate = data['global'].get('log_rotate', 'none')
+            if log_rotate not in ROTATE_INTERVALS:
+                print(
+                    f'Invalid log_rotate value {log_rotate}! ' +
+                    f'Use one of {", ".join(ROTATE_INTERVALS)}.',
+                )
+                ok = False
+            waves = data['global'].get('waves') or []
+            if not isinstance(waves, list):
+                print('waves is not a list!')
+                ok = False
+            elif waves:
+                # mu.waves is only needed by the runs
+                from mu.waves import wave_size
+                for size in waves:
+                    try:
+                        wave_size(size, 1)
+                    except (TypeError, ValueError):
+                        print(
+                            f'Invalid wave size {size}! Use a number of ' +
+                            'devices or a percentage like 5%.',
+                        )
+                        ok = False
+            for option in ('max_failure_rate', 'max_timeout_rate'):
+                rate = data['global'].get(option, 0)
+                if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+                    print(f'Invalid {option} {rate}! Use 0 to 1.')
+                    ok = False
+            for option in ('prescan_timeout', 'wave_pause'):
+                seconds = data['global'].get(option, 0)
+                if not isinstance(seconds, (int, float)) or seconds < 0:
+                    print(f'Invalid {option} {seconds}!')
+                    ok = False
+            site_concurrency = data['global'].get('site_concurrency', 0)
+            if not isinstance(site_concurrency, int) or site_concurrency < 0:
+                print(
+                    f'Invalid site_concurrency {site_concurrency}! ' +
+                    'Use a number of devices, 0 for no limit.',
+                )
+                ok = False
+            sections = [data['global']] + [
+                device for device in data['devices']
+                if isinstance(device, dict)
+            ]
+            for section in sections:
+                for option in REBOOT_OPTIONS + tuple(TIMEOUTS):
+                    seconds = section.get(option, 0)
+                    if not isinstance(seconds, (int, float)) or seconds < 0:
+                        print(f'Invalid {option} {seconds}!')
+                        ok = False
             # check missing mandatory device options
             missing_options = []
             if len(data['devices']) > 0:
@@ -163,6 +291,10 @@ class ConfigManager:
                             print('Missing mandatory device options:')
                             for mo in missing_options:
                                 print(mo)
+                if all(isinstance(device, dict) for device in data['devices']):
+                    for problem in check_topology(data['devices']):
+                        print(problem)
+                        ok = False
             else:
                 print('No devices specified!')
                 ok = False
@@ -1,18 +1,61 @@
+import contextlib
+import functools
 import os
-import re
 import time
+from collections.abc import Callable
+from collections.abc import Iterator
 from datetime import datetime
 from pathlib import Path
 from timeit import default_timer
+from typing import Any
+from typing import cast
+from typing import TypeVar
 
 import paramiko
 from scp import SCPClient  # type: ignore
 
 from mu.config import Config
+from mu.config import REBOOT_TIMEOUT
+from mu.journal import Journal
 from mu.logger import Logger
+from mu.metrics import CommandMetrics
+from mu.metrics import normalize_command
+from mu.metrics import output_failed
+from mu.profiler import Profiler
+from mu.routeros import parse_properties
+from mu.routeros import parse_terse
+from mu.routeros import RouterOSVersion
+from mu.trace import Tracer
 from mu.userregistrator import UserRegistrator
+from mu.watchdog import SessionTimeout
+from mu.watchdog import TIMEOUTS
 # paramiko.common.logging.basicConfig(level=paramiko.common.DEBUG)
 
+F = TypeVar('F', bound=Callable[..., Any])
+
+# default seconds between connection attempts while waiting for a reboot
+REBOOT_POLL_INTERVAL = 5
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator which records a Device method as a trace span."""
+    def decorator(method: F) -> F:
+        @functools.wraps(method)
+        def wrapper(self: 'Device', *args: Any, **kwargs: Any) -> Any:
+            with self.span(name, category='step'):
+                return method(self, *args, **kwargs)
+        return cast(F, wrapper)
+    return decorator
+
+
+def _ssh_timed_out(err: paramiko.SSHException) -> bool:
+    """
+    Whether paramiko gave up waiting for the ssh banner or for the
+    authentication, which it reports without a timeout exception.
+    """
+    message = str(err)
+    return 'banner' in message or 'timeout' in message
+
 
 class Device:
     """
@@ -40,13 +83,31 @@ class Device:
         self.username = username
         self.update_type = update_type
         self.logger = logger
+        self.update_available = False
+        self.update_downloaded = False
         self.packages = packages
         self.online_update_channel = 'stable'
+        # the channel configured on the device and its installed packages
+        # ("name version"), as last seen
+        self.channel = ''
+        self.installed_packages: list[str] = []
         self.update_firmware = False
+        # the update reboot flashed the firmware (auto-upgrade), and the
+        # auto-upgrade setting to restore afterwards, see firmware_update
+        self.firmware_flashed = False
+        self.auto_upgrade_restore: str | None = None
+        # rollout grouping, see mu.waves
+        self.canary = False
+        self.site = ''
+        # names of the devices this one is reached through, see mu.topology
+        self.upstream: list[str] = []
         self.client: paramiko.SSHClient | None = None
         self.identity = ''
         self.public_key_file: str | None = None
         self.public_key_owner: str | None = None
+        # whether ssh_test may ask on the terminal to register the user,
+        # off while several devices run in parallel
+        self.interactive = True
         self.installed_version = 'unknown'
         self.latest_version = 'unknown'
         self.version_info_str = f'installed: {self.installed_version}, ' +\
@@ -57,6 +118,42 @@ class Device:
             f'current firmware: {self.current_firmware}, '
             f'upgrade firmware: {self.upgrade_firmware}'
         )
+        self.model = 'unknown'
+        # phase name -> durations in seconds, see mu.timing.PHASES
+        self.timings: dict[str, list[float]] = {}
+        # shared per-command statistics, set by the caller
+        self.metrics: CommandMetrics | None = None
+        # phase name -> number of failures in this run
+        self.failures: dict[str, int] = {}
+        self.backup_size: int | None = None
+        self.last_success: float | None = None
+        # seconds the last run spent on the device, see mu.history
+        self.duration: float | None = None
+        # trace-event recorder, set by the caller
+        self.tracer: Tracer | None = None
+        # cProfile sections per phase, set by the caller
+        self.profiler: Profiler | None = None
+        # factories of the ssh client and of scp sessions over it (given
+        # the client and the socket timeout), replaced to record or
+        # replay sessions (see mu.replay)
+        self.client_factory: Callable[[], Any] | None = None
+        self.scp_factory: Callable[[Any, float], Any] | None = None
+        # the wait for a reboot: seconds until the first and between the
+        # following connection attempts, and the timeout (None for
+        # REBOOT_POLL_INTERVAL and REBOOT_TIMEOUT), see mu.history
+        self.reboot_first_probe: float | None = None
+        self.reboot_poll_interval: float | None = None
+        self.reboot_timeout: float | None = None
+        # journal of the completed steps, set by the caller
+        self.journal: Journal | None = None
+        # ssh timeouts in seconds, see mu.watchdog
+        self.connect_timeout: float = TIMEOUTS['connect_timeout']
+        self.banner_timeout: float = TIMEOUTS['banner_timeout']
+        self.auth_timeout: float = TIMEOUTS['auth_timeout']
+        self.command_timeout: float = TIMEOUTS['command_timeout']
+        self.session_timeout: float = TIMEOUTS['session_timeout']
+        # why the session was aborted, see abort
+        self.aborted: str | None = None
 
     def _ssh_check(self) -> None:
         if not self.client:
@@ -68,6 +165,7 @@ class Device:
             )
             raise SystemExit(1)
 
+    @traced('backup')
     def backup(self) -> bool:
         """
         Perform backup to a file, download it, and export the
@@ -78,8 +176,22 @@ class Device:
         export all succeed. Callers must check this before running
         an update.
         """
-        # create backup
         self._ssh_check()
+        if self.step_done('backup'):
+            # resumed run, the backup was downloaded before
+            backup = self.step_info('backup')
+            self.backup_file_full_name = backup.get('file', '')
+            if self.step_done('export'):
+                self.logger.log(
+                    'info',
+                    self.name,
+                    'backup and export done in run ' +
+                    f'{backup.get("attempt")}, skipping',
+                    stdout=True,
+                )
+                return True
+            return self.export_config()
+        # create backup
         now = datetime.now()
         timestamp = now.strftime('%Y%m%d-%H%M')
         backup_file_name = f'{self.identity}-{timestamp}'
@@ -89,8 +201,12 @@ class Device:
             self.name,
             f'running backup to file {self.backup_file_full_name}',
         )
-        output = self.ssh_call(f'system backup save name={backup_file_name}')
+        with self.phase('backup'):
+            output = self.ssh_call(
+                f'system backup save name={backup_file_name}',
+            )
         if 'Configuration backup saved\r' not in output:
+            self.record_failure('backup')
             self.logger.log(
                 'error',
                 self.name,
@@ -115,9 +231,19 @@ class Device:
         try:
             if not self.client:
                 raise
-            with SCPClient(self.client.get_transport()) as scp:
-                scp.get(self.backup_file_full_name, self.conf.backup_dir)
+            with self.phase('download'):
+                with self.span(
+                    'scp get',
+                    category='scp',
+                    file=self.backup_file_full_name,
+                ):
+                    with self._open_scp() as scp:
+                        scp.get(
+                            self.backup_file_full_name,
+                            self.conf.backup_dir,
+                        )
         except Exception as e:
+            self.record_failure('download')
             self.logger.log(
                 'error',
                 self.name,
@@ -131,6 +257,12 @@ class Device:
             f'backup downloaded to {self.conf.backup_dir}',
             stdout=True,
         )
+        try:
+            self.backup_size = (
+                self.conf.backup_dir / self.backup_file_full_name
+            ).stat().st_size
+        except OSError:
+            self.backup_size = None
         if self.conf.delete_backup_after_download:
             self.logger.log(
                 'info',
@@ -139,8 +271,14 @@ class Device:
                 stdout=True,
             )
             self._delete_file(self.backup_file_full_name)
+        self.mark_step(
+            'backup',
+            file=self.backup_file_full_name,
+            size=self.backup_size,
+        )
         return self.export_config()
 
+    @traced('export_config')
     def export_config(self) -> bool:
         """
         Run '/export show-sensitive' on the device and store the output
@@ -164,8 +302,10 @@ class Device:
             'running /export show-sensitive',
         )
         try:
-            lines = self.ssh_call('/export show-sensitive')
+            with self.phase('export'):
+                lines = self.ssh_call('/export show-sensitive')
         except Exception as e:
+            self.record_failure('export')
             self.logger.log(
                 'error',
                 self.name,
@@ -174,6 +314,7 @@ class Device:
             )
             return False
         if not lines:
+            self.record_failure('export')
             self.logger.log(
                 'error',
                 self.name,
@@ -195,6 +336,7 @@ class Device:
             finally:
                 os.close(fd)
         except Exception as e:
+            self.record_failure('export')
             self.logger.log(
                 'error',
                 self.name,
@@ -212,6 +354,7 @@ class Device:
             f'export saved to {export_path} ({len(lines)} lines)',
             stdout=True,
         )
+        self.mark_step('export', file=export_file_name)
         return True
 
     def exec_command(self, remote_cmd: str) -> None:
@@ -231,16 +374,13 @@ class Device:
         ['wireless 7.15beta9', 'routeros 7.15beta9']
         """
         self._ssh_check()
-        output = self.ssh_call('system package print')
-        if len(output) < 2:
-            return []
-        result = []
-        for line in output:
-            if len(line) > 1:
-                elements = line.split()
-                if elements[0] not in ('#', 'Columns:'):
-                    result.append(' '.join(elements[1:3]))
-        return result
+        output = self.ssh_call('system package print terse')
+        self.installed_packages = [
+            f'{p["name"]} {p["version"]}'
+            for p in parse_terse(output, keys=('name', 'version'))
+            if 'name' in p and 'version' in p
+        ]
+        return list(self.installed_packages)
 
     def get_update_available(self) -> bool:
         """
@@ -257,16 +397,15 @@ class Device:
         current_firmware, and upgrade_firmware properties.
         """
         self._ssh_check()
-        output = self.ssh_call('system routerboard print')
-        for line in output:
-            if 'current-firmware' in line:
-                parts = line.split(':', 1)
-                if len(parts) == 2:
-                    self.current_firmware = parts[1].strip()
-            elif 'upgrade-firmware' in line:
-                parts = line.split(':', 1)
-                if len(parts) == 2:
-                    self.upgrade_firmware = parts[1].strip()
+        info = parse_properties(self.ssh_call('system routerboard print'))
+        self.current_firmware = info.get(
+            'current-firmware',
+            self.current_firmware,
+        )
+        self.upgrade_firmware = info.get(
+            'upgrade-firmware',
+            self.upgrade_firmware,
+        )
         self.firmware_info_str = (
             f'current firmware: {self.current_firmware}, '
             f'upgrade firmware: {self.upgrade_firmware}'
@@ -278,13 +417,21 @@ class Device:
         self.refresh_firmware_info()
         return self.current_firmware != self.upgrade_firmware
 
+    @traced('firmware_update')
     def firmware_update(self) -> bool:
         """
         Check if a routerboard firmware upgrade is available and perform it.
         Reboots the device and reconnects if an upgrade is applied.
-        Returns True on success or when already up to date.
+        Returns True on success or when already up to date. \n
+        When the RouterOS update rebooted the device with auto-upgrade
+        enabled (see self._reboot_and_verify()), the firmware was already
+        flashed during that boot: the "system routerboard upgrade" step
+        is skipped and the device is rebooted right away.
         """
         self._ssh_check()
+        flashed = self.firmware_flashed
+        self.firmware_flashed = False
+        self._restore_auto_upgrade()
         self.refresh_firmware_info()
         if self.current_firmware == self.upgrade_firmware:
             self.logger.log(
@@ -301,12 +448,24 @@ class Device:
             f'{self.current_firmware} -> {self.upgrade_firmware}',
             stdout=True,
         )
-        self._routerboard_upgrade()
-        if not self.reboot_and_wait():
+        if flashed:
+            self.logger.log(
+                'info',
+                self.name,
+                'firmware flashed during the update reboot, rebooting',
+                stdout=True,
+            )
+        else:
+            with self.phase('firmware'):
+                self._routerboard_upgrade()
+        if not self.reboot_and_wait(reason='firmware'):
+            self.record_failure('firmware')
             return False
         try:
-            self.ssh_connect()
+            with self.phase('reconnect'):
+                self.ssh_connect()
         except Exception:
+            self.record_failure('reconnect')
             self.logger.log(
                 'error',
                 self.name,
@@ -316,6 +475,7 @@ class Device:
             return False
         self.refresh_firmware_info()
         if self.current_firmware != self.upgrade_firmware:
+            self.record_failure('firmware')
             self.logger.log(
                 'error',
                 self.name,
@@ -333,53 +493,85 @@ class Device:
         )
         return True
 
-    def reboot_and_wait(self, downgrade=False) -> bool:
+    @traced('reboot_and_wait')
+    def reboot_and_wait(self, downgrade=False, reason='update') -> bool:
         """
         Runs self._downgrade() or self._reboot() depending on the value
         of the "downgrade" parameter. \n
+        reason ("update" or "firmware") labels the log lines of the
+        reboot, so both reboots of an update show up with their
+        durations. \n
         Then attempts to connect to the device
-        using the self.simple_ssh_test() method until the
-        self.conf.reboot_timeout runs out.
+        using the self.simple_ssh_test() method, first after
+        self.reboot_first_probe seconds, then every
+        self.reboot_poll_interval seconds until self.reboot_timeout
+        (else self.conf.reboot_timeout, else REBOOT_TIMEOUT) runs out.
         """
+        interval = self.reboot_poll_interval
+        if interval is None:
+            interval = REBOOT_POLL_INTERVAL
+        delay = self.reboot_first_probe
+        if delay is None:
+            delay = interval
+        timeout = self.reboot_timeout
+        if timeout is None:
+            timeout = self.conf.reboot_timeout
+        if timeout is None:
+            timeout = REBOOT_TIMEOUT
         if downgrade:
             self.logger.log(
                         'info',
                         self.name,
                         'rebooting (downgrade)',
                         stdout=True,
+                        reboot=reason,
             )
         else:
             self.logger.log(
                         'info',
                         self.name,
-                        'rebooting',
+                        f'rebooting ({reason})',
                         stdout=True,
+                        reboot=reason,
             )
-        if downgrade:
-            self._downgrade()
-        else:
-            self._reboot()
-        timer_start = round(default_timer())
-        while True:
-            timer_current = round(default_timer())
-            timer_elapsed = timer_current - timer_start
-            remaining = self.conf.reboot_timeout - timer_elapsed
-            if remaining <= 0:
-                self.logger.log(
-                    'warning',
-                    self.name,
-                    'timed out waiting for device after reboot',
-                    stdout=True,
+        start = time.monotonic()
+        with self.phase('reboot-wait'):
+            if downgrade:
+                self._downgrade()
+            else:
+                self._reboot()
+            timer_start = round(default_timer())
+            while True:
+                timer_current = round(default_timer())
+                timer_elapsed = timer_current - timer_start
+                remaining = round(timeout - timer_elapsed)
+                if remaining <= 0:
+                    self.record_failure('reboot-wait')
+                    self.logger.log(
+                        'warning',
+                        self.name,
+                        'timed out waiting for device after reboot',
+                        stdout=True,
+                    )
+                    return False
+                print(
+                    'waiting for connection. remaining ' +
+                    f'{remaining} seconds...',
                 )
-                return False
-            print(
-                'waiting for connection. remaining ' +
-                f'{remaining} seconds...',
-            )
-            time.sleep(5)
-            if self.simple_ssh_test():
-                break
+                time.sleep(delay)
+                self._check_aborted()
+                delay = interval
+                if self.simple_ssh_test():
+                    break
         print('connection works again')
+        seconds = time.monotonic() - start
+        self.logger.log(
+            'info',
+            self.name,
+            f'{reason} reboot took {seconds:.1f}s',
+            reboot=reason,
+            duration=round(seconds, 3),
+        )
         return True
 
     def refresh_update_info(self) -> None:
@@ -399,82 +591,197 @@ class Device:
         # set desired channel
         set_back_channel = False
         original_channel = self._get_channel()
+        self.channel = original_channel
         if original_channel != self.online_update_channel:
             self._set_channel(self.online_update_channel)
             set_back_channel = True
-        output = self.ssh_call('system package update check-for-updates')
-        for line in output:
-            if 'installed-version' in line:
-                self.installed_version = line.split()[1]
-                self.version_info_str = \
-                    f'installed: {self.installed_version}, ' +\
-                    f'available: {self.latest_version}'
-            if 'latest-version' in line:
-                self.latest_version = line.split()[1]
-                self.version_info_str = \
-                    f'installed: {self.installed_version}, ' +\
-                    f'available: {self.latest_version}'
-            if 'status:' in line:
-                if 'New version is available' in line:
-                    self.update_available = True
-                    if set_back_channel:
-                        self._set_channel(original_channel)
-                    return
-                if 'Downloaded, please reboot' in line:
-                    self.logger.log(
-                        'warning',
-                        self.name,
-                        'update already downloaded. reboot manually',
-                        stdout=True,
-                    )
-        self.update_available = False
+        with self.phase('check'):
+            output = self.ssh_call('system package update check-for-updates')
+        info = parse_properties(output)
+        self.installed_version = info.get(
+            'installed-version',
+            self.installed_version,
+        )
+        self.latest_version = info.get('latest-version', self.latest_version)
+        self.version_info_str = \
+            f'installed: {self.installed_version}, ' +\
+            f'available: {self.latest_version}'
+        status = info.get('status', '')
+        self.update_available = 'New version is available' in status
+        self.update_downloaded = 'Downloaded, please reboot' in status
+        # a resumed run reboots the device itself, see _online_update
+        if self.update_downloaded and not self.step_done('downloaded'):
+            self.logger.log(
+                'warning',
+                self.name,
+                'update already downloaded. reboot manually',
+                stdout=True,
+            )
         if set_back_channel:
             self._set_channel(original_channel)
 
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Context manager which measures the monotonic duration of the
+        enclosed block, stores it to self.timings[name] and logs it.
+        An exception leaving the block counts as a failure of the phase.
+        """
+        start = time.monotonic()
+        profile: contextlib.AbstractContextManager[None]
+        if self.profiler:
+            profile = self.profiler.section(self.name, name)
+        else:
+            profile = contextlib.nullcontext()
+        try:
+            with self.span(name), profile:
+                yield
+        except BaseException:
+            self.record_failure(name)
+            raise
+        finally:
+            duration = time.monotonic() - start
+            self.timings.setdefault(name, []).append(duration)
+            self.logger.log(
+                'info',
+                self.name,
+                f'phase {name} took {duration:.2f}s',
+                phase=name,
+                duration=round(duration, 3),
+            )
+
+    def step_done(self, step: str) -> bool:
+        """Whether the journal records step as done for this device."""
+        return bool(self.journal and self.journal.done(self.name, step))
+
+    def step_info(self, step: str) -> dict[str, Any]:
+        """The fields recorded in the journal with a done step."""
+        if not self.journal:
+            return {}
+        return self.journal.get(self.name, step)
+
+    def mark_step(self, step: str, **fields: Any) -> None:
+        """Record a completed step in the journal, see mu.journal.STEPS."""
+        if self.journal:
+            self.journal.mark(self.name, step, **fields)
+
+    def update_pending(self) -> bool:
+        """
+        Whether an interrupted run downloaded the update or rebooted the
+        device but didn't verify the update yet. The device then reports
+        no update available, the update must be continued anyway.
+        """
+        return (
+            self.step_done('downloaded') and not self.step_done('verified')
+        )
+
+    def record_failure(self, phase: str) -> None:
+        """Count a failure of the given phase in self.failures."""
+        self.failures[phase] = self.failures.get(phase, 0) + 1
+        if self.tracer:
+            self.tracer.instant(self.name, f'{phase} failed')
+
+    def span(
+            self,
+            name: str,
+            category: str = 'phase',
+            **args: Any,
+    ) -> contextlib.AbstractContextManager[dict[str, Any]]:
+        """
+        Trace span on this device's track, or a no-op when
+        no tracer is set.
+        """
+        if self.tracer:
+            return self.tracer.span(self.name, name, category, **args)
+        return contextlib.nullcontext(args)
+
+    def _connect_kwargs(self) -> dict[str, Any]:
+        """
+        The arguments of SSHClient.connect. The keys come from the
+        KeyProvider shared by all devices, without it paramiko looks
+        for the keys itself.
+        """
+        kwargs: dict[str, Any] = {
+            'hostname': self.address,
+            'port': self.port,
+            'username': self.username,
+            'timeout': self.connect_timeout,
+            'banner_timeout': self.banner_timeout,
+            'auth_timeout': self.auth_timeout,
+            'channel_timeout': self.command_timeout,
+        }
+        if self.conf.keys and self.conf.keys.enabled:
+            kwargs['auth_strategy'] = self.conf.keys.auth_strategy(
+                self.username,
+            )
+        else:
+            kwargs['look_for_keys'] = True
+        return kwargs
+
     def simple_ssh_test(self) -> bool:
         """
         Tries to connect to the device using ssh.
         Returns True only if successful.
         """
-        ssh = paramiko.SSHClient()
+        ssh = self._new_client()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
-            if self.conf.key:
-                ssh.connect(
-                    hostname=self.address,
-                    port=self.port,
-                    username=self.username,
-                    pkey=self.conf.key,
-                    look_for_keys=False,
-                )
-            else:
-                ssh.connect(
-                    hostname=self.address,
-                    port=self.port,
-                    username=self.username,
-                    look_for_keys=True,
-                )
+            ssh.connect(**self._connect_kwargs())
         except Exception:
             return False
+        ssh.close()
         return True
 
     def ssh_call(self, remote_cmd: str) -> list:
         """
         Executes a command on the device using ssh - self.client.
-        Returns the output as a list of lines (strings).
+        Returns the output as a list of lines (strings). \n
+        Raises SessionTimeout when the command stays silent for
+        self.command_timeout seconds or the session was aborted.
         """
         self._ssh_check()
+        self._check_aborted()
         output = []
+        nbytes = 0
+        ok = False
+        start = time.monotonic()
         try:
             if not self.client:
                 raise
-            stdin, stdout, stderr = self.client.exec_command(remote_cmd)
-            for line in stdout.readlines():
-                output.append(line.strip('\n'))
+            with self.span(normalize_command(remote_cmd), 'ssh') as span:
+                stdin, stdout, stderr = self.client.exec_command(
+                    remote_cmd,
+                    timeout=self.command_timeout,
+                )
+                for line in stdout.readlines():
+                    nbytes += len(line)
+                    output.append(line.strip('\n'))
+                # the output ends early when the session is aborted
+                self._check_aborted()
+                ok = not output_failed(output)
+                span.update(lines=len(output), bytes=nbytes, ok=ok)
             return output
+        except SessionTimeout:
+            raise
+        except TimeoutError as e:
+            raise SessionTimeout(
+                f'no output of "{remote_cmd}" for ' +
+                f'{self.command_timeout:g}s',
+            ) from e
         except Exception as e:
+            self._check_aborted()
             print(e)
             raise
+        finally:
+            if self.metrics:
+                self.metrics.record(
+                    remote_cmd,
+                    self.model,
+                    time.monotonic() - start,
+                    nbytes,
+                    len(output),
+                    ok,
+                )
 
     def ssh_close(self) -> None:
         """Close the ssh connection."""
@@ -487,63 +794,68 @@ class Device:
         Open a ssh connection to the device using paramiko SSHClient.
         The connection is kept alive and available as "self.client".
         """
-        self.client = paramiko.SSHClient()
+        self._check_aborted()
+        self.client = self._new_client()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
-            if self.conf.key:
-                self.client.connect(
-                    hostname=self.address,
-                    port=self.port,
-                    username=self.username,
-                    pkey=self.conf.key,
-                    look_for_keys=False,
-                )
-            else:
-                self.client.connect(
-                    hostname=self.address,
-                    port=self.port,
-                    username=self.username,
-                    look_for_keys=True,
-                )
-            self.identity = self._get_identity()
-        except paramiko.AuthenticationException as err:
-            print(f'SSH err on {self.name}: {err}')
+            with self.phase('connect'):
+                self.client.connect(**self._connect_kwargs())
+            # first, so only this command is labelled with an unknown
+            # model in the metrics
+            if self.model == 'unknown':
+                self.model = self._get_model()
+            with self.phase('identity'):
+                self.identity = self._get_identity()
+        except paramiko.SSHException as err:
+            if _ssh_timed_out(err):
+                raise SessionTimeout(f'{err}') from err
+            if isinstance(err, paramiko.AuthenticationException):
+                print(f'SSH err on {self.name}: {err}')
             raise
 
+    def abort(self, reason: str) -> None:
+        """
+        Stop the session from another thread (see mu.watchdog): close
+        the ssh connection, so blocked reads return, and make the
+        following ssh calls, connections and reboot waits raise
+        SessionTimeout.
+        """
+        self.aborted = reason
+        client = self.client
+        if client:
+            client.close()
+
+    def _check_aborted(self) -> None:
+        if self.aborted:
+            raise SessionTimeout(self.aborted)
+
     def ssh_test(self) -> bool:
         """
         A comprehensive SSH test which should be run before any other
         connection attempts. Intended to verify the configuration
-        and connectivity. Returns True only when successful.
+        and connectivity. Returns True only when successful. \n
+        When the authentication fails, it offers to register the user
+        on the device, unless self.interactive is False.
         """
-        ssh = paramiko.SSHClient()
+        ssh = self._new_client()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
         try:
-            if self.conf.key:
-                ssh.connect(
-                    hostname=self.address,
-                    port=self.port,
-                    username=self.username,
-                    pkey=self.conf.key,
-                    look_for_keys=False,
-                )
-            else:
-                ssh.connect(
-                    hostname=self.address,
-                    port=self.port,
-                    username=self.username,
-                    look_for_keys=True,
-                )
+            ssh.connect(**self._connect_kwargs())
         except (
             paramiko.AuthenticationException,
         ) as err:
             print(f'ssh err on {self.name}: {err}')
+            if _ssh_timed_out(err):
+                return False
             print('-' * 20)
             print(
                 f'The user {self.username} might not exist ' +
                 f'or ssh key is missing on {self.name}.',
             )
+            if not self.interactive:
+                print(f'Run mu -j 1 -d {self.name} to fix this.')
+                return False
             print('Should the script log in and try to fix this? (yY/nN)')
             public_key_file: str | None
             if self.public_key_file:
@@ -573,6 +885,9 @@ class Device:
                     break
 
             raise SystemExit(1)
+        except paramiko.SSHException as err:
+            print(f'ssh err on {self.name}: {err}')
+            return False
         except OSError as e:
             print(f'{e}')
             return False
@@ -580,9 +895,23 @@ class Device:
             ssh.close()
             return True
 
+    @traced('update')
     def update(self) -> None:
-        """Wrapper method to trigger both online and manual updates."""
+        """
+        Wrapper method to trigger both online and manual updates.
+        Does nothing when the journal of a resumed run has the update
+        of this device verified.
+        """
         self._ssh_check()
+        if self.step_done('verified'):
+            self.logger.log(
+                'info',
+                self.name,
+                'update verified in run ' +
+                f'{self.step_info("verified").get("attempt")}, skipping',
+                stdout=True,
+            )
+            return
 
         # online update from Internet and reboot
         if self.update_type == 'online':
@@ -592,25 +921,11 @@ class Device:
                 msg='online update',
                 stdout=True,
             )
-            # check channel
-            if self._get_channel() != self.online_update_channel:
-                print(
-                    'setting desired online update channel' +
-                    f' {self.online_update_channel}',
-                )
-                self.logger.log(
-                    'info',
-                    self.name,
-                    'setting desired online update channel' +
-                    f' {self.online_update_channel}',
-                    stdout=True,
-                )
-                # set channel
-                self._set_channel(self.online_update_channel)
-                time.sleep(1)
+            self._ensure_channel()
             # check update
             self.refresh_update_info()
-            self._online_update()
+            with self.phase('update'):
+                self._online_update()
 
         # Manual update - will upload packages to device and reboot it
         if self.update_type == 'manual':
@@ -627,63 +942,133 @@ class Device:
                 msg=f'installed packages {installed}',
                 stdout=True,
             )
-            self._manual_update()
+            with self.phase('update'):
+                if self.step_done('rebooted'):
+                    # the packages were installed by an interrupted run
+                    self._verify_update()
+                else:
+                    self._manual_update()
+
+    @traced('stage')
+    def stage(self) -> dict[str, Any] | None:
+        """
+        Prepare the update without rebooting: download the online update
+        (or find it downloaded already), or upload the packages of a
+        manual update. Returns what was staged for self.activate(), None
+        when there is nothing to stage or staging failed.
+        """
+        self._ssh_check()
+        if self.update_type == 'manual':
+            with self.phase('update'):
+                downgrade = self._upload_packages()
+            if downgrade is None:
+                return None
+            return {
+                'type': 'manual',
+                'packages': [
+                    Path(str(package)).name for package in self.packages
+                ],
+                'downgrade': downgrade,
+            }
+        self._ensure_channel()
+        self.refresh_update_info()
+        if not self.update_downloaded:
+            if not self.update_available:
+                self.logger.log(
+                    'info',
+                    self.name,
+                    'update not available',
+                    stdout=True,
+                )
+                return None
+            self.logger.log(
+                'info',
+                self.name,
+                f'downloading update {self.latest_version}',
+                stdout=True,
+            )
+            with self.phase('package-download'):
+                downloaded = self._download_update()
+            if not downloaded:
+                self.record_failure('package-download')
+                self.logger.log(
+                    'error',
+                    self.name,
+                    'download not successful',
+                    stdout=True,
+                )
+                return None
+        return {'type': 'online', 'version': self.latest_version}
+
+    @traced('activate')
+    def activate(self, staged: dict[str, Any]) -> bool:
+        """
+        Check that the update staged by self.stage() is still on the
+        device, then reboot into it and verify the installed version.
+        Returns False when the staged update is gone or didn't install.
+        """
+        self._ssh_check()
+        if staged.get('type') == 'manual':
+            files = self._get_files()
+            missing = [p for p in staged['packages'] if p not in files]
+            if missing:
+                return self._not_staged(f'packages {missing} not on device')
+            with self.phase('update'):
+                self._reboot_and_verify(downgrade=staged['downgrade'])
+            return not self.failures
+        self.refresh_update_info()
+        version = staged.get('version')
+        if not self.update_downloaded or self.latest_version != version:
+            return self._not_staged(
+                f'update {version} not downloaded ' +
+                f'({self.version_info_str})',
+            )
+        self.mark_step('downloaded', version=version)
+        with self.phase('update'):
+            self._reboot_and_verify()
+        if self.failures:
+            return False
+        if self.installed_version != version:
+            self.record_failure('update')
+            self.logger.log(
+                'error',
+                self.name,
+                f'update {version} not installed, {self.version_info_str}',
+                stdout=True,
+            )
+            return False
+        return True
+
+    def _not_staged(self, reason: str) -> bool:
+        self.record_failure('update')
+        self.logger.log(
+            'error',
+            self.name,
+            f'staged update not found: {reason}. Run mu stage again.',
+            stdout=True,
+        )
+        return False
+
+    def version_fields(self) -> dict[str, str]:
+        """
+        Version information as structured log fields
+        for the JSON lines log output.
+        """
+        return {
+            'installed_version': self.installed_version,
+            'latest_version': self.latest_version,
+            'current_firmware': self.current_firmware,
+            'upgrade_firmware': self.upgrade_firmware,
+        }
 
     def version_is_lower(self, ver_a: str, ver_b: str) -> bool:
         """
         A helper method which takes two RouterOS version strings, parses them
         and checks if the first version is lower than the second version. \n
         Testing versions are compared as follows: \n
-        "alpha" < "beta" < %number%
+        "alpha" < "beta" < "rc" < %number%
         """
-        a_split = ver_a.split('.')
-        b_split = ver_b.split('.')
-        assert a_split[0].isnumeric()
-        assert b_split[0].isnumeric()
-        if a_split[0] < b_split[0]:
-            return True
-        elif a_split[0] > b_split[0]:
-            return False
-        if any(char.isalpha() for char in a_split[1]):
-            a_subversions = re.findall(r'\d+', a_split[1])
-            if 'alpha' in a_split[1]:
-                extra = '-2'
-            elif 'beta' in a_split[1]:
-                extra = '-1'
-            else:
-                extra = '0'
-            a_subversions.insert(1, extra)
-        else:
-            a_subversions = a_split[1:]
-            if len(a_subversions) == 1:
-                a_subversions.append('0')
-        if any(char.isalpha() for char in b_split[1]):
-            b_subversions = re.findall(r'\d+', b_split[1])
-            if 'alpha' in b_split[1]:
-                extra = '-2'
-            elif 'beta' in b_split[1]:
-                extra = '-1'
-            else:
-                extra = '0'
-            b_subversions.insert(1, extra)
-        else:
-            b_subversions = b_split[1:]
-            if len(b_subversions) == 1:
-                b_subversions.append('0')
-        if a_subversions[0] < b_subversions[0]:
-            return True
-        elif a_subversions[0] > b_subversions[0]:
-            return False
-        if a_subversions[1] < b_subversions[1]:
-            return True
-        elif a_subversions[1] > b_subversions[1]:
-            return False
-        if len(a_subversions) > 2 and len(b_subversions) > 2:
-            if a_subversions[2] < b_subversions[2]:
-                return True
-            elif a_subversions[2] > b_subversions[2]:
-                return False
-        return False
+        return RouterOSVersion.parse(ver_a) < RouterOSVersion.parse(ver_b)
 
     def _delete_file(self, filename: str) -> None:
         """Delete file on the device using ssh_call."""
@@ -706,17 +1091,33 @@ class Device:
         """
         self._ssh_check()
         output = self.ssh_call('system package update download')
-        for line in output:
-            if 'status:' in line:
-                if 'Downloaded, please reboot' in line:
-                    return True
-        return False
+        status = parse_properties(output).get('status', '')
+        return 'Downloaded, please reboot' in status
+
+    def _new_client(self) -> paramiko.SSHClient:
+        """Create a new, not yet connected, ssh client."""
+        if self.client_factory:
+            return self.client_factory()
+        return paramiko.SSHClient()
+
+    def _open_scp(self) -> Any:
+        """Open a scp session over the connected ssh client."""
+        assert self.client
+        if self.scp_factory:
+            return self.scp_factory(self.client, self.command_timeout)
+        return SCPClient(
+            self.client.get_transport(),
+            socket_timeout=self.command_timeout,
+        )
 
     def _online_update(self) -> None:
         """
         Perform online update or prints 'update not available'.\n
         First downloads the package using self._download_update().
-        Then reboots using self.reboot_and_wait().
+        Then reboots using self.reboot_and_wait(). \n
+        A resumed run reboots a device whose update was downloaded
+        by the interrupted run, and only verifies a device which
+        was rebooted already.
         """
         if self.update_available:
             self.logger.log(
@@ -724,6 +1125,7 @@ class Device:
                 self.name,
                 self.version_info_str,
                 stdout=True,
+                **self.version_fields(),
             )
             self.logger.log(
                 'info',
@@ -731,30 +1133,42 @@ class Device:
                 'downloading update',
                 stdout=True,
             )
-            if self._download_update():
+            with self.phase('package-download'):
+                downloaded = self._download_update()
+            if downloaded:
                 self.logger.log(
                     'info',
                     self.name,
                     'download successful',
                     stdout=True,
                 )
-                if not self.reboot_and_wait():
-                    return
-                self.ssh_connect()
-                self.refresh_update_info()
-                self.logger.log(
-                    'info',
-                    self.name,
-                    self.version_info_str,
-                    stdout=True,
-                )
+                self.mark_step('downloaded', version=self.latest_version)
+                self._reboot_and_verify()
             else:
+                self.record_failure('package-download')
                 self.logger.log(
                     'error',
                     self.name,
                     'download not successful',
                     stdout=True,
                 )
+        elif self.update_downloaded and self.step_done('downloaded'):
+            self.logger.log(
+                'info',
+                self.name,
+                'update downloaded in run ' +
+                f'{self.step_info("downloaded").get("attempt")}, rebooting',
+                stdout=True,
+            )
+            self._reboot_and_verify()
+        elif self.update_pending():
+            self.logger.log(
+                'info',
+                self.name,
+                'update installed in an interrupted run, verifying',
+                stdout=True,
+            )
+            self._verify_update()
         else:
             self.logger.log(
                 'info',
@@ -763,56 +1177,186 @@ class Device:
                 stdout=True,
             )
 
+    def _reboot_and_verify(self, downgrade: bool = False) -> None:
+        """
+        Reboot into the update, reconnect and check the versions. \n
+        With update_firmware, auto-upgrade is enabled for this reboot,
+        so the device flashes the firmware of the new RouterOS while it
+        boots and firmware_update() only has to reboot once more. The
+        setting is restored as soon as the device is connected again,
+        whether the verification works or not.
+        """
+        if self.update_firmware:
+            self._enable_auto_upgrade()
+        reconnected = False
+        try:
+            if not self.reboot_and_wait(downgrade=downgrade):
+                self.firmware_flashed = False
+                return
+            self.mark_step('rebooted')
+            with self.phase('reconnect'):
+                self.ssh_connect()
+            reconnected = True
+            self._verify_update()
+        finally:
+            if self.auto_upgrade_restore is not None:
+                self._restore_auto_upgrade_after_reboot(reconnected)
+
+    def _restore_auto_upgrade_after_reboot(self, reconnected: bool) -> None:
+        """
+        Restore auto-upgrade after the update reboot, or warn that it
+        is left on when the device can't be reached.
+        """
+        setting = self.auto_upgrade_restore
+        if reconnected:
+            try:
+                self._restore_auto_upgrade()
+                return
+            except Exception:
+                pass
+        # nothing later can restore it on a device which is gone
+        self.auto_upgrade_restore = None
+        self.logger.log(
+            'warning',
+            self.name,
+            f'auto-upgrade left on, set it back to {setting} ' +
+            '(system routerboard settings set auto-upgrade=...)',
+            stdout=True,
+        )
+
+    def _verify_update(self) -> None:
+        """Refresh and log the versions after the update reboot."""
+        self.refresh_update_info()
+        self.logger.log(
+            'info',
+            self.name,
+            self.version_info_str,
+            stdout=True,
+            **self.version_fields(),
+        )
+        self.mark_step('verified', version=self.installed_version)
+
     def _get_identity(self) -> str:
         """Get the device identity using ssh_call."""
         self._ssh_check()
         output = self.ssh_call('system identity print')
-        return output[0].split()[1]
+        return parse_properties(output)['name']
+
+    def _get_model(self) -> str:
+        """
+        Get the hardware model (board-name) using ssh_call, the only
+        source of self.model. Labels the per-command metrics and groups
+        the devices of a model in the history.
+        """
+        self._ssh_check()
+        output = self.ssh_call('system resource print')
+        return parse_properties(output).get('board-name', 'unknown')
 
     def _get_channel(self) -> str:
         """Get the active channel from the device using ssh_call."""
         self._ssh_check()
         output = self.ssh_call('system package update print')
-        for line in output:
-            if 'channel' in line:
-                return line.split()[1]
-        return ''
+        return parse_properties(output).get('channel', '')
+
+    def _ensure_channel(self) -> None:
+        """Switch to self.online_update_channel if another one is set."""
+        if self._get_channel() != self.online_update_channel:
+            print(
+                'setting desired online update channel' +
+                f' {self.online_update_channel}',
+            )
+            self.logger.log(
+                'info',
+                self.name,
+                'setting desired online update channel' +
+                f' {self.online_update_channel}',
+                stdout=True,
+            )
+            # set channel
+            self._set_channel(self.online_update_channel)
+            time.sleep(1)
+
+    def _enable_auto_upgrade(self) -> None:
+        """
+        Turn on the routerboard auto-upgrade setting, remembering its
+        value for self._restore_auto_upgrade(). Devices without the
+        setting (CHR, x86) are left alone.
+        """
+        output = self.ssh_call('system routerboard settings print')
+        setting = parse_properties(output).get('auto-upgrade')
+        if setting is None:
+            return
+        if setting != 'yes':
+            self.ssh_call('system routerboard settings set auto-upgrade=yes')
+            if self.auto_upgrade_restore is None:
+                self.auto_upgrade_restore = setting
+        self.firmware_flashed = True
+
+    def _restore_auto_upgrade(self) -> None:
+        """Set auto-upgrade back after self._enable_auto_upgrade()."""
+        if self.auto_upgrade_restore is None:
+            return
+        self.ssh_call(
+            'system routerboard settings set ' +
+            f'auto-upgrade={self.auto_upgrade_restore}',
+        )
+        self.auto_upgrade_restore = None
+
+    def _get_files(self) -> list[str]:
+        """The names of the files on the device using ssh_call."""
+        self._ssh_check()
+        output = self.ssh_call('file print terse')
+        return [
+            f['name'] for f in parse_terse(output, keys=('name',))
+            if 'name' in f
+        ]
 
     def _manual_update(self) -> None:
         """Perform manual update using packages from the local system."""
+        downgrade = self._upload_packages()
+        if downgrade is not None:
+            self._reboot_and_verify(downgrade=downgrade)
+
+    def _upload_packages(self) -> bool | None:
+        """
+        Upload self.packages to the device. Returns whether the device
+        has to be downgraded to install them, None when a package is
+        missing locally or failed to upload.
+        """
         if len(self.packages) == 0:
+            self.record_failure('update')
             self.logger.log(
                 'error',
                 self.name,
                 'manual update selected but no packages provided',
                 stdout=True,
             )
-            return
+            return None
         do_downgrade = False
         for package in self.packages:
             assert isinstance(package, str)
             package_path = Path(package)
             if not package_path.is_file():
+                self.record_failure('update')
                 self.logger.log(
                     'error',
                     self.name,
                     f'{package_path} does not exist',
                     stdout=True,
                 )
-                return
+                return None
             # check if the installed package is newer
             # than the desired package
             # if yes, the /system package downgrade needs to be
             # executed instead of the /system reboot
             package_version = package_path.name.split('-')[1]
+            package_version = package_version.removesuffix('.npk')
             package_name = package_path.name.split('-')[0]
             if not do_downgrade:
                 for p in self.get_installed_packages():
                     if p.split()[0] == package_name:
-                        if self.version_is_lower(
-                            package_version,
-                            p.split()[1],
-                        ):
+                        if RouterOSVersion.parse(package_version) < \
+                                RouterOSVersion.parse(p.split()[1]):
                             do_downgrade = True
             self.logger.log(
                 'info',
@@ -821,24 +1365,18 @@ class Device:
                 stdout=True,
             )
             # upload the package to the device
-            if not self._upload_package(package_path):
+            with self.phase('upload'):
+                uploaded = self._upload_package(package_path)
+            if not uploaded:
+                self.record_failure('upload')
                 self.logger.log(
                     'error',
                     self.name,
                     f'failed to upload {package_path} to device',
                     stdout=True,
                 )
-                return
-        if not self.reboot_and_wait(downgrade=do_downgrade):
-            return
-        self.ssh_connect()
-        self.refresh_update_info()
-        self.logger.log(
-            'info',
-            self.name,
-            self.version_info_str,
-            stdout=True,
-        )
+                return None
+        return do_downgrade
 
     def _reboot(self) -> None:
         """Execute system reboot using ssh_call."""
@@ -868,9 +1406,15 @@ class Device:
         try:
             if not self.client:
                 raise
-            with SCPClient(self.client.get_transport()) as scp:
-                # upload to / (RAM), use /flash to upload to persistent memory
-                scp.put(package_path, '/')
+            with self.span(
+                'scp put',
+                category='scp',
+                file=package_path.name,
+            ):
+                with self._open_scp() as scp:
+                    # upload to / (RAM),
+                    # use /flash to upload to persistent memory
+                    scp.put(package_path, '/')
         except Exception as e:
             self.logger.log(
                 'error',
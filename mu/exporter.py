@@ -0,0 +1,195 @@
+import os
+import pathlib
+import re
+import tempfile
+import time
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mu.device import Device
+
+_LAST_SUCCESS = re.compile(
+    r'^mu_device_last_success_timestamp_seconds'
+    r'\{device="((?:[^"\\]|\\.)*)"\} (\S+)$',
+)
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the Prometheus/OpenMetrics text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n',
+    )
+
+
+def _unescape_label(value: str) -> str:
+    return re.sub(
+        r'\\(.)',
+        lambda m: '\n' if m.group(1) == 'n' else m.group(1),
+        value,
+    )
+
+
+def read_last_success(path: str | pathlib.Path) -> dict[str, float]:
+    """
+    Read the per-device last success timestamps from a textfile written
+    by a previous run, so devices which fail now keep their old value.
+    """
+    result: dict[str, float] = {}
+    try:
+        with open(path) as stream:
+            for line in stream:
+                match = _LAST_SUCCESS.match(line.rstrip('\n'))
+                if match:
+                    try:
+                        result[_unescape_label(match.group(1))] = \
+                            float(match.group(2))
+                    except ValueError:
+                        pass
+    except OSError:
+        pass
+    return result
+
+
+def render(
+        devices: Sequence['Device'],
+        run_started: float,
+        run_finished: float,
+        last_success: dict[str, float] | None = None,
+) -> str:
+    """Render the run results in the OpenMetrics text format."""
+    last_success = dict(last_success or {})
+    for d in devices:
+        if d.last_success:
+            last_success[d.name] = d.last_success
+    families: list[tuple[str, str, str, list[str]]] = []
+
+    def family(name: str, kind: str, help_text: str) -> list[str]:
+        samples: list[str] = []
+        families.append((name, kind, help_text, samples))
+        return samples
+
+    run_ts = family(
+        'mu_run_timestamp_seconds', 'gauge',
+        'Time when the last mu run finished.',
+    )
+    run_ts.append(f'mu_run_timestamp_seconds {run_finished:.3f}')
+    run_duration = family(
+        'mu_run_duration_seconds', 'gauge',
+        'Duration of the last mu run.',
+    )
+    run_duration.append(
+        f'mu_run_duration_seconds {run_finished - run_started:.3f}',
+    )
+    run_devices = family(
+        'mu_run_devices', 'gauge',
+        'Number of devices processed in the last run.',
+    )
+    run_devices.append(f'mu_run_devices {len(devices)}')
+
+    success = family(
+        'mu_device_last_success_timestamp_seconds', 'gauge',
+        'Time of the last run which finished without errors on the device.',
+    )
+    version = family(
+        'mu_device_version_info', 'gauge',
+        'RouterOS and firmware versions seen in the last run.',
+    )
+    update_duration = family(
+        'mu_device_update_duration_seconds', 'gauge',
+        'Duration of the RouterOS update in the last run.',
+    )
+    backup_size = family(
+        'mu_device_backup_size_bytes', 'gauge',
+        'Size of the downloaded backup file.',
+    )
+    reboot = family(
+        'mu_device_reboot_to_ssh_seconds', 'gauge',
+        'Time from the reboot command until SSH was available again.',
+    )
+    failures = family(
+        'mu_device_phase_failures', 'gauge',
+        'Number of failures per phase in the last run.',
+    )
+    for name in sorted(last_success):
+        success.append(
+            'mu_device_last_success_timestamp_seconds'
+            f'{{device="{escape_label(name)}"}} {last_success[name]:.3f}',
+        )
+    for d in sorted(devices, key=lambda d: d.name):
+        label = f'device="{escape_label(d.name)}"'
+        version.append(
+            f'mu_device_version_info{{{label},'
+            f'installed="{escape_label(d.installed_version)}",'
+            f'latest="{escape_label(d.latest_version)}",'
+            f'firmware="{escape_label(d.current_firmware)}",'
+            f'model="{escape_label(d.model)}"}} 1',
+        )
+        if 'update' in d.timings:
+            update_duration.append(
+                f'mu_device_update_duration_seconds{{{label}}} '
+                f'{sum(d.timings["update"]):.3f}',
+            )
+        if d.backup_size is not None:
+            backup_size.append(
+                f'mu_device_backup_size_bytes{{{label}}} {d.backup_size}',
+            )
+        if 'reboot-wait' in d.timings:
+            reboot.append(
+                f'mu_device_reboot_to_ssh_seconds{{{label}}} '
+                f'{d.timings["reboot-wait"][-1]:.3f}',
+            )
+        for phase in sorted(d.failures):
+            failures.append(
+                f'mu_device_phase_failures{{{label},'
+                f'phase="{escape_label(phase)}"}} {d.failures[phase]}',
+            )
+
+    lines: list[str] = []
+    for name, kind, help_text, samples in families:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(
+        path: str | pathlib.Path,
+        devices: Sequence['Device'],
+        run_started: float,
+        run_finished: float | None = None,
+) -> None:
+    """
+    Write the run results for the node_exporter textfile collector.
+    The file is written to a temporary file in the same directory and
+    renamed over the target, so the collector never reads a partial file.
+    """
+    path = pathlib.Path(path)
+    if run_finished is None:
+        run_finished = time.time()
+    content = render(
+        devices,
+        run_started,
+        run_finished,
+        read_last_success(path),
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent,
+        prefix=f'.{path.name}.',
+        suffix='.tmp',
+    )
+    try:
+        with os.fdopen(fd, 'w') as stream:
+            stream.write(content)
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,237 @@
+import datetime
+import heapq
+import json
+import os
+import pathlib
+import statistics
+from collections.abc import Mapping
+from collections.abc import Sequence
+from typing import Any
+from typing import TYPE_CHECKING
+
+from mu.timing import percentile
+
+if TYPE_CHECKING:
+    from mu.device import Device
+
+# number of runs kept per device
+KEEP = 20
+# reboots of a device (else of its model) needed to adapt the reboot wait
+MIN_REBOOTS = 3
+
+
+class History:
+    """
+    Durations of the updates of every device in the previous runs and
+    the seconds its reboots took until ssh worked again, kept in a JSON
+    file (by default "<log_dir>/history.json"): \n
+    {"devices": {"ap1": {"model": "RB951", "durations": [41.2, 39.8],
+    "reboots": [31.0, 33.5]}}} \n
+    Only the last KEEP values of each list are kept. A missing or
+    broken file is an empty history.
+    """
+    def __init__(self, path: str | pathlib.Path, keep: int = KEEP) -> None:
+        self.path = pathlib.Path(path)
+        self.keep = keep
+        # device -> {'model': str, 'durations': [s], 'reboots': [s]}
+        self.devices: dict[str, dict[str, Any]] = {}
+        try:
+            with open(self.path) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and isinstance(data.get('devices'), dict):
+            self.devices = {
+                name: entry for name, entry in data['devices'].items()
+                if isinstance(entry, dict)
+            }
+
+    def _append(
+            self,
+            name: str,
+            model: str,
+            key: str,
+            seconds: float,
+    ) -> None:
+        entry = self.devices.setdefault(name, {})
+        if model != 'unknown':
+            entry['model'] = model
+        values = entry.setdefault(key, [])
+        values.append(round(seconds, 3))
+        del values[:-self.keep]
+
+    def record(self, name: str, model: str, duration: float) -> None:
+        """Add the duration of one update of the device."""
+        self._append(name, model, 'durations', duration)
+
+    def record_reboot(self, name: str, model: str, seconds: float) -> None:
+        """Add the seconds from a reboot until ssh worked again."""
+        self._append(name, model, 'reboots', seconds)
+
+    def durations(self, name: str) -> list[float]:
+        return list(self.devices.get(name, {}).get('durations', []))
+
+    def _model(self, d: 'Device') -> str:
+        if d.model != 'unknown':
+            return d.model
+        return self.devices.get(d.name, {}).get('model', 'unknown')
+
+    def reboots(self, d: 'Device') -> list[float]:
+        """
+        The reboot times of the device when there are at least
+        MIN_REBOOTS of them, else those of all devices of its model,
+        else none.
+        """
+        own = self.devices.get(d.name, {}).get('reboots', [])
+        if len(own) >= MIN_REBOOTS:
+            return list(own)
+        model = self._model(d)
+        if model == 'unknown':
+            return []
+        same_model = [
+            seconds
+            for entry in self.devices.values()
+            if entry.get('model') == model
+            for seconds in entry.get('reboots', [])
+        ]
+        return same_model if len(same_model) >= MIN_REBOOTS else []
+
+    def adapt_reboot(self, d: 'Device') -> bool:
+        """
+        Set the reboot wait of the device from its reboot times, see
+        reboot_plan. Values set in the configuration file are kept.
+        Returns False when there are not enough reboots to learn from.
+        """
+        samples = self.reboots(d)
+        if not samples:
+            return False
+        first_probe, poll_interval, timeout = reboot_plan(samples)
+        if d.reboot_first_probe is None:
+            d.reboot_first_probe = first_probe
+        if d.reboot_poll_interval is None:
+            d.reboot_poll_interval = poll_interval
+        if d.reboot_timeout is None:
+            d.reboot_timeout = timeout
+        return True
+
+    def estimate(
+            self,
+            d: 'Device',
+            default: float,
+    ) -> float:
+        """
+        Expected duration of the update of the device: the median of
+        its previous updates, else the median of the devices of the same
+        model, else the median of all devices, else default.
+        """
+        own = self.durations(d.name)
+        if own:
+            return statistics.median(own)
+        model = self._model(d)
+        same_model = [
+            duration
+            for entry in self.devices.values()
+            if model != 'unknown' and entry.get('model') == model
+            for duration in entry.get('durations', [])
+        ]
+        if same_model:
+            return statistics.median(same_model)
+        fleet = [
+            duration
+            for entry in self.devices.values()
+            for duration in entry.get('durations', [])
+        ]
+        if fleet:
+            return statistics.median(fleet)
+        return default
+
+    def save(self) -> None:
+        """Write the history, replacing the file atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as stream:
+            json.dump({'devices': self.devices}, stream, indent=1)
+        os.replace(tmp, self.path)
+
+
+def reboot_plan(samples: Sequence[float]) -> tuple[float, float, float]:
+    """
+    The first probe, poll interval and timeout (seconds) of the wait
+    for a reboot from the earlier reboot times: probe first shortly
+    before the fastest 5% of the reboots, then every 1/20 of the median
+    (1 to 5 seconds), and give up at 1.5 times the 95th percentile plus
+    30 seconds.
+    """
+    first_probe = 0.8 * percentile(samples, 5)
+    poll_interval = min(5.0, max(1.0, percentile(samples, 50) / 20))
+    timeout = 1.5 * percentile(samples, 95) + 30
+    return (
+        round(first_probe, 1),
+        round(poll_interval, 1),
+        round(timeout),
+    )
+
+
+def longest_first(
+        devices: Sequence['Device'],
+        estimates: Mapping[str, float],
+) -> list['Device']:
+    """The devices by expected duration, longest first (stable)."""
+    return sorted(devices, key=lambda d: -estimates.get(d.name, 0))
+
+
+def predict(
+        devices: Sequence['Device'],
+        estimates: Mapping[str, float],
+        jobs: int = 1,
+) -> float:
+    """
+    Expected duration of the run in seconds when each next device goes
+    to the first free of the jobs workers, in the given order.
+    """
+    workers = [0.0] * max(1, min(jobs, len(devices)))
+    for d in devices:
+        heapq.heapreplace(
+            workers,
+            workers[0] + estimates.get(d.name, 0),
+        )
+    return max(workers, default=0.0)
+
+
+def fit_deadline(
+        devices: Sequence['Device'],
+        estimates: Mapping[str, float],
+        jobs: int,
+        seconds: float,
+) -> tuple[list['Device'], list['Device']]:
+    """
+    Split the devices, longest first, into those which are expected to
+    finish within seconds on jobs workers and those which are not.
+    """
+    workers = [0.0] * max(1, jobs)
+    scheduled = []
+    skipped = []
+    for d in longest_first(devices, estimates):
+        finish = workers[0] + estimates.get(d.name, 0)
+        if finish <= seconds:
+            heapq.heapreplace(workers, finish)
+            scheduled.append(d)
+        else:
+            skipped.append(d)
+    return scheduled, skipped
+
+
+def seconds_until(
+        deadline: str,
+        now: datetime.datetime | None = None,
+) -> float:
+    """
+    Seconds from now to the next HH:MM local time, tomorrow when the
+    time already passed today. Raises ValueError for other formats.
+    """
+    end = datetime.datetime.strptime(deadline, '%H:%M').time()
+    now = now or datetime.datetime.now()
+    target = datetime.datetime.combine(now.date(), end)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
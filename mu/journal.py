@@ -0,0 +1,115 @@
+import json
+import os
+import pathlib
+import re
+import threading
+import time
+from typing import Any
+from typing import IO
+
+# the steps of a device recorded in the journal, in the order they
+# complete. done means the device finished the run without failures.
+STEPS = ('backup', 'export', 'downloaded', 'rebooted', 'verified', 'done')
+
+
+def journal_path(directory: str | pathlib.Path, run_id: str) -> pathlib.Path:
+    safe = re.sub(r'[^\w.-]', '_', run_id) or '_'
+    return pathlib.Path(directory) / f'{safe}.jsonl'
+
+
+class Journal:
+    """
+    Append-only journal of the steps every device completed in a run,
+    one JSON object per line in "<directory>/<run_id>.jsonl". \n
+    Each line is flushed and fsynced when written, so the journal
+    survives the process being killed. A run resumed with the same
+    run id appends to the same file and skips the recorded steps.
+    A truncated last line (the process died while writing it)
+    is ignored.
+    """
+    def __init__(
+            self,
+            directory: str | pathlib.Path,
+            run_id: str,
+            attempt: str = '',
+    ) -> None:
+        self.path = journal_path(directory, run_id)
+        self.run_id = run_id
+        # the id of the process writing, differs from run_id on resume
+        self.attempt = attempt or run_id
+        # device -> step -> fields
+        self.steps: dict[str, dict[str, dict[str, Any]]] = {}
+        self._stream: IO[str] | None = None
+        self._lock = threading.Lock()
+        if self.path.is_file():
+            self._load()
+
+    @classmethod
+    def resume(
+            cls,
+            directory: str | pathlib.Path,
+            run_id: str,
+            attempt: str = '',
+    ) -> 'Journal':
+        """The journal of an earlier run. Raises FileNotFoundError."""
+        if not journal_path(directory, run_id).is_file():
+            raise FileNotFoundError(
+                f'no journal of run {run_id} in {directory}',
+            )
+        return cls(directory, run_id, attempt)
+
+    def _load(self) -> None:
+        with open(self.path) as stream:
+            for line in stream:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(entry, dict) or 'device' not in entry:
+                    continue
+                self.steps.setdefault(entry['device'], {})[
+                    entry.get('step', '')
+                ] = entry
+
+    def done(self, device: str, step: str) -> bool:
+        """Whether the device completed step in this or an earlier attempt."""
+        with self._lock:
+            return step in self.steps.get(device, {})
+
+    def get(self, device: str, step: str) -> dict[str, Any]:
+        """The fields recorded with a completed step, empty if not done."""
+        with self._lock:
+            return dict(self.steps.get(device, {}).get(step, {}))
+
+    def mark(self, device: str, step: str, **fields: Any) -> None:
+        """Record that the device completed step."""
+        entry = {
+            'ts': round(time.time(), 3),
+            'attempt': self.attempt,
+            'device': device,
+            'step': step,
+            **fields,
+        }
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._stream is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._stream = open(self.path, 'a')
+            self._stream.write(line)
+            self._stream.flush()
+            os.fsync(self._stream.fileno())
+            self.steps.setdefault(device, {})[step] = entry
+
+    def summary(self) -> dict[str, int]:
+        """Number of devices which completed each step."""
+        with self._lock:
+            return {
+                step: sum(step in steps for steps in self.steps.values())
+                for step in STEPS
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._stream:
+                self._stream.close()
+                self._stream = None
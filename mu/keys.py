@@ -0,0 +1,89 @@
+import threading
+from collections.abc import Iterator
+from collections.abc import Sequence
+
+import paramiko
+from paramiko.auth_strategy import AuthSource
+from paramiko.auth_strategy import AuthStrategy
+from paramiko.auth_strategy import InMemoryPrivateKey
+
+
+class KeyProvider:
+    """
+    The private keys used by the ssh connections of all devices. \n
+    The key files (Ed25519, ECDSA or RSA) are read on the first
+    connection and kept for the rest of the process, so devices and
+    worker threads share them and never read a file twice. A file which
+    can't be loaded raises OSError on every connection without being
+    read again. With use_agent, the keys of the ssh-agent are tried
+    after the key files. Each thread talks to the agent over its own
+    connection. \n
+    When there are no key files and no agent, paramiko looks for the
+    default keys in ~/.ssh itself, see enabled.
+    """
+    def __init__(
+            self,
+            key_files: Sequence[str] = (),
+            use_agent: bool = False,
+            keys: Sequence[paramiko.PKey] | None = None,
+    ) -> None:
+        self.key_files = list(key_files)
+        self.use_agent = use_agent
+        # keys given directly (tests, simulator) are used as loaded
+        self._keys: list[paramiko.PKey] | None = (
+            list(keys) if keys is not None else None
+        )
+        self._error: OSError | None = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def enabled(self) -> bool:
+        """False when paramiko should look for the keys itself."""
+        return bool(self.key_files or self._keys or self.use_agent)
+
+    def keys(self) -> list[paramiko.PKey]:
+        """The loaded key files, loading them on the first call."""
+        with self._lock:
+            if self._error:
+                raise self._error
+            if self._keys is None:
+                keys = []
+                for key_file in self.key_files:
+                    try:
+                        keys.append(paramiko.PKey.from_path(key_file))
+                    except (OSError, paramiko.SSHException) as err:
+                        self._error = OSError(
+                            f'cannot load private key {key_file}: {err}',
+                        )
+                        raise self._error from err
+                self._keys = keys
+            return self._keys
+
+    def agent_keys(self) -> list[paramiko.AgentKey]:
+        """The keys of the ssh-agent, empty when use_agent is off."""
+        if not self.use_agent:
+            return []
+        agent = getattr(self._local, 'agent', None)
+        if agent is None:
+            agent = paramiko.Agent()
+            self._local.agent = agent
+        return list(agent.get_keys())
+
+    def auth_strategy(self, username: str) -> AuthStrategy:
+        """The paramiko auth_strategy for SSHClient.connect."""
+        return _KeyStrategy(self, username)
+
+
+class _KeyStrategy(AuthStrategy):
+    """Try the key files first, then the keys of the agent."""
+    def __init__(self, provider: KeyProvider, username: str) -> None:
+        super().__init__(ssh_config=paramiko.SSHConfig())
+        self.provider = provider
+        self.username = username
+
+    def get_sources(self) -> Iterator[AuthSource]:
+        for key in self.provider.keys():
+            yield InMemoryPrivateKey(self.username, key)
+        for agent_key in self.provider.agent_keys():
+            yield InMemoryPrivateKey(self.username, agent_key)
@@ -1,19 +1,217 @@
+import atexit
+import gzip
+import json
+import os
 import pathlib
-from datetime import datetime
+import queue
+import re
+import shutil
+import threading
+import time
+from typing import Any
+from typing import TextIO
+
+FSYNC_POLICIES = ('never', 'batch', 'close')
+ROTATE_INTERVALS = {
+    'none': '',
+    'daily': '%Y-%m-%d',
+    'weekly': '%G-W%V',
+    'monthly': '%Y-%m',
+}
+
+
+class LogFile:
+    """
+    A single append-only log file with optional size and time based
+    rotation. \n
+    Rotated files are renamed to "name.yyyymmdd-hhmmss" (gzip compressed
+    to "name.yyyymmdd-hhmmss.gz" when compress is True) and only
+    the newest backup_count of them are kept. \n
+    Not thread-safe on its own; only the Logger writer thread uses it.
+    """
+    def __init__(
+            self,
+            path: pathlib.Path,
+            max_bytes: int = 0,
+            rotate: str = 'none',
+            backup_count: int = 10,
+            compress: bool = True,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate = rotate
+        self.backup_count = backup_count
+        self.compress = compress
+        self.stream: TextIO | None = None
+        self.size = 0
+        self.period = ''
+
+    def open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.stream = open(self.path, 'a')
+        try:
+            stat = self.path.stat()
+            self.size = stat.st_size
+            started = stat.st_mtime if self.size else time.time()
+        except OSError:
+            self.size = 0
+            started = time.time()
+        self.period = self._period(started)
+
+    def write(self, data: str) -> None:
+        if not self.stream:
+            self.open()
+        if self._rotation_due(len(data)):
+            self.do_rotate()
+        assert self.stream
+        self.stream.write(data)
+        self.stream.flush()
+        self.size += len(data)
+
+    def fileno(self) -> int:
+        assert self.stream
+        return self.stream.fileno()
+
+    def close(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+    def do_rotate(self) -> None:
+        """Move the current file aside and start a new one."""
+        self.close()
+        suffix = time.strftime('%Y%m%d-%H%M%S')
+        rotated = self.path.with_name(f'{self.path.name}.{suffix}')
+        n = 1
+        while rotated.exists() or rotated.with_name(
+            rotated.name + '.gz',
+        ).exists():
+            rotated = self.path.with_name(f'{self.path.name}.{suffix}-{n}')
+            n += 1
+        if self.path.exists():
+            os.replace(self.path, rotated)
+            if self.compress:
+                with open(rotated, 'rb') as src:
+                    with gzip.open(f'{rotated}.gz', 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                rotated.unlink()
+        self._prune()
+        self.open()
+
+    def _rotation_due(self, incoming: int) -> bool:
+        if self.max_bytes and self.size and \
+                self.size + incoming > self.max_bytes:
+            return True
+        if self.rotate != 'none' and \
+                self.period != self._period(time.time()):
+            return True
+        return False
+
+    def _period(self, epoch: float) -> str:
+        fmt = ROTATE_INTERVALS[self.rotate]
+        if not fmt:
+            return ''
+        return time.strftime(fmt, time.localtime(epoch))
+
+    def _prune(self) -> None:
+        pattern = re.compile(
+            re.escape(self.path.name) +
+            r'\.(?P<time>\d{8}-\d{6})(?:-(?P<n>\d+))?(?:\.gz)?',
+        )
+        # oldest first: by time, then by the -n of the files rotated
+        # within the same second
+        rotated = []
+        for p in self.path.parent.iterdir():
+            match = pattern.fullmatch(p.name)
+            if match:
+                rotated.append((match['time'], int(match['n'] or 0), p))
+        rotated.sort()
+        for _, _, old in rotated[:max(len(rotated) - self.backup_count, 0)]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
 
 
 class Logger:
+    """
+    Appends log lines to a single log file. \n
+    The file handle is opened on the first log() call and kept open
+    until close(); lines logged after that are only printed (stdout).
+    Records are handed over to a background writer thread through
+    a queue, so the callers never wait for the disk. The writer drains
+    whatever is queued, writes it as one batch and flushes once.
+    Every record is a complete line and only the writer touches
+    the file, so lines from different threads never interleave. \n
+    fsync policy: \n
+    never - leave it to the OS \n
+    batch - fsync after every written batch \n
+    close - fsync once when the logger is flushed or closed \n
+    Optional sinks: \n
+    json_lines - the same records as JSON lines with structured fields
+    (run_id, device, phase, duration, versions, ...) in
+    "<file_name stem>.jsonl" \n
+    per_device - one text log per device in "devices/<device>.log",
+    at most max_open_files of them open at a time (the least recently
+    written ones are closed and reopened when needed) \n
+    All files rotate by size (max_bytes) and/or time (rotate) and
+    the rotated files are gzip compressed.
+    """
     def __init__(
             self,
             log_dir_str: str = '',
             file_name: str = 'mikrotik_update.log',
+            fsync: str = 'never',
+            batch_size: int = 512,
+            json_lines: bool = False,
+            per_device: bool = False,
+            max_bytes: int = 0,
+            rotate: str = 'none',
+            backup_count: int = 10,
+            compress: bool = True,
+            max_open_files: int = 64,
     ) -> None:
         if not log_dir_str:
             log_dir = pathlib.Path('.')
         else:
             log_dir = pathlib.Path(log_dir_str)
             log_dir.mkdir(parents=True, exist_ok=True)
+        self.log_dir = log_dir
         self.log_file = pathlib.Path.joinpath(log_dir, file_name)
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(
+                f'invalid fsync policy {fsync}, '
+                f'expected one of {FSYNC_POLICIES}',
+            )
+        if rotate not in ROTATE_INTERVALS:
+            raise ValueError(
+                f'invalid rotate interval {rotate}, '
+                f'expected one of {tuple(ROTATE_INTERVALS)}',
+            )
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.json_lines = json_lines
+        self.per_device = per_device
+        self.max_open_files = max_open_files
+        self.json_file = self.log_file.with_suffix('.jsonl')
+        self.device_dir = log_dir / 'devices'
+        self._rotation: dict[str, Any] = {
+            'max_bytes': max_bytes,
+            'rotate': rotate,
+            'backup_count': backup_count,
+            'compress': compress,
+        }
+        self.run_id = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+        self._queue: queue.SimpleQueue[
+            tuple[str, str, str] | threading.Event | None
+        ] = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._stream: LogFile | None = None
+        self._files: dict[pathlib.Path, LogFile] = {}
+        self._writer: threading.Thread | None = None
+        # (epoch second, formatted timestamp) - reused within one second
+        self._timestamp: tuple[int, str] = (-1, '')
+        self._closed = False
 
     def log(
             self,
@@ -21,15 +219,175 @@ class Logger:
             device: str,
             msg: str,
             stdout: bool = False,
+            **fields: Any,
     ) -> None:
-        now = datetime.now()
-        timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        """
+        Log one line. Keyword arguments are extra structured fields
+        which only show up in the JSON lines output.
+        """
+        timestamp = self._now()
         log_line = f'{timestamp} - {severity} - {device} - {msg} \n'
         if stdout:
             print(log_line.strip())
+        if self._closed:
+            return
+        json_line = ''
+        if self.json_lines:
+            record = {
+                'ts': round(time.time(), 3),
+                'time': timestamp,
+                'run_id': self.run_id,
+                'severity': severity,
+                'device': device,
+                'msg': msg,
+            }
+            record.update(fields)
+            json_line = json.dumps(record, default=str) + '\n'
+        self._start()
+        self._queue.put((device, log_line, json_line))
+
+    def flush(self) -> None:
+        """Block until every record logged so far is written."""
+        if not self._writer:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        if self.fsync == 'close':
+            self._fsync()
+
+    def close(self) -> None:
+        """Flush all pending records, stop the writer and close the file."""
+        with self._lock:
+            self._closed = True
+            writer = self._writer
+            if not writer:
+                return
+            atexit.unregister(self.close)
+            self._queue.put(None)
+            writer.join()
+            self._writer = None
+            if self.fsync == 'close':
+                self._fsync()
+            for log_file in self._files.values():
+                log_file.close()
+            self._files = {}
+            self._stream = None
+
+    def _now(self) -> str:
+        second = int(time.time())
+        cached_second, timestamp = self._timestamp
+        if second != cached_second:
+            timestamp = time.strftime(
+                '%Y-%m-%d %H:%M:%S',
+                time.localtime(second),
+            )
+            self._timestamp = (second, timestamp)
+        return timestamp
+
+    def _start(self) -> None:
+        """Open the log file and start the writer thread if needed."""
+        if self._writer:
+            return
+        with self._lock:
+            if self._writer or self._closed:
+                return
+            self._stream = LogFile(self.log_file, **self._rotation)
+            try:
+                self._stream.open()
+            except PermissionError:
+                print(f'Unable to write to {self.log_file}')
+                raise SystemExit(1)
+            self._files = {self.log_file: self._stream}
+            self._writer = threading.Thread(
+                target=self._run,
+                name='mu-logger',
+                daemon=True,
+            )
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        """Writer thread main loop."""
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            batch: dict[pathlib.Path, list[str]] = {}
+            count = 0
+            waiters: list[threading.Event] = []
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    self._route(item, batch)
+                    count += 1
+                    if count >= self.batch_size:
+                        break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            for path, lines in batch.items():
+                self._write(path, ''.join(lines))
+            for waiter in waiters:
+                waiter.set()
+
+    def _route(
+            self,
+            item: tuple[str, str, str],
+            batch: dict[pathlib.Path, list[str]],
+    ) -> None:
+        """Sort one record into the files it belongs to."""
+        device, log_line, json_line = item
+        batch.setdefault(self.log_file, []).append(log_line)
+        if json_line:
+            batch.setdefault(self.json_file, []).append(json_line)
+        if self.per_device and device != 'script':
+            path = self.device_dir / f'{_safe_file_name(device)}.log'
+            batch.setdefault(path, []).append(log_line)
+
+    def _write(self, path: pathlib.Path, data: str) -> None:
+        # re-inserted on every write, so _files is in least recently
+        # written order
+        log_file = self._files.pop(path, None)
+        if not log_file:
+            log_file = LogFile(path, **self._rotation)
+        self._files[path] = log_file
         try:
-            with open(self.log_file, 'a') as stream:
-                stream.write(log_line)
-        except PermissionError:
-            print(f'Unable to write to {self.log_file}')
-            raise SystemExit(1)
+            log_file.write(data)
+            if self.fsync == 'batch':
+                os.fsync(log_file.fileno())
+        except OSError as e:
+            print(f'Unable to write to {path}: {e}')
+        self._close_idle()
+
+    def _close_idle(self) -> None:
+        """Close the least recently written per-device files."""
+        devices = [
+            path for path in self._files
+            if path not in (self.log_file, self.json_file)
+        ]
+        for path in devices[:max(len(devices) - self.max_open_files, 0)]:
+            log_file = self._files.pop(path)
+            if self.fsync == 'close' and log_file.stream:
+                try:
+                    os.fsync(log_file.fileno())
+                except (OSError, ValueError):
+                    pass
+            log_file.close()
+
+    def _fsync(self) -> None:
+        for log_file in list(self._files.values()):
+            if not log_file.stream:
+                continue
+            try:
+                os.fsync(log_file.fileno())
+            except (OSError, ValueError):
+                pass
+
+
+def _safe_file_name(name: str) -> str:
+    return re.sub(r'[^\w.-]', '_', name) or '_'
@@ -1,23 +1,494 @@
 import argparse
-import configparser
-import importlib.metadata
 import os
+import pathlib
+import sys
+import time
 from collections.abc import Sequence
+from typing import Any
+from typing import TYPE_CHECKING
 
+import yaml
+
+from mu.config import REBOOT_TIMEOUT
 from mu.configmanager import ConfigManager
+from mu.exporter import write_textfile
+from mu.journal import Journal
+from mu.logger import Logger
+from mu.metrics import CommandMetrics
+from mu.routeros import RouterOSVersion
+from mu.staging import StagingRecord
+from mu.timing import merge_timings
+from mu.timing import summary_lines
+from mu.trace import Tracer
+from mu.watchdog import Watchdog
+
+# mu.device and mu.replay import paramiko and scp, mu.profiler pstats,
+# mu.prescan asyncio, mu.waves concurrent.futures and mu.history
+# statistics, which take longer to import than the rest of mu. They are
+# imported on the code paths which connect to devices, so --help,
+# --version and check-config start fast.
+if TYPE_CHECKING:
+    from mu.device import Device
+    from mu.history import History
+    from mu.profiler import Profiler
+    from mu.report import Report
+    from mu.waves import WaveScheduler
+
+# commands given before the options, "mu stage [options] file"
+COMMANDS = ('stage', 'activate')
+# default --jobs of the dry run and mu activate, which only check the
+# devices or only reboot them
+PARALLEL_JOBS = 10
+
+
+def version_str() -> str:
+    """The installed version of mu, or the one in setup.cfg."""
+    import importlib.metadata
+    try:
+        return importlib.metadata.version('mu')
+    except importlib.metadata.PackageNotFoundError:
+        import configparser
+        config = configparser.ConfigParser()
+        config.read(
+            os.path.join(os.path.dirname(__file__), '..', 'setup.cfg'),
+        )
+        return config['metadata']['version']
+
+
+class _VersionAction(argparse.Action):
+    """Like action='version', but looks the version up when used."""
+    def __init__(self, option_strings: list[str], **kwargs: Any) -> None:
+        kwargs.setdefault('default', argparse.SUPPRESS)
+        super().__init__(option_strings, nargs=0, **kwargs)
+
+    def __call__(self, parser: argparse.ArgumentParser, *args: Any) -> None:
+        print(f'{parser.prog} version {version_str()}')
+        parser.exit()
+
+
+def process_device(
+        d: 'Device',
+        args: argparse.Namespace,
+        logger: Logger,
+) -> None:
+    """Run the actions selected on the command line on one device."""
+    if d.step_done('done'):
+        logger.log(
+            'info',
+            d.name,
+            f'completed in run {d.step_info("done").get("attempt")}, ' +
+            'skipping',
+            stdout=True,
+        )
+        return
+    if d.ssh_test():
+        d.ssh_connect()
+        if args.dry_run:
+            if d.update_type == 'manual':
+                installed = d.get_installed_packages()
+                logger.log(
+                    'info',
+                    d.name,
+                    'manual update. installed packages: ' +
+                    f'{installed}, packages to update: {d.packages}',
+                    stdout=True,
+                )
+            else:
+                d.refresh_update_info()
+                logger.log(
+                    'info',
+                    d.name,
+                    d.version_info_str,
+                    stdout=True,
+                    **d.version_fields(),
+                )
+                if args.report:
+                    d.get_installed_packages()
+            if d.update_firmware:
+                d.refresh_firmware_info()
+                logger.log(
+                    'info',
+                    d.name,
+                    d.firmware_info_str,
+                    stdout=True,
+                    **d.version_fields(),
+                )
+            elif args.report:
+                d.refresh_firmware_info()
+        else:
+            if args.backup_only:
+                if not d.backup():
+                    logger.log(
+                        'error',
+                        d.name,
+                        'backup or export failed',
+                        stdout=True,
+                    )
+            else:
+                if d.get_update_available() or d.update_pending():
+                    if args.update_only:
+                        d.update()
+                    elif d.backup():
+                        d.update()
+                    else:
+                        logger.log(
+                            'error',
+                            d.name,
+                            'backup or export failed, '
+                            'skipping update',
+                            stdout=True,
+                        )
+                else:
+                    logger.log(
+                        'info',
+                        d.name,
+                        'No updates available.',
+                        stdout=True,
+                    )
+                # a device which didn't come back from the update reboot
+                # can't take the firmware update either
+                if d.update_firmware and 'reboot-wait' not in d.failures:
+                    if not d.firmware_update():
+                        logger.log(
+                            'error',
+                            d.name,
+                            'firmware update failed',
+                            stdout=True,
+                        )
+
+        d.ssh_close()
+        if not d.failures:
+            d.last_success = time.time()
+            if not args.dry_run:
+                d.mark_step('done')
+    else:
+        d.record_failure('connect')
+        print(f"Can't connect to {d.name}")
+
+
+def stage_device(
+        d: 'Device',
+        logger: Logger,
+        staging: StagingRecord,
+) -> None:
+    """
+    mu stage: back up the device and stage its update, without
+    rebooting. Records the staged update in staging.
+    """
+    if not d.ssh_test():
+        d.record_failure('connect')
+        print(f"Can't connect to {d.name}")
+        return
+    d.ssh_connect()
+    if d.backup():
+        staged = d.stage()
+        if staged:
+            staging.mark(d.name, **staged)
+            logger.log(
+                'info',
+                d.name,
+                'update staged, activate with mu activate',
+                stdout=True,
+                **staged,
+            )
+    else:
+        logger.log(
+            'error',
+            d.name,
+            'backup or export failed, skipping staging',
+            stdout=True,
+        )
+    d.ssh_close()
+
+
+def activate_device(
+        d: 'Device',
+        logger: Logger,
+        staging: StagingRecord,
+) -> None:
+    """
+    mu activate: reboot the device into the update staged by mu stage
+    and forget it in staging once verified.
+    """
+    staged = staging.get(d.name)
+    if not staged:
+        logger.log('info', d.name, 'nothing staged, skipping', stdout=True)
+        return
+    if not d.ssh_test():
+        d.record_failure('connect')
+        print(f"Can't connect to {d.name}")
+        return
+    d.ssh_connect()
+    if d.activate(staged):
+        staging.clear(d.name)
+    if d.update_firmware and 'reboot-wait' not in d.failures:
+        if not d.firmware_update():
+            logger.log(
+                'error',
+                d.name,
+                'firmware update failed',
+                stdout=True,
+            )
+    d.ssh_close()
+    if not d.failures:
+        d.last_success = time.time()
+        d.mark_step('done')
+
+
+def run_devices(
+        devices: list['Device'],
+        args: argparse.Namespace,
+        logger: Logger,
+        scheduler: 'WaveScheduler | None' = None,
+        staging: StagingRecord | None = None,
+        report: 'Report | None' = None,
+) -> bool:
+    """
+    Process the devices one after another, or up to args.jobs
+    devices at a time on a thread pool. With a scheduler, the devices
+    are processed in its waves. Returns False when the scheduler
+    stopped the rollout because a wave failed. \n
+    mu stage and mu activate (args.command) record the staged updates
+    in staging. Every finished device is written to report. \n
+    A device whose session times out, runs longer than its
+    session_timeout (see mu.watchdog) or raises any other exception
+    fails without stopping the run.
+    """
+    if scheduler is None:
+        from mu.waves import WaveScheduler
+        scheduler = WaveScheduler([], logger, jobs=args.jobs)
+    command = getattr(args, 'command', None)
+    watchdog = Watchdog(logger)
+
+    def process(d: 'Device') -> None:
+        start = time.monotonic()
+        try:
+            with watchdog.watch(d):
+                if command == 'stage':
+                    assert staging
+                    stage_device(d, logger, staging)
+                elif command == 'activate':
+                    assert staging
+                    activate_device(d, logger, staging)
+                else:
+                    process_device(d, args, logger)
+        except TimeoutError as e:
+            d.record_failure('timeout')
+            d.ssh_close()
+            logger.log(
+                'error',
+                d.name,
+                f'session timed out: {e}',
+                stdout=True,
+            )
+        except Exception as e:
+            d.record_failure('error')
+            d.ssh_close()
+            logger.log(
+                'error',
+                d.name,
+                f'failed: {type(e).__name__}: {e}',
+                stdout=True,
+            )
+        finally:
+            d.duration = time.monotonic() - start
+            if report:
+                report.write(d)
+
+    try:
+        return scheduler.run(devices, process)
+    finally:
+        watchdog.stop()
+
+
+def prescan_devices(
+        devices: list['Device'],
+        timeout: float,
+        logger: Logger,
+) -> tuple[list['Device'], list['Device']]:
+    """
+    Split the devices into the reachable and the unreachable ones by
+    connecting to all their ssh ports at once, see mu.prescan. The
+    unreachable devices get a connect failure.
+    """
+    from mu.prescan import prescan
+    start = time.monotonic()
+    errors = prescan([(d.address, d.port) for d in devices], timeout)
+    reachable = []
+    unreachable = []
+    for d in devices:
+        error = errors[(d.address, d.port)]
+        if error is None:
+            reachable.append(d)
+            continue
+        d.record_failure('connect')
+        logger.log('error', d.name, f'unreachable: {error}', stdout=True)
+        unreachable.append(d)
+    logger.log(
+        'info',
+        'script',
+        f'prescan: {len(reachable)} of {len(devices)} devices reachable ' +
+        f'({time.monotonic() - start:.1f}s)',
+        stdout=True,
+    )
+    return reachable, unreachable
+
+
+def record_history(
+        devices: list['Device'],
+        history: 'History',
+        durations: bool = True,
+) -> None:
+    """
+    Add the durations of the devices updated without failures (unless
+    durations is False) and the reboot times of the devices which came
+    back from every reboot.
+    """
+    for d in devices:
+        if durations and d.duration is not None and \
+                'update' in d.timings and not d.failures:
+            history.record(d.name, d.model, d.duration)
+        if 'reboot-wait' not in d.failures:
+            for seconds in d.timings.get('reboot-wait', []):
+                history.record_reboot(d.name, d.model, seconds)
+    history.save()
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    return f'{minutes // 60}:{minutes % 60:02}:{seconds:02}'
+
+
+def print_device_summary(devices: list['Device'], logger: Logger) -> None:
+    """Print and log the state of every device, those to act on first."""
+    from mu.report import device_row
+    from mu.report import summary_lines as report_summary_lines
+    lines = report_summary_lines([device_row(d) for d in devices])
+    if not lines:
+        return
+    print('devices:')
+    for line in lines:
+        print(line)
+        logger.log('info', 'script', f'devices: {line}')
+
+
+def print_phase_summary(devices: list['Device'], logger: Logger) -> None:
+    """Print and log per-phase p50/p95/max timings across the fleet."""
+    lines = summary_lines(merge_timings(d.timings for d in devices))
+    if not lines:
+        return
+    print('phase timings (seconds):')
+    for line in lines:
+        print(line)
+        logger.log('info', 'script', f'timings: {line}')
+
+
+def version_groups(devices: list['Device']) -> list[tuple[str, list[str]]]:
+    """
+    Group the device names by installed RouterOS version, oldest version
+    first. Versions which can't be parsed ("unknown") come last.
+    """
+    groups: dict[str, list[str]] = {}
+    for d in devices:
+        groups.setdefault(d.installed_version, []).append(d.name)
+    known = []
+    unknown = []
+    for version, names in groups.items():
+        try:
+            known.append((RouterOSVersion.parse(version), version, names))
+        except ValueError:
+            unknown.append((version, names))
+    known.sort(key=lambda group: group[0])
+    return [(version, names) for _, version, names in known] + unknown
+
+
+def print_version_summary(devices: list['Device'], logger: Logger) -> None:
+    """Print and log the devices per installed RouterOS version."""
+    groups = version_groups(devices)
+    if all(version == 'unknown' for version, _ in groups):
+        return
+    print('installed versions:')
+    for version, names in groups:
+        line = f'{version:>12} {len(names):>4}  {", ".join(sorted(names))}'
+        print(line)
+        logger.log('info', 'script', f'versions: {line.strip()}')
+
 
-try:
-    VERSION_STR = importlib.metadata.version('mu')
-except importlib.metadata.PackageNotFoundError:
-    _config = configparser.ConfigParser()
-    _config.read(os.path.join(os.path.dirname(__file__), '..', 'setup.cfg'))
-    VERSION_STR = _config['metadata']['version']
+def print_command_summary(metrics: CommandMetrics, logger: Logger) -> None:
+    """Print and log the per-command ssh latency statistics."""
+    lines = metrics.summary_lines()
+    if not lines:
+        return
+    print('ssh command latency (seconds):')
+    for line in lines:
+        print(line)
+        logger.log('info', 'script', f'commands: {line}')
+
+
+def write_profile(
+        profiler: 'Profiler',
+        directory: str,
+        logger: Logger,
+) -> None:
+    """Stop the profiler and write its statistics to directory."""
+    profiler.stop()
+    profiler.write(directory)
+    logger.log(
+        'info',
+        'script',
+        f'profile written to {directory}',
+        stdout=True,
+    )
+
+
+def check_config(argv: Sequence[str]) -> int:
+    """
+    mu check-config: validate configuration files without loading keys
+    or connecting to any device. Returns 1 when any file is invalid.
+    """
+    parser = argparse.ArgumentParser(
+        prog='mu check-config',
+        description='Validate configuration files and exit.',
+    )
+    parser.add_argument(
+        'configuration_file',
+        nargs='+',
+        help='Configuration file in yaml format',
+    )
+    args = parser.parse_args(argv)
+    result = 0
+    for configuration_file in args.configuration_file:
+        if not os.path.isfile(configuration_file):
+            print(f'File {configuration_file} doesn\'t exist!')
+            result = 1
+            continue
+        try:
+            ok = ConfigManager(configuration_file).check_config_file()
+        except yaml.YAMLError:
+            ok = False
+        print(f'{configuration_file}: {"OK" if ok else "invalid"}')
+        if not ok:
+            result = 1
+    return result
 
 
 def main(argv: Sequence[str] | None = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'check-config':
+        return check_config(argv[1:])
+    command = None
+    if argv and argv[0] in COMMANDS:
+        command = argv[0]
+        argv = argv[1:]
     parser = argparse.ArgumentParser(
         add_help=False,
-        prog='mu',
+        prog=f'mu {command}' if command else 'mu',
+        epilog='Use "mu check-config configuration_file ..." to only ' +
+        'validate configuration files. "mu stage [options] ' +
+        'configuration_file" backs up the devices and downloads or ' +
+        'uploads the updates without rebooting, "mu activate [options] ' +
+        'configuration_file" later reboots the staged devices into them.',
     )
     parser.add_argument(
         '-h',
@@ -57,14 +528,104 @@ def main(argv: Sequence[str] | None = None) -> int:
         ' Can be used multiple times to specify multiple devices.',
         action='append',
     )
+    parser.add_argument(
+        '--metrics-file',
+        help='Write per-command ssh latency statistics as JSON to this file.',
+    )
+    parser.add_argument(
+        '--textfile',
+        help='Write the run results in the OpenMetrics text format to this ' +
+        'file (node_exporter textfile collector). Overrides the textfile ' +
+        'option of the configuration file.',
+    )
+    parser.add_argument(
+        '--trace',
+        help='Write a Chrome/Perfetto trace-event timeline of the run ' +
+        'to this JSON file.',
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='DIR',
+        help='Profile the run with cProfile and write pstats files per ' +
+        'device and phase and a summary.txt to DIR.',
+    )
+    session_group = parser.add_mutually_exclusive_group()
+    session_group.add_argument(
+        '--record',
+        metavar='DIR',
+        help='Record the ssh commands, their output and the scp transfers ' +
+        'of every device to DIR. Secrets are redacted.',
+    )
+    session_group.add_argument(
+        '--replay',
+        metavar='DIR',
+        help='Do not connect to the devices, answer from the recordings ' +
+        'in DIR instead. The journal, staged.json, history.json, the ' +
+        'textfile and backup_dir are left alone.',
+    )
+    parser.add_argument(
+        '--resume',
+        metavar='RUN_ID',
+        help='Continue the interrupted run RUN_ID: skip the devices and ' +
+        'steps (backup, export, update download, reboot, verification) ' +
+        'its journal records as completed.',
+    )
+    parser.add_argument(
+        '--report',
+        metavar='FILE',
+        help='Write the state of every device (reachable, identity, ' +
+        'channel, versions, firmware, packages) to FILE as soon as it is ' +
+        'done, as JSON lines or as CSV when FILE ends with .csv.',
+    )
+    parser.add_argument(
+        '--deadline',
+        metavar='HH:MM',
+        help='End of the maintenance window. Only the devices expected ' +
+        'to finish by then, according to the durations of the previous ' +
+        'runs, are processed.',
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        help='Number of devices processed in parallel. Default is 1, ' +
+        f'{PARALLEL_JOBS} for --dry-run and mu activate (1 with --profile).',
+    )
     parser.add_argument(
         '-V',
         '--version',
         help='Display the program version',
-        action='version',
-        version=f'%(prog)s version {VERSION_STR}',
+        action=_VersionAction,
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    args.command = command
+    if args.jobs is None:
+        parallel = args.dry_run or command == 'activate'
+        args.jobs = PARALLEL_JOBS if parallel and not args.profile else 1
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    # only one cProfile profiler runs at a time, so the device phases
+    # are profiled on the main thread only
+    if args.profile and args.jobs > 1:
+        parser.error('--profile can not be used with --jobs above 1')
+    if args.resume and args.dry_run:
+        parser.error('--resume can not be used with --dry-run')
+    if args.resume and args.replay:
+        parser.error('--resume can not be used with --replay')
+    if command and (
+        args.dry_run or args.update_only or args.backup_only or args.resume
+    ):
+        parser.error(
+            f'mu {command} can not be used with --dry-run, --update-only, ' +
+            '--backup-only or --resume',
+        )
+    window = None
+    if args.deadline:
+        from mu.history import seconds_until
+        try:
+            window = seconds_until(args.deadline)
+        except ValueError:
+            parser.error(f'invalid --deadline {args.deadline}, use HH:MM')
     configuration_file = args.configuration_file
     if not os.path.isfile(configuration_file):
         print(f'File {args.configuration_file} doesn\'t exist!')
@@ -72,7 +633,57 @@ def main(argv: Sequence[str] | None = None) -> int:
     cm = ConfigManager(configuration_file)
     if not cm.check_config_file():
         return 1
+    # only the commands below connect to devices
+    from mu.profiler import Profiler
+    from mu.report import Report
+    profiler = None
+    if args.profile:
+        profiler = Profiler()
+        profiler.start()
+    run_started = time.time()
     devices, logger = cm.load_config()
+    report = Report(args.report) if args.report else None
+    try:
+        return run(
+            args,
+            cm,
+            devices,
+            logger,
+            profiler,
+            report,
+            window,
+            run_started,
+        )
+    finally:
+        if report:
+            report.close()
+        if profiler:
+            write_profile(profiler, args.profile, logger)
+        logger.close()
+
+
+def run(
+        args: argparse.Namespace,
+        cm: ConfigManager,
+        devices: list['Device'],
+        logger: Logger,
+        profiler: 'Profiler | None',
+        report: 'Report | None',
+        window: float | None,
+        run_started: float,
+) -> int:
+    """
+    Process the devices of a checked configuration as main was asked
+    to. The caller closes the report, the profiler and the logger.
+    """
+    from mu.history import fit_deadline
+    from mu.history import History
+    from mu.history import longest_first
+    from mu.history import predict
+    from mu.replay import Recorder
+    from mu.replay import Replayer
+    from mu.waves import WaveScheduler
+    command = args.command
     if args.dry_run:
         logger.log('info', 'script', '=======DRYRUN started=======')
     else:
@@ -90,79 +701,230 @@ def main(argv: Sequence[str] | None = None) -> int:
                 print(f'Device {device_name} not found in configuration file!')
                 return 1
         devices = devices_in_scope
+    metrics = CommandMetrics()
+    tracer = Tracer() if args.trace else None
     for d in devices:
-        if d.ssh_test():
-            d.ssh_connect()
-            if args.dry_run:
-                if d.update_type == 'manual':
-                    installed = d.get_installed_packages()
-                    logger.log(
-                        'info',
-                        d.name,
-                        'manual update. installed packages: ' +
-                        f'{installed}, packages to update: {d.packages}',
-                        stdout=True,
-                    )
-                else:
-                    d.refresh_update_info()
-                    logger.log(
-                        'info',
-                        d.name,
-                        d.version_info_str,
-                        stdout=True,
-                    )
-                if d.update_firmware:
-                    d.refresh_firmware_info()
-                    logger.log(
-                        'info',
-                        d.name,
-                        d.firmware_info_str,
-                        stdout=True,
-                    )
-            else:
-                if args.backup_only:
-                    if not d.backup():
-                        logger.log(
-                            'error',
-                            d.name,
-                            'backup or export failed',
-                            stdout=True,
-                        )
-                else:
-                    if d.get_update_available():
-                        if args.update_only:
-                            d.update()
-                        elif d.backup():
-                            d.update()
-                        else:
-                            logger.log(
-                                'error',
-                                d.name,
-                                'backup or export failed, '
-                                'skipping update',
-                                stdout=True,
-                            )
-                    else:
-                        logger.log(
-                            'info',
-                            d.name,
-                            'No updates available.',
-                            stdout=True,
-                        )
-                    if d.update_firmware:
-                        if not d.firmware_update():
-                            logger.log(
-                                'error',
-                                d.name,
-                                'firmware update failed',
-                                stdout=True,
-                            )
-
-            d.ssh_close()
+        d.metrics = metrics
+        d.tracer = tracer
+        d.profiler = profiler
+        # parallel workers must not prompt on the terminal at once
+        d.interactive = args.jobs == 1
+    journal = None
+    # a replayed run changes nothing on the devices, it leaves the
+    # journal, staged.json, history.json and the textfile alone
+    if not args.dry_run and not args.replay:
+        journal_dir = logger.log_dir / 'journal'
+        if args.resume:
+            try:
+                journal = Journal.resume(
+                    journal_dir,
+                    args.resume,
+                    attempt=logger.run_id,
+                )
+            except FileNotFoundError as e:
+                print(e)
+                return 1
+            done = journal.summary()
+            logger.log(
+                'info',
+                'script',
+                f'resuming run {args.resume}: ' +
+                ', '.join(f'{step} {n}' for step, n in done.items()),
+                stdout=True,
+            )
         else:
-            print(f"Can't connect to {d.name}")
+            journal = Journal(journal_dir, logger.run_id)
+            logger.log(
+                'info',
+                'script',
+                f'run id {journal.run_id}, journal {journal.path}',
+            )
+        for d in devices:
+            d.journal = journal
+    recorder = Recorder(args.record) if args.record else None
+    if recorder:
+        for d in devices:
+            recorder.attach(d)
+    if args.replay:
+        replayer = Replayer(args.replay)
+        for d in devices:
+            try:
+                replayer.attach(d)
+            except (OSError, ValueError) as e:
+                print(f'No usable recording of {d.name}: {e}')
+                return 1
+        # the replayed backups are zero-filled and the exports redacted,
+        # they must not pass for the newest backups in backup_dir; the
+        # directory is removed once replay_backups is gone
+        import tempfile
+        replay_backups = tempfile.TemporaryDirectory(prefix='mu-replay-')
+        if cm.config:
+            cm.config.backup_dir = pathlib.Path(replay_backups.name)
+    conf = cm.config
+    unreachable: list['Device'] = []
+    # replayed devices are not connected to
+    if conf and conf.prescan_timeout and not args.replay:
+        devices, unreachable = prescan_devices(
+            devices,
+            conf.prescan_timeout,
+            logger,
+        )
+        if report:
+            for d in unreachable:
+                report.write(d)
+    staging = StagingRecord(
+        logger.log_dir / 'staged.json',
+        read_only=bool(args.replay),
+    )
+    history = History(logger.log_dir / 'history.json')
+    default: float = REBOOT_TIMEOUT
+    if conf and conf.reboot_timeout is not None:
+        default = conf.reboot_timeout
+    estimates = {d.name: history.estimate(d, default) for d in devices}
+    if conf is None or conf.adaptive_reboot:
+        for d in devices:
+            if history.adapt_reboot(d):
+                logger.log(
+                    'info',
+                    d.name,
+                    'reboot wait: first probe after ' +
+                    f'{d.reboot_first_probe}s, then every ' +
+                    f'{d.reboot_poll_interval}s, timeout {d.reboot_timeout}s',
+                    first_probe=d.reboot_first_probe,
+                    poll_interval=d.reboot_poll_interval,
+                    timeout=d.reboot_timeout,
+                )
+    if window is not None:
+        devices, skipped = fit_deadline(
+            devices,
+            estimates,
+            args.jobs,
+            window,
+        )
+        for d in skipped:
+            logger.log(
+                'warning',
+                d.name,
+                f'skipped, expected {format_seconds(estimates[d.name])} ' +
+                f'does not fit before {args.deadline}',
+                stdout=True,
+            )
+        if not devices:
+            print(f'No device fits before {args.deadline}!')
+            return 1
+    if history.devices and not args.dry_run:
+        expected = predict(
+            longest_first(devices, estimates),
+            estimates,
+            args.jobs,
+        )
+        logger.log(
+            'info',
+            'script',
+            f'expected duration of {len(devices)} devices with ' +
+            f'{args.jobs} jobs: {format_seconds(expected)}',
+            stdout=True,
+            expected=round(expected, 3),
+        )
+    # staging doesn't reboot, no need for canaries and waves
+    if conf and not args.dry_run and command != 'stage' and (
+        conf.waves or conf.site_concurrency or any(d.canary for d in devices)
+    ):
+        scheduler = WaveScheduler(
+            conf.waves,
+            logger,
+            jobs=args.jobs,
+            site_concurrency=conf.site_concurrency,
+            max_failure_rate=conf.max_failure_rate,
+            max_timeout_rate=conf.max_timeout_rate,
+            pause=conf.wave_pause,
+            estimates=estimates,
+        )
+    else:
+        scheduler = WaveScheduler(
+            [],
+            logger,
+            jobs=args.jobs,
+            estimates=estimates,
+        )
+    try:
+        completed = run_devices(
+            devices,
+            args,
+            logger,
+            scheduler,
+            staging,
+            report,
+        )
+    except KeyboardInterrupt:
+        logger.log('warning', 'script', 'interrupted', stdout=True)
+        if journal:
+            journal.close()
+            logger.log(
+                'info',
+                'script',
+                f'continue with --resume {journal.run_id}',
+                stdout=True,
+            )
+        if recorder:
+            recorder.close()
+        if tracer:
+            tracer.write(args.trace)
+        return 130
+    if recorder:
+        recorder.close()
+        logger.log(
+            'info',
+            'script',
+            f'sessions recorded to {args.record}',
+            stdout=True,
+        )
+    if journal:
+        journal.close()
+    if report:
+        report.close()
+        logger.log(
+            'info',
+            'script',
+            f'report written to {args.report}',
+            stdout=True,
+        )
+    # the unreachable devices show up in the summaries and the textfile
+    devices = devices + unreachable
+    if not args.dry_run and not args.replay:
+        # staging and activation take only part of an update
+        record_history(devices, history, durations=command is None)
+    print_phase_summary(devices, logger)
+    print_version_summary(devices, logger)
+    if args.dry_run:
+        print_device_summary(devices, logger)
+    if tracer:
+        tracer.write(args.trace)
+        logger.log(
+            'info',
+            'script',
+            f'trace written to {args.trace}',
+            stdout=True,
+        )
+    textfile = args.textfile or (cm.config.textfile if cm.config else None)
+    if textfile and not args.replay:
+        write_textfile(textfile, devices, run_started)
+        logger.log(
+            'info',
+            'script',
+            f'metrics textfile written to {textfile}',
+        )
+    print_command_summary(metrics, logger)
+    if args.metrics_file:
+        metrics.write(args.metrics_file, run_id=logger.run_id)
+        logger.log(
+            'info',
+            'script',
+            f'command metrics written to {args.metrics_file}',
+            stdout=True,
+        )
     logger.log('info', 'script', '======script completed======')
-    return 0
+    return 0 if completed else 1
 
 
 if __name__ == '__main__':
@@ -0,0 +1,199 @@
+import json
+import math
+import pathlib
+import re
+import threading
+from typing import Any
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+# RouterOS prints these instead of failing the ssh command
+ERROR_MARKERS = (
+    'failure:',
+    'syntax error',
+    'bad command name',
+    'expected end of command',
+    'input does not match',
+    'no such item',
+)
+# verbs taking a positional item name which must not end up in the key
+ITEM_VERBS = ('remove', 'enable', 'disable')
+_ARGUMENT = re.compile(r'(\S+=("[^"]*"|\S*)|\[.*\]|"[^"]*")')
+
+
+def normalize_command(remote_cmd: str) -> str:
+    """
+    Reduce a RouterOS command to its verb for grouping, e.g. \n
+    'system backup save name=x-20240101-1200' -> 'system backup save' \n
+    '/export show-sensitive' -> 'export show-sensitive' \n
+    'file remove x-20240101-1200.backup' -> 'file remove' \n
+    'system reboot\\ny' -> 'system reboot'
+    """
+    first_line = remote_cmd.split('\n', 1)[0]
+    first_line = _ARGUMENT.sub(' ', first_line)
+    words = first_line.replace('/', ' ').split()
+    for i, word in enumerate(words):
+        if word in ITEM_VERBS:
+            words = words[:i + 1]
+            break
+    return ' '.join(words)
+
+
+def output_failed(lines: list[str]) -> bool:
+    """Check the command output for RouterOS error messages."""
+    for line in lines:
+        lowered = line.lower()
+        for marker in ERROR_MARKERS:
+            if marker in lowered:
+                return True
+    return False
+
+
+class Histogram:
+    """Latency histogram with fixed bucket upper bounds."""
+    def __init__(self, bounds: tuple[float, ...] = BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the q-quantile (0-1) as the upper bound of the bucket
+        it falls into, capped by the largest observed value.
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'min': round(self.min, 6) if self.count else 0.0,
+            'max': round(self.max, 6),
+            'buckets': {
+                ('+Inf' if math.isinf(b) else str(b)): c
+                for b, c in zip(self.bounds, self.counts)
+            },
+        }
+
+
+class CommandStats:
+    """Statistics of one normalized command on one hardware model."""
+    def __init__(self, command: str, model: str) -> None:
+        self.command = command
+        self.model = model
+        self.calls = 0
+        self.failures = 0
+        self.bytes = 0
+        self.lines = 0
+        self.seconds = Histogram()
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'command': self.command,
+            'model': self.model,
+            'calls': self.calls,
+            'failures': self.failures,
+            'bytes': self.bytes,
+            'lines': self.lines,
+            'seconds': self.seconds.to_dict(),
+        }
+
+
+class CommandMetrics:
+    """
+    In-process registry of ssh_call statistics shared by all devices.
+    Safe to use from multiple threads.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.stats: dict[tuple[str, str], CommandStats] = {}
+
+    def record(
+            self,
+            remote_cmd: str,
+            model: str,
+            duration: float,
+            nbytes: int,
+            nlines: int,
+            ok: bool,
+    ) -> None:
+        command = normalize_command(remote_cmd)
+        with self._lock:
+            key = (command, model)
+            stats = self.stats.get(key)
+            if not stats:
+                stats = CommandStats(command, model)
+                self.stats[key] = stats
+            stats.calls += 1
+            if not ok:
+                stats.failures += 1
+            stats.bytes += nbytes
+            stats.lines += nlines
+            stats.seconds.observe(duration)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                'commands': [
+                    s.to_dict() for s in sorted(
+                        self.stats.values(),
+                        key=lambda s: (s.command, s.model),
+                    )
+                ],
+            }
+
+    def summary_lines(self) -> list[str]:
+        """Format a table sorted by total time spent, slowest first."""
+        with self._lock:
+            stats = sorted(
+                self.stats.values(),
+                key=lambda s: s.seconds.sum,
+                reverse=True,
+            )
+        if not stats:
+            return []
+        cmd_width = max(len('command'), *(len(s.command) for s in stats))
+        model_width = max(len('model'), *(len(s.model) for s in stats))
+        lines = [
+            f'{"command":<{cmd_width}} {"model":<{model_width}} '
+            f'{"calls":>6} {"fail":>5} {"avg":>8} {"p95":>8} {"max":>8} '
+            f'{"bytes":>10}',
+        ]
+        for s in stats:
+            h = s.seconds
+            lines.append(
+                f'{s.command:<{cmd_width}} {s.model:<{model_width}} '
+                f'{s.calls:>6} {s.failures:>5} '
+                f'{h.sum / h.count:>8.3f} {h.quantile(0.95):>8.3f} '
+                f'{h.max:>8.3f} {s.bytes:>10}',
+            )
+        return lines
+
+    def write(self, path: str | pathlib.Path, run_id: str = '') -> None:
+        """Write the metrics as a JSON document."""
+        data: dict[str, Any] = {'run_id': run_id}
+        data.update(self.to_dict())
+        with open(path, 'w') as stream:
+            json.dump(data, stream, indent=2)
+            stream.write('\n')
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import socket
+from collections.abc import Sequence
+
+# open connections at a time, well below the usual limit of 1024 files
+LIMIT = 500
+
+
+async def _probe(
+        host: str,
+        port: int,
+        timeout: float,
+        slots: asyncio.Semaphore,
+) -> str | None:
+    async with slots:
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port),
+                timeout,
+            )
+        except TimeoutError:
+            return f'no answer within {timeout:g}s'
+        except socket.gaierror as e:
+            return f'cannot resolve {host}: {e.strerror}'
+        except OSError as e:
+            # asyncio leaves strerror empty
+            return os.strerror(e.errno) if e.errno else str(e)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return None
+
+
+async def _scan(
+        targets: Sequence[tuple[str, int]],
+        timeout: float,
+        limit: int,
+) -> list[str | None]:
+    slots = asyncio.Semaphore(limit)
+    return await asyncio.gather(
+        *(_probe(host, port, timeout, slots) for host, port in targets),
+    )
+
+
+def prescan(
+        targets: Sequence[tuple[str, int]],
+        timeout: float = 3,
+        limit: int = LIMIT,
+) -> dict[tuple[str, int], str | None]:
+    """
+    Resolve and open a TCP connection to every (host, port) at once,
+    at most limit at a time, each given timeout seconds. Returns the
+    error of each target, None for the reachable ones. \n
+    The connections are closed right away, before any ssh traffic, so
+    all the dead devices of a fleet cost one timeout in total instead
+    of one timeout each.
+    """
+    unique = list(dict.fromkeys(targets))
+    results = asyncio.run(_scan(unique, timeout, limit))
+    return dict(zip(unique, results))
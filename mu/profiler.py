@@ -0,0 +1,102 @@
+import contextlib
+import cProfile
+import io
+import pathlib
+import pstats
+import re
+import threading
+from collections.abc import Iterator
+
+
+class Profiler:
+    """
+    cProfile based profiler which splits the collected statistics
+    per device and phase. \n
+    Only one cProfile profiler can be active at a time, so entering
+    a section pauses the enclosing profile and leaving it resumes it.
+    Time spent outside of any device phase (configuration loading,
+    scheduling, summaries) is collected as "script/main". \n
+    Sections are only switched on the thread which started the profiler,
+    phases running on other threads are not profiled, so mu profiles
+    with -j 1.
+    """
+    def __init__(self) -> None:
+        self.profiles: dict[tuple[str, str], cProfile.Profile] = {}
+        self._stack: list[cProfile.Profile] = []
+        self._owner: int | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        profile = self._get('script', 'main')
+        self._owner = threading.get_ident()
+        self._stack = [profile]
+        profile.enable()
+
+    def stop(self) -> None:
+        if self._stack:
+            self._stack[-1].disable()
+        self._stack = []
+        self._owner = None
+
+    @contextlib.contextmanager
+    def section(self, track: str, phase: str) -> Iterator[None]:
+        """Profile the enclosed block as the given device phase."""
+        if threading.get_ident() != self._owner or not self._stack:
+            yield
+            return
+        profile = self._get(track, phase)
+        self._stack[-1].disable()
+        self._stack.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1].enable()
+
+    def write(self, directory: str | pathlib.Path, top: int = 25) -> None:
+        """
+        Dump one "<device>.<phase>.pstats" file per section, an "all.pstats"
+        file with everything merged and a "summary.txt" with the top
+        functions of every section sorted by cumulative time.
+        """
+        path = pathlib.Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        merged: pstats.Stats | None = None
+        summary = io.StringIO()
+        for (track, phase), profile in sorted(self.profiles.items()):
+            try:
+                stats = pstats.Stats(profile)
+            except TypeError:
+                # nothing was collected in this section
+                continue
+            stats.dump_stats(
+                path / f'{_safe_name(track)}.{_safe_name(phase)}.pstats',
+            )
+            if merged is None:
+                merged = pstats.Stats(profile)
+            else:
+                merged.add(profile)
+            summary.write(f'===== {track} / {phase} =====\n')
+            stats.stream = summary  # type: ignore[attr-defined]
+            stats.sort_stats('cumulative').print_stats(top)
+        if merged is not None:
+            merged.dump_stats(path / 'all.pstats')
+            summary.write('===== all =====\n')
+            merged.stream = summary  # type: ignore[attr-defined]
+            merged.sort_stats('cumulative').print_stats(top)
+        (path / 'summary.txt').write_text(summary.getvalue())
+
+    def _get(self, track: str, phase: str) -> cProfile.Profile:
+        with self._lock:
+            profile = self.profiles.get((track, phase))
+            if profile is None:
+                profile = cProfile.Profile()
+                self.profiles[(track, phase)] = profile
+            return profile
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r'[^\w-]', '_', name) or '_'
@@ -0,0 +1,412 @@
+import collections
+import contextlib
+import gzip
+import io
+import json
+import pathlib
+import re
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+from typing import IO
+
+import paramiko
+from scp import SCPClient  # type: ignore
+
+from mu.device import Device
+
+FORMAT_VERSION = 1
+REDACTED = '<redacted>'
+# property names whose values are secrets, e.g. password=, secret=,
+# wpa2-pre-shared-key=, private-key=, passphrase=
+_SECRET = re.compile(
+    r'(?P<name>(?<![\w-])(?:[\w-]*-)?'
+    r'(?:password|passphrase|secret|key|psk))='
+    r'(?P<value>"(?:[^"\\]|\\.)*"|[^\s;]+)',
+)
+# the name of an snmp community is its secret: "snmp community set
+# 0 name=..." or the lines of the "/snmp community" export section
+_COMMUNITY = re.compile(r'snmp community\b(?:[^\n;]|\n(?!/))*')
+_COMMUNITY_NAME = re.compile(
+    r'(?P<name>(?<![\w-])name)=(?P<value>"(?:[^"\\]|\\.)*"|[^\s;]+)',
+)
+_TIMESTAMP = re.compile(r'(?<!\d)\d{8}-\d{4}(?!\d)')
+
+
+def redact(text: str) -> str:
+    """Replace the values of secret properties with <redacted>."""
+    text = _COMMUNITY.sub(
+        lambda m: _COMMUNITY_NAME.sub(_redacted, m.group()),
+        text,
+    )
+    return _SECRET.sub(_redacted, text)
+
+
+def _redact_lines(lines: list[str]) -> list[str]:
+    """
+    Redact command output as a whole, the "/snmp community" section
+    header is on another line than the community names.
+    """
+    return io.StringIO(redact(''.join(lines))).readlines()
+
+
+def _redacted(match: re.Match[str]) -> str:
+    return f'{match.group("name")}={REDACTED}'
+
+
+def command_key(command: str) -> str:
+    """
+    The key a command is replayed by: redacted, with the backup
+    timestamps (yyyymmdd-hhmm) replaced, so a replay at another time
+    finds the recorded "system backup save name=..." output.
+    """
+    return _TIMESTAMP.sub('<timestamp>', redact(command))
+
+
+def recording_path(directory: str | pathlib.Path, device: str) -> pathlib.Path:
+    safe = re.sub(r'[^\w.-]', '_', device) or '_'
+    return pathlib.Path(directory) / f'{safe}.jsonl.gz'
+
+
+class _Lines:
+    """Stand-in for the stdout of exec_command, only readlines is used."""
+    def __init__(self, lines: list[str]) -> None:
+        self._lines = lines
+
+    def readlines(self) -> list[str]:
+        return list(self._lines)
+
+    def read(self) -> bytes:
+        return ''.join(self._lines).encode()
+
+
+def _connect_error(err: Exception) -> str:
+    if isinstance(err, paramiko.AuthenticationException):
+        return 'auth'
+    if isinstance(err, paramiko.SSHException):
+        return 'ssh'
+    return 'os'
+
+
+class Recorder:
+    """
+    Records the ssh commands with their output, connection attempts
+    and scp transfer metadata of every attached device to
+    "<directory>/<device>.jsonl.gz", one JSON object per line.
+    Secrets are redacted from commands and output before writing.
+    """
+    def __init__(self, directory: str | pathlib.Path) -> None:
+        self.directory = pathlib.Path(directory)
+        self._streams: dict[str, IO[str]] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, device: Device) -> None:
+        """Make the device record everything it does over ssh and scp."""
+        device.client_factory = lambda: _RecordingClient(self, device.name)
+        device.scp_factory = lambda client, timeout: _RecordingSCP(
+            self,
+            device.name,
+            client,
+            timeout,
+        )
+
+    def record(self, device: str, event: dict[str, Any]) -> None:
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            stream = self._streams.get(device)
+            if stream is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                stream = gzip.open(
+                    recording_path(self.directory, device),
+                    'wt',
+                )
+                stream.write(
+                    json.dumps({
+                        'type': 'header',
+                        'version': FORMAT_VERSION,
+                        'device': device,
+                        'recorded': round(time.time(), 3),
+                    }) + '\n',
+                )
+                self._streams[device] = stream
+            stream.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            for stream in self._streams.values():
+                stream.close()
+            self._streams = {}
+
+
+class _RecordingClient:
+    """paramiko.SSHClient wrapper which records connects and commands."""
+    def __init__(self, recorder: Recorder, device: str) -> None:
+        self.recorder = recorder
+        self.device = device
+        self.client = paramiko.SSHClient()
+
+    def set_missing_host_key_policy(self, policy: Any) -> None:
+        self.client.set_missing_host_key_policy(policy)
+
+    def connect(self, **kwargs: Any) -> None:
+        start = time.monotonic()
+        event: dict[str, Any] = {'type': 'connect', 'ok': True}
+        try:
+            self.client.connect(**kwargs)
+        except Exception as err:
+            event['ok'] = False
+            event['error'] = _connect_error(err)
+            event['message'] = redact(str(err))
+            raise
+        finally:
+            event['dt'] = round(time.monotonic() - start, 4)
+            self.recorder.record(self.device, event)
+
+    def exec_command(
+            self,
+            command: str,
+            timeout: float | None = None,
+    ) -> tuple[Any, _Lines, Any]:
+        start = time.monotonic()
+        stdin, stdout, stderr = self.client.exec_command(
+            command,
+            timeout=timeout,
+        )
+        lines = stdout.readlines()
+        event = {
+            'type': 'exec',
+            'cmd': redact(command),
+            'out': _redact_lines(lines),
+            'dt': round(time.monotonic() - start, 4),
+        }
+        self.recorder.record(self.device, event)
+        return stdin, _Lines(lines), stderr
+
+    def get_transport(self) -> paramiko.Transport | None:
+        return self.client.get_transport()
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class _RecordingSCP:
+    """SCPClient wrapper which records name, size and duration."""
+    def __init__(
+            self,
+            recorder: Recorder,
+            device: str,
+            client: Any,
+            socket_timeout: float,
+    ) -> None:
+        self.recorder = recorder
+        self.device = device
+        self.scp = SCPClient(
+            client.get_transport(),
+            socket_timeout=socket_timeout,
+        )
+
+    def __enter__(self) -> '_RecordingSCP':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.scp.close()
+
+    def get(self, remote_path: str, local_path: Any = '') -> None:
+        with self._record('get', remote_path) as event:
+            self.scp.get(remote_path, local_path)
+            local = pathlib.Path(local_path or '.')
+            if local.is_dir():
+                local = local / pathlib.PurePosixPath(remote_path).name
+            event['size'] = local.stat().st_size
+
+    def put(self, files: Any, remote_path: str = '.') -> None:
+        with self._record('put', pathlib.Path(files).name) as event:
+            event['size'] = pathlib.Path(files).stat().st_size
+            self.scp.put(files, remote_path)
+
+    @contextlib.contextmanager
+    def _record(self, op: str, name: str) -> Iterator[dict[str, Any]]:
+        start = time.monotonic()
+        event: dict[str, Any] = {'type': 'scp', 'op': op, 'file': name}
+        try:
+            yield event
+        except Exception as err:
+            event['error'] = redact(str(err))
+            raise
+        finally:
+            event['dt'] = round(time.monotonic() - start, 4)
+            self.recorder.record(self.device, event)
+
+
+class Recording:
+    """
+    The recorded session of one device, consumed in order: every
+    command key and scp operation has its own queue of responses.
+    When a queue runs empty, its last response is repeated.
+    """
+    def __init__(self, events: list[dict[str, Any]]) -> None:
+        self.exec: dict[str, collections.deque[dict[str, Any]]] = {}
+        self.scp: dict[str, collections.deque[dict[str, Any]]] = {}
+        self.connects: collections.deque[dict[str, Any]] = collections.deque()
+        for event in events:
+            if event['type'] == 'exec':
+                self.exec.setdefault(
+                    command_key(event['cmd']),
+                    collections.deque(),
+                ).append(event)
+            elif event['type'] == 'scp':
+                self.scp.setdefault(
+                    event['op'],
+                    collections.deque(),
+                ).append(event)
+            elif event['type'] == 'connect':
+                self.connects.append(event)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path) -> 'Recording':
+        with gzip.open(path, 'rt') as stream:
+            events = [json.loads(line) for line in stream]
+        if events and events[0].get('type') == 'header':
+            if events[0].get('version') != FORMAT_VERSION:
+                raise ValueError(
+                    f'{path}: unsupported recording version '
+                    f'{events[0].get("version")}',
+                )
+        return cls(events)
+
+    def next_connect(self) -> dict[str, Any]:
+        """The next connection attempt, successful once they run out."""
+        with self._lock:
+            if self.connects:
+                return self.connects.popleft()
+            return {'type': 'connect', 'ok': True, 'dt': 0}
+
+    def next_exec(self, command: str) -> dict[str, Any]:
+        return self._next(self.exec, command_key(command))
+
+    def next_scp(self, op: str) -> dict[str, Any]:
+        return self._next(self.scp, op)
+
+    def _next(
+            self,
+            queues: dict[str, collections.deque[dict[str, Any]]],
+            key: str,
+    ) -> dict[str, Any]:
+        with self._lock:
+            queue = queues.get(key)
+            if not queue:
+                raise paramiko.SSHException(f'no recorded response for {key}')
+            if len(queue) > 1:
+                return queue.popleft()
+            return queue[0]
+
+
+class Replayer:
+    """
+    Feeds attached devices from the recordings in directory instead of
+    connecting to them. Recorded durations are skipped unless realtime
+    is set, and the reboot polling does not sleep, so a replay runs at
+    full speed.
+    """
+    def __init__(
+            self,
+            directory: str | pathlib.Path,
+            realtime: bool = False,
+    ) -> None:
+        self.directory = pathlib.Path(directory)
+        self.realtime = realtime
+        self.recordings: dict[str, Recording] = {}
+
+    def attach(self, device: Device) -> None:
+        """
+        Make the device use the recording of the same name.
+        Raises FileNotFoundError when there is none.
+        """
+        recording = Recording.load(recording_path(self.directory, device.name))
+        self.recordings[device.name] = recording
+        device.client_factory = lambda: ReplayClient(recording, self.realtime)
+        device.scp_factory = lambda client, timeout: ReplaySCP(
+            recording,
+            self.realtime,
+        )
+        if not self.realtime:
+            device.reboot_first_probe = 0
+            device.reboot_poll_interval = 0
+
+
+class ReplayClient:
+    """Stand-in for paramiko.SSHClient answering from a recording."""
+    def __init__(self, recording: Recording, realtime: bool = False) -> None:
+        self.recording = recording
+        self.realtime = realtime
+
+    def set_missing_host_key_policy(self, policy: Any) -> None:
+        pass
+
+    def connect(self, **kwargs: Any) -> None:
+        event = self.recording.next_connect()
+        _wait(event, self.realtime)
+        if event['ok']:
+            return
+        message = event.get('message', 'replayed connection failure')
+        if event.get('error') == 'auth':
+            raise paramiko.AuthenticationException(message)
+        if event.get('error') == 'ssh':
+            raise paramiko.SSHException(message)
+        raise OSError(message)
+
+    def exec_command(
+            self,
+            command: str,
+            timeout: float | None = None,
+    ) -> tuple[None, _Lines, None]:
+        event = self.recording.next_exec(command)
+        _wait(event, self.realtime)
+        return None, _Lines(event['out']), None
+
+    def get_transport(self) -> None:
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class ReplaySCP:
+    """
+    Stand-in for SCPClient. Downloads create a file of the recorded
+    size filled with zeros, uploads only check the recorded outcome.
+    """
+    def __init__(self, recording: Recording, realtime: bool = False) -> None:
+        self.recording = recording
+        self.realtime = realtime
+
+    def __enter__(self) -> 'ReplaySCP':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        pass
+
+    def get(self, remote_path: str, local_path: Any = '') -> None:
+        event = self._next('get')
+        local = pathlib.Path(local_path or '.')
+        if local.is_dir():
+            local = local / pathlib.PurePosixPath(remote_path).name
+        with open(local, 'wb') as stream:
+            stream.truncate(event.get('size', 0))
+
+    def put(self, files: Any, remote_path: str = '.') -> None:
+        self._next('put')
+
+    def _next(self, op: str) -> dict[str, Any]:
+        event = self.recording.next_scp(op)
+        _wait(event, self.realtime)
+        if 'error' in event:
+            raise paramiko.SSHException(event['error'])
+        return event
+
+
+def _wait(event: dict[str, Any], realtime: bool) -> None:
+    if realtime:
+        time.sleep(event.get('dt', 0))
@@ -0,0 +1,132 @@
+import csv
+import json
+import pathlib
+import threading
+from collections.abc import Sequence
+from typing import Any
+from typing import IO
+from typing import TYPE_CHECKING
+
+from mu.routeros import RouterOSVersion
+
+if TYPE_CHECKING:
+    from mu.device import Device
+
+FIELDS = (
+    'name',
+    'address',
+    'reachable',
+    'identity',
+    'model',
+    'channel',
+    'installed_version',
+    'latest_version',
+    'update_available',
+    'current_firmware',
+    'upgrade_firmware',
+    'packages',
+    'failures',
+)
+
+
+def device_row(d: 'Device') -> dict[str, Any]:
+    """What the run found out about the device, see FIELDS."""
+    return {
+        'name': d.name,
+        'address': d.address,
+        'reachable': 'connect' not in d.failures,
+        'identity': d.identity,
+        'model': d.model,
+        'channel': d.channel,
+        'installed_version': d.installed_version,
+        'latest_version': d.latest_version,
+        'update_available': d.update_available,
+        'current_firmware': d.current_firmware,
+        'upgrade_firmware': d.upgrade_firmware,
+        'packages': list(d.installed_packages),
+        'failures': sorted(d.failures),
+    }
+
+
+class Report:
+    """
+    One row per device written as soon as the device is done, as JSON
+    lines or, when the file name ends with .csv, as CSV (lists joined
+    with spaces). Each row is flushed, so the report can be followed
+    while the run goes on. Safe to use from the worker threads.
+    """
+    def __init__(self, path: str | pathlib.Path) -> None:
+        self.path = pathlib.Path(path)
+        self.csv = self.path.suffix.lower() == '.csv'
+        self._lock = threading.Lock()
+        self._stream: IO[str] = open(self.path, 'w', newline='')
+        self._writer: Any = None
+        if self.csv:
+            self._writer = csv.DictWriter(self._stream, FIELDS)
+            self._writer.writeheader()
+
+    def write(self, d: 'Device') -> None:
+        row = device_row(d)
+        with self._lock:
+            if self._writer:
+                self._writer.writerow({
+                    key: ' '.join(value) if isinstance(value, list)
+                    else value
+                    for key, value in row.items()
+                })
+            else:
+                self._stream.write(json.dumps(row) + '\n')
+            self._stream.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._stream.close()
+
+
+def _status(row: dict[str, Any]) -> str:
+    if not row['reachable']:
+        return 'unreachable'
+    if row['failures']:
+        return 'failed'
+    if row['update_available']:
+        return 'update'
+    if row['current_firmware'] != row['upgrade_firmware']:
+        return 'firmware'
+    return 'ok'
+
+
+# order of the statuses in the summary, the ones to act on first
+STATUSES = ('update', 'firmware', 'failed', 'unreachable', 'ok')
+
+
+def summary_lines(rows: Sequence[dict[str, Any]]) -> list[str]:
+    """
+    A table of the rows sorted by status (see STATUSES), then by
+    installed version, oldest first, then by name.
+    """
+    if not rows:
+        return []
+
+    def key(row: dict[str, Any]) -> tuple:
+        try:
+            version: tuple = (
+                0,
+                RouterOSVersion.parse(row['installed_version']),
+            )
+        except ValueError:
+            version = (1, row['installed_version'])
+        return (STATUSES.index(_status(row)), version, row['name'])
+
+    ordered = sorted(rows, key=key)
+    width = max(len('device'), *(len(row['name']) for row in ordered))
+    lines = [
+        f'{"device":<{width}} {"status":<11} {"installed":>12} '
+        f'{"latest":>12} {"firmware":>12}',
+    ]
+    for row in ordered:
+        lines.append(
+            f'{row["name"]:<{width}} {_status(row):<11} '
+            f'{row["installed_version"]:>12} {row["latest_version"]:>12} '
+            f'{row["current_firmware"]:>12}',
+        )
+    return lines
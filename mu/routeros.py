@@ -0,0 +1,169 @@
+import functools
+import re
+from collections.abc import Collection
+from collections.abc import Iterable
+
+_VERSION = re.compile(
+    r'(?P<major>\d+)(?:\.(?P<minor>\d+))?(?:\.(?P<patch>\d+))?'
+    r'(?:(?P<stage>alpha|beta|rc)(?P<number>\d*))?',
+)
+# pre-release stages sort before the release of the same version
+_STAGES = {'alpha': 0, 'beta': 1, 'rc': 2, None: 3}
+
+
+@functools.lru_cache(maxsize=256)
+def _is_key(name: str) -> bool:
+    """Property names are lower case words joined by "-" (or .id)."""
+    return (
+        name[:1].islower() or name[:1] == '.'
+    ) and name.replace('-', '').replace('.', '').isalnum()
+
+
+def _unquote(value: str) -> str:
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return value
+
+
+def _value(line: str, start: int) -> str:
+    """The value starting at start, up to the next " name=" token."""
+    eq = line.find('=', start)
+    while eq != -1:
+        end = line.rfind(' ', start, eq)
+        if end != -1 and _is_key(line[end + 1:eq]):
+            return _unquote(line[start:end].strip())
+        eq = line.find('=', eq + 1)
+    return _unquote(line[start:].strip())
+
+
+def _parse_keys(
+        lines: Iterable[str],
+        keys: Collection[str],
+) -> list[dict[str, str]]:
+    needles = [(key, f' {key}=') for key in keys]
+    items = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.lstrip()[:1].isdigit():
+            continue
+        item = {}
+        for key, needle in needles:
+            pos = line.find(needle)
+            if pos != -1:
+                item[key] = _value(line, pos + len(needle))
+        if item:
+            items.append(item)
+    return items
+
+
+def parse_terse(
+        lines: Iterable[str],
+        keys: Collection[str] | None = None,
+) -> list[dict[str, str]]:
+    """
+    Parse the output of a "print terse" command into one dict per item,
+    keyed by property name. The item number and flags are available
+    as ".index" and ".flags". Values may contain spaces and "=", a new
+    property starts at every " name=" token. \n
+    With keys, only those properties are looked up (without ".index"
+    and ".flags") and the rest of the line is not parsed. \n
+    example: \n
+    ' 0 X name=wireless version=7.15' -> \n
+    {'.index': '0', '.flags': 'X', 'name': 'wireless', 'version': '7.15'}
+    """
+    if keys is not None:
+        return _parse_keys(lines, keys)
+    items = []
+    for line in lines:
+        chunks = line.strip().split('=')
+        if len(chunks) < 2:
+            continue
+        head, _, key = chunks[0].rpartition(' ')
+        index, _, flags = head.strip().partition(' ')
+        if not index.isdigit() or not _is_key(key):
+            continue
+        item = {'.index': index, '.flags': flags.strip()}
+        value = []
+        for chunk in chunks[1:-1]:
+            text, _, name = chunk.rpartition(' ')
+            if text and _is_key(name):
+                value.append(text)
+                item[key] = _unquote('='.join(value).strip())
+                key = name
+                value = []
+            else:
+                value.append(chunk)
+        value.append(chunks[-1])
+        item[key] = _unquote('='.join(value).strip())
+        items.append(item)
+    return items
+
+
+def parse_properties(lines: Iterable[str]) -> dict[str, str]:
+    """
+    Parse "key: value" output of single item commands (identity,
+    routerboard, resource, package update) into a dict. When a key
+    repeats, e.g. the status lines of check-for-updates, the last
+    value wins. \n
+    example: \n
+    ['  channel: stable', '  installed-version: 7.15'] -> \n
+    {'channel': 'stable', 'installed-version': '7.15'}
+    """
+    result = {}
+    for line in lines:
+        key, sep, value = line.partition(':')
+        if not sep:
+            continue
+        key = key.strip()
+        if key and _is_key(key):
+            result[key] = value.strip()
+    return result
+
+
+@functools.total_ordering
+class RouterOSVersion:
+    """
+    A parsed RouterOS version string which compares by its numeric
+    sort key (major, minor, patch, stage, stage number), so
+    7.9 < 7.10 and 7.16beta2 < 7.16rc1 < 7.16 < 7.16.1. \n
+    Use RouterOSVersion.parse() to get a cached instance.
+    Raises ValueError when text is not a version.
+    """
+    __slots__ = ('text', 'key')
+
+    def __init__(self, text: str) -> None:
+        match = _VERSION.fullmatch(text.strip())
+        if not match:
+            raise ValueError(f'not a RouterOS version: {text!r}')
+        self.text = text
+        self.key = (
+            int(match['major']),
+            int(match['minor'] or 0),
+            int(match['patch'] or 0),
+            _STAGES[match['stage']],
+            int(match['number'] or 0),
+        )
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def parse(text: str) -> 'RouterOSVersion':
+        return RouterOSVersion(text)
+
+    def __repr__(self) -> str:
+        return f'RouterOSVersion({self.text!r})'
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, RouterOSVersion):
+            return NotImplemented
+        return self.key == other.key
+
+    def __lt__(self, other: object) -> bool:
+        if not isinstance(other, RouterOSVersion):
+            return NotImplemented
+        return self.key < other.key
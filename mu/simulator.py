@@ -0,0 +1,724 @@
+import argparse
+import pathlib
+import random
+import re
+import shlex
+import socket
+import threading
+import time
+from collections.abc import Sequence
+from typing import Any
+
+import paramiko
+import yaml
+from paramiko.common import AUTH_FAILED
+from paramiko.common import AUTH_SUCCESSFUL
+from paramiko.common import OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+from paramiko.common import OPEN_SUCCEEDED
+
+from mu.routeros import RouterOSVersion
+
+DEFAULT_LATEST = {
+    'stable': '7.16',
+    'long-term': '6.49.17',
+    'testing': '7.17beta2',
+    'development': '7.17beta2',
+}
+NPK_NAME = re.compile(
+    r'^(?P<name>[a-z][\w-]*?)-(?P<version>\d[\w.]*)-.*\.npk$',
+)
+
+
+def _size_str(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f'{size / 1024 / 1024:.1f}MiB'
+    if size >= 1024:
+        return f'{size / 1024:.1f}KiB'
+    return str(size)
+
+
+def _table(columns: Sequence[str], rows: Sequence[Sequence[str]]) -> list[str]:
+    """Format a RouterOS 7 style table with the Columns: header."""
+    header = ['#', *columns]
+    widths = [len(h) for h in header]
+    body = []
+    for i, row in enumerate(rows):
+        cells = [str(i), *row]
+        widths = [max(w, len(c)) for w, c in zip(widths, cells)]
+        body.append(cells)
+    lines = [f'Columns: {", ".join(columns)}']
+    for cells in [header, *body]:
+        lines.append(
+            ' '.join(c.ljust(w) for c, w in zip(cells, widths)).rstrip(),
+        )
+    return lines
+
+
+def _list(
+        columns: Sequence[str],
+        rows: Sequence[Sequence[str]],
+        terse: bool,
+) -> list[str]:
+    """Format the output of a print command, as a table or "print terse"."""
+    if not terse:
+        return _table(columns, rows)
+    return [
+        f' {i}   ' + ' '.join(
+            f'{c.lower()}={v}' for c, v in zip(columns, row)
+        )
+        for i, row in enumerate(rows)
+    ]
+
+
+def _properties(items: Sequence[tuple[str, str]]) -> list[str]:
+    """Format "key: value" lines right aligned on the colon."""
+    width = max(len(k) for k, _ in items)
+    return [f'{k.rjust(width)}: {v}' for k, v in items]
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, router: 'SimulatedRouter') -> None:
+        self.router = router
+
+    def get_allowed_auths(self, username: str) -> str:
+        return 'publickey,password'
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        return AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        if self.router.users.get(username) == password:
+            return AUTH_SUCCESSFUL
+        return AUTH_FAILED
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        if kind == 'session':
+            return OPEN_SUCCEEDED
+        return OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(
+            self,
+            channel: paramiko.Channel,
+            command: bytes,
+    ) -> bool:
+        threading.Thread(
+            target=self.router.handle_exec,
+            args=(channel, command.decode()),
+            daemon=True,
+        ).start()
+        return True
+
+
+class SimulatedRouter:
+    """
+    A fake RouterOS device listening for SSH on localhost. \n
+    Answers the commands used by mu.device and mu.userregistrator,
+    implements scp get/put and simulates reboots by closing the port
+    for boot_time seconds. latency is added to the handshake and
+    to every command, bandwidth (bytes/s, 0 = unlimited) limits scp
+    transfers and package downloads. Commands starting with one of
+    the hang prefixes never answer, like a wedged device. \n
+    Every executed command is appended to self.commands.
+    """
+    def __init__(
+            self,
+            name: str,
+            port: int = 0,
+            host: str = '127.0.0.1',
+            version: str = '7.15',
+            latest: dict[str, str] | None = None,
+            channel: str = 'stable',
+            model: str = 'RB5009UG+S+',
+            architecture: str = 'arm64',
+            firmware: str | None = None,
+            extra_packages: Sequence[str] = (),
+            boot_time: float = 1.0,
+            boot_jitter: float = 0.0,
+            latency: float = 0.0,
+            bandwidth: int = 0,
+            backup_size: int = 64 * 1024,
+            package_size: int = 12 * 1024 * 1024,
+            users: dict[str, str] | None = None,
+            host_key: paramiko.PKey | None = None,
+            hang: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.identity = name
+        self.host = host
+        self.port = port
+        self.latest = dict(latest or DEFAULT_LATEST)
+        self.channel = channel
+        self.model = model
+        self.architecture = architecture
+        self.packages = {'routeros': version}
+        for package in extra_packages:
+            self.packages[package] = version
+        self.current_firmware = firmware or version
+        self.upgrade_firmware = version
+        self.firmware_upgrade_pending = False
+        self.auto_upgrade = False
+        self.downloaded_version: str | None = None
+        self.boot_time = boot_time
+        self.boot_jitter = boot_jitter
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.backup_size = backup_size
+        self.package_size = package_size
+        self.hang = tuple(hang)
+        self.users = dict(users or {'admin': ''})
+        self.ssh_keys: list[tuple[str, str]] = []
+        self.files: dict[str, bytes] = {}
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self.commands: list[str] = []
+        self.reboots = 0
+        self.booted_at = time.time()
+        self._lock = threading.RLock()
+        self._listener: socket.socket | None = None
+        self._transports: set[paramiko.Transport] = set()
+        self._stopped = threading.Event()
+        self._up = threading.Event()
+
+    @property
+    def installed_version(self) -> str:
+        return self.packages['routeros']
+
+    @property
+    def is_up(self) -> bool:
+        return self._up.is_set()
+
+    def start(self) -> None:
+        """Start listening. With port 0 a free port is picked."""
+        self._stopped.clear()
+        self._listen()
+
+    def stop(self) -> None:
+        """Close the port and all connections for good."""
+        self._stopped.set()
+        self._go_down()
+
+    def wait_up(self, timeout: float | None = None) -> bool:
+        return self._up.wait(timeout)
+
+    def reboot(self, downgrade: bool = False) -> None:
+        """Go down, apply pending changes and come back after boot_time."""
+        self._go_down()
+        with self._lock:
+            self.reboots += 1
+            self._apply_pending(downgrade)
+        boot_time = self.boot_time
+        if self.boot_jitter:
+            boot_time *= random.uniform(
+                1 - self.boot_jitter,
+                1 + self.boot_jitter,
+            )
+        if self._stopped.wait(boot_time):
+            return
+        self.booted_at = time.time()
+        self._listen()
+
+    def _listen(self) -> None:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(64)
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        self._up.set()
+        threading.Thread(
+            target=self._accept,
+            args=(listener,),
+            name=f'sim-{self.name}',
+            daemon=True,
+        ).start()
+
+    def _go_down(self) -> None:
+        self._up.clear()
+        listener, self._listener = self._listener, None
+        if listener:
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            listener.close()
+        with self._lock:
+            transports, self._transports = self._transports, set()
+        for transport in transports:
+            transport.close()
+
+    def _accept(self, listener: socket.socket) -> None:
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self._serve,
+                args=(sock,),
+                daemon=True,
+            ).start()
+
+    def _serve(self, sock: socket.socket) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        # port probes (mu.prescan) hang up before the ssh banner
+        try:
+            probe = not sock.recv(1, socket.MSG_PEEK)
+        except OSError:
+            probe = True
+        if probe:
+            sock.close()
+            return
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        with self._lock:
+            if not self.is_up:
+                sock.close()
+                return
+            self._transports.add(transport)
+        try:
+            transport.start_server(server=_ServerInterface(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+    def handle_exec(self, channel: paramiko.Channel, command: str) -> None:
+        """Run one exec request on its own thread."""
+        with self._lock:
+            self.commands.append(command)
+        if self.hang and command.startswith(self.hang):
+            self._stopped.wait()
+            return
+        after: str | None = None
+        try:
+            if command.startswith('scp '):
+                self._scp(channel, command)
+            else:
+                if self.latency:
+                    time.sleep(self.latency)
+                lines, after = self.execute(command)
+                channel.sendall(
+                    ''.join(f'{line}\r\n' for line in lines).encode(),
+                )
+            channel.send_exit_status(0)
+            # Only signal EOF, closing the channel could overtake the reply
+            # to the exec request. The client closes the channel.
+            channel.shutdown_write()
+        except (OSError, EOFError, paramiko.SSHException):
+            channel.close()
+            return
+        if after in ('reboot', 'downgrade'):
+            # let the client read the output before the connection drops
+            self._stopped.wait(0.1)
+            threading.Thread(
+                target=self.reboot,
+                args=(after == 'downgrade',),
+                daemon=True,
+            ).start()
+
+    def execute(self, command: str) -> tuple[list[str], str | None]:
+        """
+        Return the output lines of a CLI command and the action
+        to take once the output was sent ("reboot", "downgrade").
+        """
+        first_line = command.split('\n', 1)[0].strip().lstrip('/')
+        try:
+            tokens = shlex.split(first_line)
+        except ValueError:
+            return ['syntax error (line 1 column 1)'], None
+        words = [t for t in tokens if '=' not in t]
+        args = dict(t.split('=', 1) for t in tokens if '=' in t)
+        terse = len(words) > 1 and words[-2:] == ['print', 'terse']
+        if terse:
+            words.pop()
+        path = ' '.join(words)
+        with self._lock:
+            return self._dispatch(path, words, args, terse)
+
+    def _dispatch(
+            self,
+            path: str,
+            words: list[str],
+            args: dict[str, str],
+            terse: bool = False,
+    ) -> tuple[list[str], str | None]:
+        if path == 'system identity print':
+            return [f'  name: {self.identity}'], None
+        if path == 'system identity set':
+            self.identity = args.get('name', self.identity)
+            return [], None
+        if path == 'system resource print':
+            return _properties([
+                ('uptime', f'{int(time.time() - self.booted_at)}s'),
+                ('version', f'{self.installed_version} (stable)'),
+                ('architecture-name', self.architecture),
+                ('board-name', self.model),
+                ('platform', 'MikroTik'),
+            ]), None
+        if path == 'system package print':
+            return _list(
+                ['NAME', 'VERSION', 'BUILD-TIME', 'SIZE'],
+                [
+                    (n, v, '2024-01-01 00:00:00', '12.5MiB')
+                    for n, v in self.packages.items()
+                ],
+                terse,
+            ), None
+        if path == 'system package update print':
+            return _properties([
+                ('channel', self.channel),
+                ('installed-version', self.installed_version),
+            ]), None
+        if path == 'system package update set':
+            if 'channel' not in args:
+                return ['expected end of command (line 1 column 27)'], None
+            if args['channel'] not in self.latest:
+                return [
+                    'input does not match any value of channel',
+                ], None
+            self.channel = args['channel']
+            return [], None
+        if path == 'system package update check-for-updates':
+            return self._check_for_updates(), None
+        if path == 'system package update download':
+            return self._download(), None
+        if path == 'system package downgrade':
+            return [
+                'Router will be rebooted. Continue? [y/N]:',
+                'y',
+                'system will reboot shortly',
+            ], 'downgrade'
+        if path == 'system reboot':
+            return [
+                'Reboot, yes? [y/N]:',
+                'y',
+                'system will reboot shortly',
+            ], 'reboot'
+        if path == 'system backup save':
+            name = args.get('name', self.identity)
+            self.files[f'{name}.backup'] = random.randbytes(self.backup_size)
+            return ['Configuration backup saved'], None
+        if path == 'export show-sensitive':
+            return self._export(), None
+        if path == 'file print':
+            return _list(
+                ['NAME', 'TYPE', 'SIZE', 'CREATION-TIME'],
+                [
+                    (
+                        n,
+                        n.rsplit('.', 1)[-1] + ' file',
+                        _size_str(len(c)),
+                        '2024-01-01 00:00:00',
+                    )
+                    for n, c in self.files.items()
+                ],
+                terse,
+            ), None
+        if path.startswith('file remove') and len(words) > 2:
+            name = words[2]
+            if name not in self.files:
+                return ['no such item'], None
+            del self.files[name]
+            return [], None
+        if path == 'system routerboard print':
+            return _properties([
+                ('routerboard', 'yes'),
+                ('model', self.model),
+                ('serial-number', 'HD0000000' + str(self.port)),
+                ('firmware-type', 'sim'),
+                ('factory-firmware', '7.0'),
+                ('current-firmware', self.current_firmware),
+                ('upgrade-firmware', self.upgrade_firmware),
+            ]), None
+        if path == 'system routerboard upgrade':
+            self.firmware_upgrade_pending = True
+            return [
+                'echo: system,info,critical Firmware upgraded '
+                'successfully, please reboot for changes to take effect!',
+            ], None
+        if path == 'system routerboard settings print':
+            return _properties([
+                ('auto-upgrade', 'yes' if self.auto_upgrade else 'no'),
+            ]), None
+        if path == 'system routerboard settings set':
+            if 'auto-upgrade' in args:
+                self.auto_upgrade = args['auto-upgrade'] == 'yes'
+            return [], None
+        if path == 'user print':
+            return _list(
+                ['NAME', 'GROUP', 'LAST-LOGGED-IN'],
+                [(u, 'full', '') for u in self.users],
+                terse,
+            ), None
+        if path == 'user add':
+            if args.get('group', 'full') not in ('full', 'read', 'write'):
+                return ['input does not match any value of group'], None
+            self.users[args['name']] = args.get('password', '')
+            return [], None
+        if path == 'user ssh-keys import':
+            key_file = args.get('public-key-file', '')
+            if key_file not in self.files:
+                return ['failure: unable to load key file'], None
+            del self.files[key_file]
+            self.ssh_keys.append((args.get('user', ''), key_file))
+            return [], None
+        error = f'bad command name {words[0] if words else ""} ' + \
+            '(line 1 column 1)'
+        return [error], None
+
+    def _check_for_updates(self) -> list[str]:
+        latest = self.latest.get(self.channel, self.installed_version)
+        if self.downloaded_version:
+            status = 'Downloaded, please reboot'
+        elif RouterOSVersion.parse(self.installed_version) < \
+                RouterOSVersion.parse(latest):
+            status = 'New version is available'
+        else:
+            status = 'System is already up to date'
+        return _properties([
+            ('channel', self.channel),
+            ('installed-version', self.installed_version),
+            ('latest-version', latest),
+            ('status', status),
+        ])
+
+    def _download(self) -> list[str]:
+        latest = self.latest.get(self.channel, self.installed_version)
+        if RouterOSVersion.parse(self.installed_version) >= \
+                RouterOSVersion.parse(latest):
+            return _properties([
+                ('channel', self.channel),
+                ('installed-version', self.installed_version),
+                ('status', 'System is already up to date'),
+            ])
+        if self.bandwidth:
+            time.sleep(self.package_size / self.bandwidth)
+        self.downloaded_version = latest
+        return _properties([
+            ('channel', self.channel),
+            ('installed-version', self.installed_version),
+            ('latest-version', latest),
+            ('status', 'Downloaded, please reboot'),
+        ])
+
+    def _export(self) -> list[str]:
+        return [
+            f'# 2024-01-01 00:00:00 by RouterOS {self.installed_version}',
+            '# software id = SIM0-0000',
+            '#',
+            f'# model = {self.model}',
+            '/interface wireless security-profiles',
+            'set [ find default=yes ] authentication-types=wpa2-psk '
+            'mode=dynamic-keys wpa2-pre-shared-key=simulated-secret',
+            '/snmp community',
+            'set [ find default=yes ] name=simulated-community',
+            '/system identity',
+            f'set name={self.identity}',
+        ]
+
+    def _apply_pending(self, downgrade: bool) -> None:
+        if self.downloaded_version:
+            for package in self.packages:
+                self.packages[package] = self.downloaded_version
+            self.downloaded_version = None
+        for file_name in list(self.files):
+            match = NPK_NAME.match(file_name)
+            if not match:
+                continue
+            del self.files[file_name]
+            name = match.group('name')
+            version = match.group('version')
+            current = self.packages.get(name)
+            if current is None or downgrade or \
+                    RouterOSVersion.parse(version) >= \
+                    RouterOSVersion.parse(current):
+                self.packages[name] = version
+        routeros = self.installed_version
+        if self.upgrade_firmware != routeros:
+            self.upgrade_firmware = routeros
+            if self.auto_upgrade:
+                # auto-upgrade flashes the new firmware during this boot,
+                # it becomes active after the next reboot
+                self.firmware_upgrade_pending = True
+                return
+        if self.firmware_upgrade_pending:
+            self.current_firmware = self.upgrade_firmware
+            self.firmware_upgrade_pending = False
+
+    def _scp(self, channel: paramiko.Channel, command: str) -> None:
+        args = shlex.split(command)[1:]
+        chunk = 32 * 1024
+        if '-f' in args:
+            name = args[-1].lstrip('/')
+            if channel.recv(1) != b'\x00':
+                return
+            with self._lock:
+                data = self.files.get(name)
+            if data is None:
+                channel.sendall(f'\x01scp: {name}: No such file\n'.encode())
+                return
+            channel.sendall(f'C0644 {len(data)} {name}\n'.encode())
+            if channel.recv(1) != b'\x00':
+                return
+            for offset in range(0, len(data), chunk):
+                channel.sendall(data[offset:offset + chunk])
+                self._throttle(min(chunk, len(data) - offset))
+            channel.sendall(b'\x00')
+            channel.recv(1)
+        elif '-t' in args:
+            channel.sendall(b'\x00')
+            while True:
+                header = self._recv_line(channel)
+                if not header:
+                    return
+                if header.startswith('T'):
+                    channel.sendall(b'\x00')
+                    continue
+                if not header.startswith('C'):
+                    channel.sendall(b'\x01unsupported\n')
+                    return
+                _, size_str, name = header[1:].split(' ', 2)
+                size = int(size_str)
+                channel.sendall(b'\x00')
+                received = bytearray()
+                while len(received) < size:
+                    data = channel.recv(min(chunk, size - len(received)))
+                    if not data:
+                        return
+                    received += data
+                    self._throttle(len(data))
+                channel.recv(1)
+                with self._lock:
+                    self.files[name] = bytes(received)
+                channel.sendall(b'\x00')
+        else:
+            channel.sendall(b'\x01scp: unsupported mode\n')
+
+    def _throttle(self, nbytes: int) -> None:
+        if self.bandwidth:
+            time.sleep(nbytes / self.bandwidth)
+
+    @staticmethod
+    def _recv_line(channel: paramiko.Channel) -> str:
+        line = bytearray()
+        while True:
+            char = channel.recv(1)
+            if not char:
+                return ''
+            if char == b'\n':
+                return line.decode()
+            line += char
+
+
+class Fleet:
+    """
+    A group of simulated routers on consecutive (or free) localhost
+    ports sharing one host key. Usable as a context manager.
+    """
+    def __init__(
+            self,
+            count: int,
+            base_port: int = 0,
+            name_prefix: str = 'sim',
+            **router_kwargs: Any,
+    ) -> None:
+        host_key = router_kwargs.pop('host_key', None) or \
+            paramiko.RSAKey.generate(2048)
+        self.routers = [
+            SimulatedRouter(
+                name=f'{name_prefix}{i + 1:04d}',
+                port=base_port + i if base_port else 0,
+                host_key=host_key,
+                **router_kwargs,
+            )
+            for i in range(count)
+        ]
+
+    def start(self) -> None:
+        for router in self.routers:
+            router.start()
+
+    def stop(self) -> None:
+        for router in self.routers:
+            router.stop()
+
+    def __enter__(self) -> 'Fleet':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def config(self, **global_options: Any) -> dict[str, Any]:
+        """A mu configuration (as loaded from YAML) for this fleet."""
+        gl: dict[str, Any] = {
+            'backup_dir': 'backups',
+            'private_key_file': '',
+            'username': 'mu',
+            'reboot_timeout': 600,
+        }
+        gl.update(global_options)
+        return {
+            'global': gl,
+            'devices': [
+                {'name': r.name, 'address': r.host, 'port': r.port}
+                for r in self.routers
+            ],
+        }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='mu_simulator',
+        description='Run simulated RouterOS devices on localhost.',
+    )
+    parser.add_argument('-n', '--count', type=int, default=1)
+    parser.add_argument('--base-port', type=int, default=0)
+    parser.add_argument('--version', default='7.15')
+    parser.add_argument('--model', default='RB5009UG+S+')
+    parser.add_argument('--boot-time', type=float, default=5.0)
+    parser.add_argument('--boot-jitter', type=float, default=0.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument(
+        '--bandwidth', type=int, default=0,
+        help='bytes per second, 0 is unlimited',
+    )
+    parser.add_argument(
+        '--config',
+        help='write a mu configuration file for the simulated fleet',
+    )
+    parser.add_argument('--private-key', default='')
+    parser.add_argument('--backup-dir', default='backups')
+    args = parser.parse_args(argv)
+    fleet = Fleet(
+        args.count,
+        base_port=args.base_port,
+        version=args.version,
+        model=args.model,
+        boot_time=args.boot_time,
+        boot_jitter=args.boot_jitter,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+    )
+    fleet.start()
+    print(
+        f'{args.count} simulated devices listening on ports '
+        f'{fleet.routers[0].port}-{fleet.routers[-1].port}',
+    )
+    if args.config:
+        data = fleet.config(
+            private_key_file=args.private_key,
+            backup_dir=args.backup_dir,
+        )
+        pathlib.Path(args.config).write_text(yaml.safe_dump(data))
+        print(f'configuration written to {args.config}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fleet.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
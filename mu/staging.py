@@ -0,0 +1,66 @@
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Any
+
+
+class StagingRecord:
+    """
+    The devices with an update staged by "mu stage" and waiting for
+    "mu activate", kept in a JSON file (by default
+    "<log_dir>/staged.json"): \n
+    {"ap1": {"ts": 1714550000.0, "type": "online", "version": "7.16"}}
+    \n
+    The file is rewritten atomically on every change, so a device is
+    never recorded as staged before its download or upload finished.
+    A missing or broken file is an empty record. With read_only, the
+    changes stay in memory (replayed runs).
+    """
+    def __init__(
+            self,
+            path: str | pathlib.Path,
+            read_only: bool = False,
+    ) -> None:
+        self.path = pathlib.Path(path)
+        self.read_only = read_only
+        self.devices: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self.devices = {
+                name: entry for name, entry in data.items()
+                if isinstance(entry, dict)
+            }
+
+    def get(self, name: str) -> dict[str, Any] | None:
+        """What is staged on the device, None if nothing."""
+        with self._lock:
+            entry = self.devices.get(name)
+            return dict(entry) if entry else None
+
+    def mark(self, name: str, **fields: Any) -> None:
+        """Record the update staged on the device."""
+        with self._lock:
+            self.devices[name] = {'ts': round(time.time(), 3), **fields}
+            self._save()
+
+    def clear(self, name: str) -> None:
+        """Forget the device, its staged update was activated."""
+        with self._lock:
+            if self.devices.pop(name, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        if self.read_only:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w') as stream:
+            json.dump(self.devices, stream, indent=1)
+        os.replace(tmp, self.path)
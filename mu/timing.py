@@ -0,0 +1,71 @@
+import math
+from collections.abc import Iterable
+from collections.abc import Sequence
+
+PHASES = (
+    'connect',
+    'identity',
+    'check',
+    'backup',
+    'download',
+    'export',
+    'package-download',
+    'upload',
+    'reboot-wait',
+    'reconnect',
+    'firmware',
+    'update',
+)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Return the pct-th percentile (0-100) of values using linear
+    interpolation between the closest ranks.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def merge_timings(
+        timings: Iterable[dict[str, list[float]]],
+) -> dict[str, list[float]]:
+    """Merge per-device phase timings into fleet-wide lists."""
+    merged: dict[str, list[float]] = {}
+    for device_timings in timings:
+        for phase, durations in device_timings.items():
+            merged.setdefault(phase, []).extend(durations)
+    return merged
+
+
+def summary_lines(timings: dict[str, list[float]]) -> list[str]:
+    """
+    Format a table with count, p50, p95, max and total time (seconds)
+    for every phase. Known phases come first in execution order.
+    """
+    phases = [p for p in PHASES if p in timings]
+    phases += sorted(p for p in timings if p not in PHASES)
+    if not phases:
+        return []
+    width = max(len('phase'), *(len(p) for p in phases))
+    lines = [
+        f'{"phase":<{width}} {"count":>6} {"p50":>9} {"p95":>9} '
+        f'{"max":>9} {"total":>10}',
+    ]
+    for phase in phases:
+        durations = timings[phase]
+        lines.append(
+            f'{phase:<{width}} {len(durations):>6} '
+            f'{percentile(durations, 50):>9.2f} '
+            f'{percentile(durations, 95):>9.2f} '
+            f'{max(durations):>9.2f} '
+            f'{sum(durations):>10.2f}',
+        )
+    return lines
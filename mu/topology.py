@@ -0,0 +1,106 @@
+from collections.abc import Mapping
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from mu.device import Device
+
+
+def upstream_names(value: str | Sequence[str] | None) -> list[str]:
+    """The upstream option of a device: one name, a list or nothing."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(name) for name in value]
+
+
+def find_cycle(upstream: Mapping[str, Sequence[str]]) -> list[str] | None:
+    """
+    Return a dependency cycle as a list of device names, the first name
+    repeated at the end (['a', 'b', 'a']), or None when there is none.
+    Upstream names which are not keys of upstream are ignored.
+    """
+    # 0 - not visited, 1 - on the current path, 2 - done
+    state = dict.fromkeys(upstream, 0)
+    for start in upstream:
+        if state[start]:
+            continue
+        path = [start]
+        stack = [iter(upstream[start])]
+        state[start] = 1
+        while stack:
+            parent = next(stack[-1], None)
+            if parent is None:
+                state[path.pop()] = 2
+                stack.pop()
+            elif parent not in state or state[parent] == 2:
+                continue
+            elif state[parent] == 1:
+                return path[path.index(parent):] + [parent]
+            else:
+                state[parent] = 1
+                path.append(parent)
+                stack.append(iter(upstream[parent]))
+    return None
+
+
+def check_topology(devices: Sequence[Mapping]) -> list[str]:
+    """
+    Problems of the upstream options of the device entries of the
+    configuration file: unknown upstream devices and cycles.
+    """
+    upstream = {
+        str(dev.get('name')): upstream_names(dev.get('upstream'))
+        for dev in devices
+    }
+    problems = [
+        f'Unknown upstream device {parent} of {name}!'
+        for name, parents in upstream.items()
+        for parent in parents
+        if parent not in upstream
+    ]
+    cycle = find_cycle(upstream)
+    if cycle:
+        problems.append(f'Upstream cycle: {" -> ".join(cycle)}')
+    return problems
+
+
+def downstream_counts(
+        devices: Sequence['Device'],
+) -> tuple[dict[str, int], dict[str, list['Device']]]:
+    """
+    For the given devices, the number of devices behind each device
+    (which list it as upstream) and the upstream devices of each
+    device. Devices outside of the given ones are ignored.
+    """
+    by_name = {d.name: d for d in devices}
+    children = dict.fromkeys(by_name, 0)
+    parents: dict[str, list['Device']] = {}
+    for d in devices:
+        parents[d.name] = [
+            by_name[name] for name in d.upstream if name in by_name
+        ]
+        for parent in parents[d.name]:
+            children[parent.name] += 1
+    return children, parents
+
+
+def leaves_first(devices: Sequence['Device']) -> list['Device']:
+    """
+    Order the devices so every device comes after all the devices
+    behind it, keeping the original order where there is a choice.
+    """
+    children, parents = downstream_counts(devices)
+    ready = [d for d in devices if not children[d.name]]
+    ordered = []
+    while ready:
+        d = ready.pop(0)
+        ordered.append(d)
+        for parent in parents[d.name]:
+            children[parent.name] -= 1
+            if not children[parent.name]:
+                ready.append(parent)
+    if len(ordered) != len(devices):
+        raise ValueError('upstream cycle between the devices')
+    return ordered
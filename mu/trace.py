@@ -0,0 +1,114 @@
+import contextlib
+import json
+import os
+import pathlib
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any
+
+
+class Tracer:
+    """
+    Collects spans in the Chrome trace-event format, which can be opened
+    in chrome://tracing or https://ui.perfetto.dev. \n
+    Every device gets its own track (thread id) so the overlap of the
+    devices processed in parallel is visible. Spans of one track must be
+    properly nested, which is what context managers give for free.
+    """
+    def __init__(self, process_name: str = 'mu') -> None:
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._tracks: dict[str, int] = {}
+        self.events: list[dict[str, Any]] = [
+            {
+                'name': 'process_name',
+                'ph': 'M',
+                'pid': self._pid,
+                'tid': 0,
+                'args': {'name': process_name},
+            },
+        ]
+
+    def track(self, name: str) -> int:
+        """Return the thread id of the named track, creating it if needed."""
+        with self._lock:
+            tid = self._tracks.get(name)
+            if tid is None:
+                tid = len(self._tracks) + 1
+                self._tracks[name] = tid
+                self.events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': self._pid,
+                    'tid': tid,
+                    'args': {'name': name},
+                })
+                self.events.append({
+                    'name': 'thread_sort_index',
+                    'ph': 'M',
+                    'pid': self._pid,
+                    'tid': tid,
+                    'args': {'sort_index': tid},
+                })
+            return tid
+
+    @contextlib.contextmanager
+    def span(
+            self,
+            track: str,
+            name: str,
+            category: str = 'phase',
+            **args: Any,
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Record the enclosed block as a complete ("X") event.
+        The yielded dict can be used to add arguments from inside
+        the block, e.g. the number of bytes transferred.
+        """
+        tid = self.track(track)
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': round((start - self._origin) * 1e6, 1),
+                'dur': round((end - start) * 1e6, 1),
+                'pid': self._pid,
+                'tid': tid,
+            }
+            if args:
+                event['args'] = args
+            with self._lock:
+                self.events.append(event)
+
+    def instant(self, track: str, name: str, **args: Any) -> None:
+        """Record a point in time, e.g. a failure."""
+        tid = self.track(track)
+        event = {
+            'name': name,
+            'ph': 'i',
+            's': 't',
+            'ts': round((time.perf_counter() - self._origin) * 1e6, 1),
+            'pid': self._pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def write(self, path: str | pathlib.Path) -> None:
+        """Write the trace as a JSON object with a traceEvents list."""
+        with self._lock:
+            data = {
+                'traceEvents': list(self.events),
+                'displayTimeUnit': 'ms',
+            }
+        with open(path, 'w') as stream:
+            json.dump(data, stream)
@@ -5,6 +5,8 @@ from time import sleep
 import paramiko
 from scp import SCPClient  # type: ignore
 
+from mu.routeros import parse_terse
+
 
 class UserRegistrator:
     def __init__(
@@ -102,13 +104,12 @@ class UserRegistrator:
             return False
         if not self.client:
             return False
-        _cmd = 'file print'
+        _cmd = 'file print terse'
         try:
             stdin, stdout, stderr = self.client.exec_command(_cmd)
-            for line in stdout.readlines():
-                if len(line.split()) > 2:
-                    if self.public_key_file.name == line.split()[1]:
-                        return True
+            for item in parse_terse(stdout.readlines(), keys=('name',)):
+                if item.get('name') == self.public_key_file.name:
+                    return True
         except Exception as e:
             print(e)
             raise
@@ -117,13 +118,12 @@ class UserRegistrator:
     def user_exists(self) -> bool:
         if not self.client:
             return False
-        _cmd = 'user print'
+        _cmd = 'user print terse'
         try:
             stdin, stdout, stderr = self.client.exec_command(_cmd)
-            for line in stdout.readlines():
-                if len(line.split()) > 2:
-                    if self.username == line.split()[1]:
-                        return True
+            for item in parse_terse(stdout.readlines(), keys=('name',)):
+                if item.get('name') == self.username:
+                    return True
         except Exception as e:
             print(e)
             raise
@@ -0,0 +1,98 @@
+import contextlib
+import threading
+import time
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+
+from mu.logger import Logger
+
+if TYPE_CHECKING:
+    from mu.device import Device
+
+# default seconds of the ssh timeouts, configurable globally and per
+# device: the TCP connection, the ssh banner, the authentication, the
+# silence of a command (and of opening its channel), and the whole
+# session of a device, 0 for no limit
+TIMEOUTS = {
+    'connect_timeout': 10,
+    'banner_timeout': 15,
+    'auth_timeout': 15,
+    'command_timeout': 300,
+    'session_timeout': 3600,
+}
+
+
+class SessionTimeout(TimeoutError):
+    """The session of a device ran out of one of its timeouts."""
+
+
+class Watchdog:
+    """
+    Aborts the session of every device which takes longer than its
+    session_timeout (see Device.abort), so a hung device fails instead
+    of holding a worker. A thread started with the first watched device
+    checks the sessions every interval seconds.
+    """
+    def __init__(self, logger: Logger, interval: float = 1.0) -> None:
+        self.logger = logger
+        self.interval = interval
+        # device name -> (monotonic deadline, device)
+        self._deadlines: dict[str, tuple[float, 'Device']] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @contextlib.contextmanager
+    def watch(self, d: 'Device') -> Iterator[None]:
+        """Watch the session of the device for the enclosed block."""
+        if not d.session_timeout:
+            yield
+            return
+        with self._lock:
+            self._deadlines[d.name] = (
+                time.monotonic() + d.session_timeout,
+                d,
+            )
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='mu-watchdog',
+                    daemon=True,
+                )
+                self._thread.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._deadlines.pop(d.name, None)
+
+    def check(self, now: float | None = None) -> list['Device']:
+        """Abort the sessions past their deadline and return them."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            expired = [
+                d for deadline, d in self._deadlines.values()
+                if deadline <= now
+            ]
+            for d in expired:
+                del self._deadlines[d.name]
+        for d in expired:
+            reason = f'session exceeded {d.session_timeout:g}s'
+            self.logger.log(
+                'error',
+                d.name,
+                f'watchdog: {reason}, aborting',
+                stdout=True,
+            )
+            d.abort(reason)
+        return expired
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.check()
@@ -0,0 +1,277 @@
+import collections
+import heapq
+import itertools
+import math
+import time
+from collections.abc import Callable
+from collections.abc import Mapping
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+from mu.logger import Logger
+from mu.topology import downstream_counts
+from mu.topology import leaves_first
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from mu.device import Device
+
+# failures of these phases count as timeouts in the wave statistics
+TIMEOUT_PHASES = ('connect', 'reboot-wait', 'reconnect', 'timeout')
+
+
+def wave_size(size: int | str, total: int) -> int:
+    """
+    Number of devices in a wave of the given size: a device count
+    (5) or a percentage of all devices ('5%'), at least 1. \n
+    Raises ValueError for anything else.
+    """
+    if isinstance(size, str) and size.strip().endswith('%'):
+        percent = float(size.strip()[:-1])
+        if not 0 < percent <= 100:
+            raise ValueError(f'invalid wave size {size}')
+        return max(1, math.ceil(total * percent / 100))
+    count = int(size)
+    if count < 1:
+        raise ValueError(f'invalid wave size {size}')
+    return count
+
+
+def plan_waves(
+        devices: Sequence['Device'],
+        sizes: Sequence[int | str],
+) -> list[list['Device']]:
+    """
+    Split the devices into waves. The canary devices form the first
+    wave, the rest follow in the configured order in waves of the
+    given sizes, and the last wave takes whatever is left. \n
+    example with 100 devices and sizes [1, '5%', '25%']: \n
+    canaries, 1, 5, 25, the rest \n
+    An upstream device then moves to the wave of its last device
+    behind it, if that one is later, so it is never rebooted while a
+    device behind it still waits for its wave.
+    """
+    canaries = [d for d in devices if d.canary]
+    rest = [d for d in devices if not d.canary]
+    waves = [canaries] if canaries else []
+    for size in sizes:
+        if not rest:
+            break
+        count = wave_size(size, len(devices))
+        waves.append(rest[:count])
+        rest = rest[count:]
+    if rest:
+        waves.append(rest)
+    number = {d.name: i for i, wave in enumerate(waves) for d in wave}
+    _, parents = downstream_counts(devices)
+    for d in leaves_first(devices):
+        for parent in parents[d.name]:
+            number[parent.name] = max(number[parent.name], number[d.name])
+    moved: list[list['Device']] = [[] for _ in waves]
+    for d in devices:
+        moved[number[d.name]].append(d)
+    return [wave for wave in moved if wave]
+
+
+def interleave_sites(devices: Sequence['Device']) -> list['Device']:
+    """
+    Order the devices round robin by site, so a wave doesn't start
+    with the devices of one site only.
+    """
+    sites: dict[str, list['Device']] = {}
+    for d in devices:
+        sites.setdefault(d.site, []).append(d)
+    ordered = []
+    queues = list(sites.values())
+    while queues:
+        for queue in queues:
+            ordered.append(queue.pop(0))
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+class WaveScheduler:
+    """
+    Runs the update in waves: the canary devices first, then waves of
+    growing size. Up to jobs devices of a wave run in parallel, at most
+    site_concurrency of them from the same site (0 for no limit; the
+    devices of a site at its cap wait in the queue, not in a worker,
+    so the other sites keep the workers busy), and
+    devices are updated before their upstream devices. With estimates
+    (expected seconds per device name, see mu.history), the devices
+    heading the longest chains start first, so a slow device doesn't
+    finish alone at the end of a wave. \n
+    After each wave the share of failed devices is compared with
+    max_failure_rate, and the share of devices which failed to connect
+    or come back after a reboot with max_timeout_rate. When either is
+    exceeded, the remaining waves are not started; mu doesn't pause
+    for the operator, it runs unattended. Between waves the
+    scheduler waits pause seconds, so a bad release can show up on the
+    updated devices before the next wave.
+    """
+    def __init__(
+            self,
+            sizes: Sequence[int | str],
+            logger: Logger,
+            jobs: int = 1,
+            site_concurrency: int = 0,
+            max_failure_rate: float = 0.1,
+            max_timeout_rate: float = 1.0,
+            pause: float = 0,
+            estimates: Mapping[str, float] | None = None,
+    ) -> None:
+        self.sizes = list(sizes)
+        self.logger = logger
+        self.jobs = jobs
+        self.site_concurrency = site_concurrency
+        self.max_failure_rate = max_failure_rate
+        self.max_timeout_rate = max_timeout_rate
+        self.pause = pause
+        self.estimates = dict(estimates or {})
+        self.aborted = False
+
+    def run(
+            self,
+            devices: Sequence['Device'],
+            process: Callable[['Device'], None],
+    ) -> bool:
+        """
+        Process the devices wave by wave. Returns False when the
+        remaining waves were not started because a wave failed.
+        """
+        waves = plan_waves(devices, self.sizes)
+        for number, wave in enumerate(waves, 1):
+            if number > 1 and self.pause:
+                time.sleep(self.pause)
+            if len(waves) > 1:
+                self.logger.log(
+                    'info',
+                    'script',
+                    f'wave {number}/{len(waves)}: {len(wave)} devices',
+                    stdout=True,
+                    wave=number,
+                    devices=len(wave),
+                )
+            self._run_wave(wave, process)
+            if number == len(waves):
+                break
+            failed = [d for d in wave if d.failures]
+            timeouts = [
+                d for d in failed
+                if any(phase in d.failures for phase in TIMEOUT_PHASES)
+            ]
+            failure_rate = len(failed) / len(wave)
+            timeout_rate = len(timeouts) / len(wave)
+            if (
+                failure_rate > self.max_failure_rate or
+                timeout_rate > self.max_timeout_rate
+            ):
+                skipped = sum(len(w) for w in waves[number:])
+                self.logger.log(
+                    'error',
+                    'script',
+                    f'wave {number} failed: {len(failed)} of {len(wave)} '
+                    f'devices failed ({len(timeouts)} timed out): '
+                    f'{", ".join(d.name for d in failed)}. '
+                    f'Aborting, {skipped} devices not processed.',
+                    stdout=True,
+                    wave=number,
+                    failure_rate=round(failure_rate, 3),
+                    timeout_rate=round(timeout_rate, 3),
+                )
+                self.aborted = True
+                return False
+        return True
+
+    def _run_wave(
+            self,
+            wave: Sequence['Device'],
+            process: Callable[['Device'], None],
+    ) -> None:
+        """
+        Process the devices of a wave. A device starts only after all
+        the devices behind it (which list it as upstream) finished, so
+        no device is rebooted while a device behind it is updated.
+        """
+        if self.jobs <= 1:
+            for d in leaves_first(wave):
+                process(d)
+            return
+        # concurrent.futures is slow to import, mu check-config loads
+        # this module for wave_size
+        from concurrent.futures import FIRST_COMPLETED
+        from concurrent.futures import ThreadPoolExecutor
+        from concurrent.futures import wait
+        children, parents = downstream_counts(wave)
+        priority = self._critical_paths(wave, parents)
+        # (-priority, sequence, device): FIFO among equal priorities
+        ready: list[tuple[float, int, 'Device']] = []
+        sequence = itertools.count()
+        # running devices per site
+        sites: collections.Counter[str] = collections.Counter()
+
+        def push(d: 'Device') -> None:
+            heapq.heappush(ready, (-priority[d.name], next(sequence), d))
+
+        for d in interleave_sites([d for d in wave if not children[d.name]]):
+            push(d)
+        executor = ThreadPoolExecutor(
+            max_workers=self.jobs,
+            thread_name_prefix='mu',
+        )
+        running: dict['Future[None]', 'Device'] = {}
+        try:
+            while ready or running:
+                capped = []
+                while ready and len(running) < self.jobs:
+                    item = heapq.heappop(ready)
+                    d = item[2]
+                    if self._site_full(d.site, sites):
+                        capped.append(item)
+                        continue
+                    sites[d.site] += 1
+                    running[executor.submit(process, d)] = d
+                for item in capped:
+                    heapq.heappush(ready, item)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    d = running.pop(future)
+                    sites[d.site] -= 1
+                    for parent in parents[d.name]:
+                        children[parent.name] -= 1
+                        if not children[parent.name]:
+                            push(parent)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    def _critical_paths(
+            self,
+            wave: Sequence['Device'],
+            parents: Mapping[str, list['Device']],
+    ) -> dict[str, float]:
+        """
+        Expected seconds from the start of each device until its last
+        upstream device finished, all 0 without estimates.
+        """
+        paths: dict[str, float] = {}
+        for d in reversed(leaves_first(wave)):
+            paths[d.name] = self.estimates.get(d.name, 0) + max(
+                (paths[parent.name] for parent in parents[d.name]),
+                default=0,
+            )
+        return paths
+
+    def _site_full(
+            self,
+            site: str,
+            running: collections.Counter[str],
+    ) -> bool:
+        """Whether site_concurrency devices of the site are running."""
+        return bool(
+            self.site_concurrency and site and
+            running[site] >= self.site_concurrency,
+        )
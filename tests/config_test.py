@@ -6,7 +6,7 @@ from mu.config import Config
 
 
 def test_config_init():
-    with patch('paramiko.Ed25519Key.from_private_key_file') as mock_key:
+    with patch('paramiko.PKey.from_path') as mock_key:
         mock_key.return_value = MagicMock()
         config = Config(
             backup_dir='/path/to/backup',
@@ -22,9 +22,15 @@ def test_config_init():
         assert config.update_firmware is False
         assert config.update_type == 'online'
         assert config.online_update_channel == 'stable'
-        assert config.reboot_timeout == 240
+        assert config.reboot_timeout is None
         assert config.backup_dir == pathlib.Path('/path/to/backup')
         assert config.private_key_file == '/path/to/private_key'
+        assert config.keys.key_files == ['/path/to/private_key']
+        assert config.keys.enabled is True
+        # the key is loaded on the first connection, not with the config
+        mock_key.assert_not_called()
+        assert config.keys.keys() == [mock_key.return_value]
+        assert config.keys.keys() == [mock_key.return_value]
         mock_key.assert_called_once_with('/path/to/private_key')
 
 
@@ -40,6 +46,16 @@ def test_config_without_private_key():
     assert config.update_firmware is False
     assert config.update_type == 'online'
     assert config.online_update_channel == 'stable'
-    assert config.reboot_timeout == 240
+    assert config.reboot_timeout is None
     assert config.backup_dir == pathlib.Path('/path/to/backup')
     assert config.private_key_file == ''
+    assert config.keys.enabled is False
+
+
+def test_config_multiple_keys_and_agent():
+    config = Config(
+        private_key_file=['id_ed25519', 'id_rsa'],
+        use_ssh_agent=True,
+    )
+    assert config.keys.key_files == ['id_ed25519', 'id_rsa']
+    assert config.keys.use_agent is True
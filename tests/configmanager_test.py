@@ -5,6 +5,7 @@ import pytest
 import yaml
 
 from mu.configmanager import ConfigManager
+from mu.history import History
 
 
 @pytest.fixture(autouse=True)
@@ -491,6 +492,29 @@ def test_check_config_file_correct(capsys):
         assert result
 
 
+@pytest.mark.parametrize(
+    'option, value', [
+        ('log_fsync', 'sometimes'),
+        ('log_rotate', 'hourly'),
+    ],
+)
+def test_check_config_file_invalid_log_option(capsys, option, value):
+    data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': '/path/to/private_key',
+            option: value,
+        },
+        'devices': [{'name': 'test-dev', 'address': '192.168.1.1'}],
+    }
+    with patch('builtins.open', mock_open(read_data=yaml.dump(data))):
+        config_manager = ConfigManager('dummy_filename')
+        result = config_manager.check_config_file()
+    captured = capsys.readouterr()
+    assert not result
+    assert f'Invalid {option} value {value}!' in captured.out
+
+
 def _make_mock_data(extra_global=None, extra_device=None):
     data = {
         'global': {
@@ -553,3 +577,244 @@ def test_load_config_update_firmware_device_true_global_false():
             cm = ConfigManager('dummy')
             devices, _ = cm.load_config()
     assert devices[0].update_firmware is True
+
+
+def test_load_config_keys_shared_and_lazy():
+    mock_data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': ['/nonexistent/id_ed25519', '/nonexistent/id'],
+            'use_ssh_agent': True,
+            'username': 'admin',
+        },
+        'devices': [
+            {'name': 'device1', 'address': '192.168.1.1'},
+            {'name': 'device2', 'address': '192.168.1.2'},
+        ],
+    }
+    with patch('builtins.open', mock_open(read_data='')):
+        with patch('yaml.safe_load', return_value=mock_data):
+            with patch('paramiko.PKey.from_path') as from_path:
+                devices, _ = ConfigManager('dummy_filename').load_config()
+    from_path.assert_not_called()
+    keys = devices[0].conf.keys
+    assert devices[1].conf.keys is keys
+    assert keys.key_files == ['/nonexistent/id_ed25519', '/nonexistent/id']
+    assert keys.use_agent is True
+
+
+def test_check_config_file_invalid_waves(capsys):
+    mock_data = """
+    global:
+      backup_dir: /path/to/backup
+      private_key_file: /path/to/private_key
+      waves: [1, 5%, ten]
+      max_failure_rate: 2
+      site_concurrency: two
+      wave_pause: -60
+    devices:
+      - name: device1
+        address: 192.168.1.1
+    """
+    with patch('builtins.open', mock_open(read_data=mock_data)):
+        result = ConfigManager('dummy_filename').check_config_file()
+    captured = capsys.readouterr()
+    assert not result
+    assert 'Invalid wave size ten!' in captured.out
+    assert 'Invalid max_failure_rate 2!' in captured.out
+    assert 'Invalid site_concurrency two!' in captured.out
+    assert 'Invalid wave_pause -60!' in captured.out
+
+
+def test_load_config_waves_and_sites():
+    mock_data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': '',
+            'username': 'admin',
+            'waves': [1, '25%'],
+            'site_concurrency': 2,
+            'max_failure_rate': 0,
+        },
+        'devices': [
+            {'name': 'device1', 'address': '10.0.0.1', 'canary': True},
+            {'name': 'device2', 'address': '10.0.0.2', 'site': 'prague'},
+        ],
+    }
+    with patch('builtins.open', mock_open(read_data='')):
+        with patch('yaml.safe_load', return_value=mock_data):
+            cm = ConfigManager('dummy_filename')
+            devices, _ = cm.load_config()
+    assert cm.config.waves == [1, '25%']
+    assert cm.config.site_concurrency == 2
+    assert cm.config.max_failure_rate == 0
+    assert [(d.canary, d.site) for d in devices] == [
+        (True, ''), (False, 'prague'),
+    ]
+
+
+def test_check_config_file_upstream_cycle(capsys):
+    mock_data = """
+    global:
+      backup_dir: /path/to/backup
+      private_key_file: /path/to/private_key
+    devices:
+      - name: core
+        address: 192.168.1.1
+        upstream: ap1
+      - name: ap1
+        address: 192.168.1.2
+        upstream: [core]
+      - name: ap2
+        address: 192.168.1.3
+        upstream: gone
+    """
+    with patch('builtins.open', mock_open(read_data=mock_data)):
+        result = ConfigManager('dummy_filename').check_config_file()
+    captured = capsys.readouterr()
+    assert not result
+    assert 'Unknown upstream device gone of ap2!' in captured.out
+    assert 'Upstream cycle: core -> ap1 -> core' in captured.out
+
+
+def test_load_config_upstream():
+    mock_data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': '',
+            'username': 'admin',
+        },
+        'devices': [
+            {'name': 'core', 'address': '10.0.0.1'},
+            {'name': 'ap1', 'address': '10.0.0.2', 'upstream': 'core'},
+        ],
+    }
+    with patch('builtins.open', mock_open(read_data='')):
+        with patch('yaml.safe_load', return_value=mock_data):
+            devices, _ = ConfigManager('dummy_filename').load_config()
+    assert [d.upstream for d in devices] == [[], ['core']]
+
+
+def test_load_config_reboot_wait():
+    mock_data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': '',
+            'username': 'admin',
+            'reboot_poll_interval': 2,
+        },
+        'devices': [
+            {'name': 'hap1', 'address': '10.0.0.1'},
+            {
+                'name': 'ccr1',
+                'address': '10.0.0.2',
+                'reboot_timeout': 600,
+                'reboot_first_probe': 120,
+                'reboot_poll_interval': 5,
+            },
+        ],
+    }
+    with patch('builtins.open', mock_open(read_data='')):
+        with patch('yaml.safe_load', return_value=mock_data):
+            cm = ConfigManager('dummy_filename')
+            devices, _ = cm.load_config()
+    assert cm.config.reboot_timeout is None
+    assert cm.config.adaptive_reboot is True
+    assert [
+        (d.reboot_first_probe, d.reboot_poll_interval, d.reboot_timeout)
+        for d in devices
+    ] == [(None, 2, None), (120, 5, 600)]
+
+
+def test_load_config_global_reboot_timeout_beats_history(tmp_path):
+    mock_data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': '',
+            'username': 'admin',
+            'reboot_timeout': 300,
+        },
+        'devices': [
+            {'name': 'hap1', 'address': '10.0.0.1'},
+            {'name': 'ccr1', 'address': '10.0.0.2', 'reboot_timeout': 600},
+            {'name': 'hap2', 'address': '10.0.0.3'},
+        ],
+    }
+    with patch('builtins.open', mock_open(read_data='')):
+        with patch('yaml.safe_load', return_value=mock_data):
+            devices, _ = ConfigManager('dummy_filename').load_config()
+    history = History(tmp_path / 'history.json')
+    for name in ('hap1', 'ccr1'):
+        for seconds in (40, 42, 44, 60):
+            history.record_reboot(name, 'unknown', seconds)
+    assert [history.adapt_reboot(d) for d in devices] == [True, True, False]
+    assert [
+        (d.reboot_first_probe, d.reboot_timeout) for d in devices
+    ] == [(32.2, 300), (32.2, 600), (None, 300)]
+
+
+def test_check_config_file_invalid_reboot_wait(capsys):
+    mock_data = """
+    global:
+      backup_dir: /path/to/backup
+      private_key_file: /path/to/private_key
+      reboot_poll_interval: -1
+    devices:
+      - name: device1
+        address: 192.168.1.1
+        reboot_timeout: soon
+    """
+    with patch('builtins.open', mock_open(read_data=mock_data)):
+        result = ConfigManager('dummy_filename').check_config_file()
+    captured = capsys.readouterr()
+    assert not result
+    assert 'Invalid reboot_poll_interval -1!' in captured.out
+    assert 'Invalid reboot_timeout soon!' in captured.out
+
+
+def test_check_config_file_invalid_prescan_timeout(capsys):
+    mock_data = """
+    global:
+      backup_dir: /path/to/backup
+      private_key_file: /path/to/private_key
+      prescan_timeout: -3
+    devices:
+      - name: device1
+        address: 192.168.1.1
+    """
+    with patch('builtins.open', mock_open(read_data=mock_data)):
+        result = ConfigManager('dummy_filename').check_config_file()
+    captured = capsys.readouterr()
+    assert not result
+    assert 'Invalid prescan_timeout -3!' in captured.out
+
+
+def test_load_config_ssh_timeouts():
+    mock_data = {
+        'global': {
+            'backup_dir': '/path/to/backup',
+            'private_key_file': '',
+            'username': 'admin',
+            'command_timeout': 60,
+        },
+        'devices': [
+            {'name': 'hap1', 'address': '10.0.0.1'},
+            {
+                'name': 'ltap1',
+                'address': '10.0.0.2',
+                'connect_timeout': 30,
+                'session_timeout': 0,
+            },
+        ],
+    }
+    with patch('builtins.open', mock_open(read_data='')):
+        with patch('yaml.safe_load', return_value=mock_data):
+            cm = ConfigManager('dummy_filename')
+            devices, _ = cm.load_config()
+    assert cm.config.command_timeout == 60
+    # the prescan is opt-in
+    assert cm.config.prescan_timeout == 0
+    assert [
+        (d.connect_timeout, d.command_timeout, d.session_timeout)
+        for d in devices
+    ] == [(10, 60, 3600), (30, 60, 0)]
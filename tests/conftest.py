@@ -11,7 +11,7 @@ from mu.logger import Logger
 @pytest.fixture
 def mock_conf():
     conf = MagicMock(spec=Config)
-    conf.key = None
+    conf.keys = None
     conf.reboot_timeout = 10
     conf.backup_dir = pathlib.Path('/tmp/backups')
     conf.delete_backup_after_download = False
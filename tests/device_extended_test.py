@@ -8,7 +8,9 @@ import pytest
 
 from mu.config import Config
 from mu.device import Device
+from mu.keys import KeyProvider
 from mu.logger import Logger
+from mu.watchdog import SessionTimeout
 
 
 # mock_conf and disconnected_dev fixtures live in conftest.py
@@ -54,6 +56,28 @@ def test_ssh_call_raises_on_exception(dev):
         dev.ssh_call('cmd')
 
 
+def test_ssh_call_command_timeout(dev):
+    dev.command_timeout = 30
+    mock_stdout = MagicMock()
+    mock_stdout.readlines.side_effect = TimeoutError('timed out')
+    dev.client.exec_command.return_value = (
+        MagicMock(), mock_stdout, MagicMock(),
+    )
+    with pytest.raises(SessionTimeout, match='for 30s'):
+        dev.ssh_call('system package update download')
+    assert dev.client.exec_command.call_args.kwargs == {
+        'timeout': 30,
+    }
+
+
+def test_abort_closes_the_session(dev):
+    client = dev.client
+    dev.abort('session exceeded 60s')
+    client.close.assert_called_once()
+    with pytest.raises(SessionTimeout):
+        dev.ssh_call('system identity print')
+
+
 # ─── ssh_close ───────────────────────────────────────────────────────────────
 
 def test_ssh_close_closes_client(dev):
@@ -70,16 +94,21 @@ def test_ssh_close_no_client(disconnected_dev):
 # ─── ssh_connect ─────────────────────────────────────────────────────────────
 
 def test_ssh_connect_with_key(disconnected_dev):
-    disconnected_dev.conf.key = MagicMock()
+    disconnected_dev.conf.keys = KeyProvider(keys=[MagicMock()])
     with patch('paramiko.SSHClient') as mock_ssh_class:
         mock_client = MagicMock()
         mock_ssh_class.return_value = mock_client
         with patch.object(
             disconnected_dev, '_get_identity', return_value='myrouter',
+        ), patch.object(
+            disconnected_dev, '_get_model', return_value='RB5009UG+S+',
         ):
             disconnected_dev.ssh_connect()
     assert disconnected_dev.identity == 'myrouter'
-    mock_client.connect.assert_called_once()
+    assert disconnected_dev.model == 'RB5009UG+S+'
+    kwargs = mock_client.connect.call_args.kwargs
+    assert kwargs['auth_strategy'].provider is disconnected_dev.conf.keys
+    assert 'look_for_keys' not in kwargs
 
 
 def test_ssh_connect_without_key(disconnected_dev):
@@ -88,9 +117,12 @@ def test_ssh_connect_without_key(disconnected_dev):
         mock_ssh_class.return_value = mock_client
         with patch.object(
             disconnected_dev, '_get_identity', return_value='myrouter',
+        ), patch.object(
+            disconnected_dev, '_get_model', return_value='RB5009UG+S+',
         ):
             disconnected_dev.ssh_connect()
     mock_client.connect.assert_called_once()
+    assert mock_client.connect.call_args.kwargs['look_for_keys'] is True
 
 
 def test_ssh_connect_auth_exception(disconnected_dev):
@@ -104,10 +136,51 @@ def test_ssh_connect_auth_exception(disconnected_dev):
             disconnected_dev.ssh_connect()
 
 
+def test_ssh_connect_passes_timeouts(disconnected_dev):
+    disconnected_dev.connect_timeout = 4
+    disconnected_dev.command_timeout = 60
+    with patch('paramiko.SSHClient') as mock_ssh_class:
+        mock_client = MagicMock()
+        mock_ssh_class.return_value = mock_client
+        with patch.object(
+            disconnected_dev, '_get_identity', return_value='myrouter',
+        ), patch.object(
+            disconnected_dev, '_get_model', return_value='RB5009UG+S+',
+        ):
+            disconnected_dev.ssh_connect()
+    kwargs = mock_client.connect.call_args.kwargs
+    assert (
+        kwargs['timeout'],
+        kwargs['banner_timeout'],
+        kwargs['auth_timeout'],
+        kwargs['channel_timeout'],
+    ) == (4, 15, 15, 60)
+
+
+def test_ssh_connect_banner_timeout(disconnected_dev):
+    with patch('paramiko.SSHClient') as mock_ssh_class:
+        mock_client = MagicMock()
+        mock_ssh_class.return_value = mock_client
+        mock_client.connect.side_effect = paramiko.SSHException(
+            'Error reading SSH protocol banner',
+        )
+        with pytest.raises(SessionTimeout):
+            disconnected_dev.ssh_connect()
+    assert disconnected_dev.failures == {'connect': 1}
+
+
+def test_ssh_connect_after_abort(disconnected_dev):
+    disconnected_dev.abort('session exceeded 60s')
+    with patch('paramiko.SSHClient') as mock_ssh_class:
+        with pytest.raises(SessionTimeout, match='exceeded 60s'):
+            disconnected_dev.ssh_connect()
+    mock_ssh_class.assert_not_called()
+
+
 # ─── ssh_test ────────────────────────────────────────────────────────────────
 
 def test_ssh_test_success_with_key(disconnected_dev):
-    disconnected_dev.conf.key = MagicMock()
+    disconnected_dev.conf.keys = KeyProvider(keys=[MagicMock()])
     with patch('paramiko.SSHClient') as mock_ssh_class:
         mock_client = MagicMock()
         mock_ssh_class.return_value = mock_client
@@ -138,6 +211,19 @@ def test_ssh_test_auth_exception_user_says_n(disconnected_dev):
                 disconnected_dev.ssh_test()
 
 
+def test_ssh_test_auth_exception_not_interactive(disconnected_dev):
+    disconnected_dev.interactive = False
+    with patch('paramiko.SSHClient') as mock_ssh_class:
+        mock_client = MagicMock()
+        mock_ssh_class.return_value = mock_client
+        mock_client.connect.side_effect = (
+            paramiko.AuthenticationException('fail')
+        )
+        with patch('builtins.input') as mock_input:
+            assert disconnected_dev.ssh_test() is False
+    mock_input.assert_not_called()
+
+
 def test_ssh_test_auth_exception_user_says_y(disconnected_dev):
     disconnected_dev.conf.public_key_file = 'mykey.pub'
     disconnected_dev.conf.public_key_owner = 'owner'
@@ -188,7 +274,7 @@ def test_ssh_test_os_error(disconnected_dev):
 # ─── simple_ssh_test ─────────────────────────────────────────────────────────
 
 def test_simple_ssh_test_success_with_key(disconnected_dev):
-    disconnected_dev.conf.key = MagicMock()
+    disconnected_dev.conf.keys = KeyProvider(keys=[MagicMock()])
     with patch('paramiko.SSHClient') as mock_ssh_class:
         mock_client = MagicMock()
         mock_ssh_class.return_value = mock_client
@@ -345,14 +431,13 @@ def test_exec_command_prints_output(dev, capsys):
 
 def test_get_installed_packages_normal(dev):
     output = [
-        'Columns: #, NAME, VERSION, SCHEDULED',
-        ' 0 routeros     7.15',
-        ' 1 wireless     7.15',
+        ' 0   name=routeros version=7.15 build-time=2024-05-17 12:00:00',
+        ' 1 X name=wireless version=7.15 build-time=2024-05-17 12:00:00',
     ]
-    with patch.object(dev, 'ssh_call', return_value=output):
+    with patch.object(dev, 'ssh_call', return_value=output) as mock_call:
         result = dev.get_installed_packages()
-    assert 'routeros 7.15' in result
-    assert 'wireless 7.15' in result
+    mock_call.assert_called_with('system package print terse')
+    assert result == ['routeros 7.15', 'wireless 7.15']
 
 
 def test_get_installed_packages_empty_output(dev):
@@ -478,6 +563,29 @@ def test_reboot_and_wait_timeout(dev):
     assert result is False
 
 
+def test_reboot_and_wait_probes_learned_times(dev):
+    dev.conf.reboot_timeout = 30
+    dev.reboot_first_probe = 32.2
+    dev.reboot_poll_interval = 2.1
+    with patch.object(dev, '_reboot'):
+        with patch.object(
+            dev, 'simple_ssh_test', side_effect=[False, False, True],
+        ):
+            with patch('time.sleep') as mock_sleep:
+                assert dev.reboot_and_wait() is True
+    assert mock_sleep.call_args_list == [call(32.2), call(2.1), call(2.1)]
+
+
+def test_reboot_and_wait_device_timeout(dev):
+    dev.conf.reboot_timeout = 300
+    dev.reboot_timeout = 0
+    with patch.object(dev, '_reboot'):
+        with patch.object(dev, 'simple_ssh_test') as mock_test:
+            assert dev.reboot_and_wait() is False
+    mock_test.assert_not_called()
+    assert dev.failures == {'reboot-wait': 1}
+
+
 # ─── update (online) ─────────────────────────────────────────────────────────
 
 def test_update_online_same_channel(dev):
@@ -781,6 +889,99 @@ def test_firmware_update_still_different_after_reboot(dev):
     assert result is False
 
 
+def test_firmware_update_after_auto_upgrade_only_reboots(dev):
+    dev.current_firmware = '7.14'
+    dev.upgrade_firmware = '7.16'
+    dev.firmware_flashed = True
+    dev.auto_upgrade_restore = 'no'
+
+    def side_refresh():
+        if mock_reboot.called:
+            dev.current_firmware = '7.16'
+
+    with patch.object(dev, 'refresh_firmware_info', side_effect=side_refresh):
+        with patch.object(dev, 'ssh_call') as mock_call:
+            with patch.object(dev, '_routerboard_upgrade') as mock_upgrade:
+                with patch.object(
+                    dev, 'reboot_and_wait', return_value=True,
+                ) as mock_reboot:
+                    with patch.object(dev, 'ssh_connect'):
+                        assert dev.firmware_update() is True
+    mock_upgrade.assert_not_called()
+    mock_reboot.assert_called_once_with(reason='firmware')
+    mock_call.assert_called_once_with(
+        'system routerboard settings set auto-upgrade=no',
+    )
+    assert dev.firmware_flashed is False
+    assert dev.auto_upgrade_restore is None
+
+
+@pytest.mark.parametrize(
+    'output, commands, flashed', [
+        (['  auto-upgrade: no'], 2, True),
+        (['  auto-upgrade: yes'], 1, True),
+        # no routerboard, e.g. CHR
+        (['bad command name routerboard'], 1, False),
+    ],
+)
+def test_enable_auto_upgrade(dev, output, commands, flashed):
+    with patch.object(dev, 'ssh_call', return_value=output) as mock_call:
+        dev._enable_auto_upgrade()
+    assert mock_call.call_count == commands
+    assert dev.firmware_flashed is flashed
+    assert dev.auto_upgrade_restore == ('no' if commands == 2 else None)
+
+
+def test_reboot_and_verify_restores_auto_upgrade_when_verify_fails(dev):
+    dev.update_firmware = True
+    dev.auto_upgrade_restore = 'no'
+    with patch.object(dev, '_enable_auto_upgrade'):
+        with patch.object(dev, 'reboot_and_wait', return_value=True):
+            with patch.object(dev, 'ssh_connect'):
+                with patch.object(
+                    dev, '_verify_update', side_effect=ValueError('boom'),
+                ):
+                    with patch.object(dev, 'ssh_call') as mock_call:
+                        with pytest.raises(ValueError):
+                            dev._reboot_and_verify()
+    mock_call.assert_called_once_with(
+        'system routerboard settings set auto-upgrade=no',
+    )
+    assert dev.auto_upgrade_restore is None
+
+
+def test_reboot_and_verify_reconnect_fails(dev):
+    dev.update_firmware = True
+    dev.auto_upgrade_restore = 'no'
+    with patch.object(dev, '_enable_auto_upgrade'):
+        with patch.object(dev, 'reboot_and_wait', return_value=True):
+            with patch.object(
+                dev, 'ssh_connect', side_effect=OSError('unreachable'),
+            ):
+                with patch.object(dev, 'ssh_call') as mock_call:
+                    with pytest.raises(OSError):
+                        dev._reboot_and_verify()
+    mock_call.assert_not_called()
+    warning = dev.logger.log.call_args
+    assert warning.args[0] == 'warning'
+    assert 'auto-upgrade left on, set it back to no' in warning.args[2]
+    assert dev.auto_upgrade_restore is None
+
+
+def test_reboot_and_verify_reboot_fails(dev):
+    dev.update_firmware = True
+    dev.auto_upgrade_restore = 'no'
+    with patch.object(dev, '_enable_auto_upgrade'):
+        with patch.object(dev, 'reboot_and_wait', return_value=False):
+            with patch.object(dev, 'ssh_call') as mock_call:
+                dev._reboot_and_verify()
+    mock_call.assert_not_called()
+    assert dev.auto_upgrade_restore is None
+    assert dev.firmware_flashed is False
+    warning = dev.logger.log.call_args
+    assert 'auto-upgrade left on, set it back to no' in warning.args[2]
+
+
 # ─── version_is_lower ────────────────────────────────────────────────────────
 
 @pytest.fixture(scope='module')
@@ -817,6 +1018,10 @@ def version_dev():
         ('7.15.1', '7.15.1', False),
         ('7.15rc1', '7.16', True),
         ('7.14', '7.15rc1', True),
+        ('7.9', '7.10', True),
+        ('7.10', '7.9', False),
+        ('7.15rc1', '7.15', True),
+        ('9.0', '10.0', True),
     ],
 )
 def test_version_is_lower(version_dev, a, b, expected):
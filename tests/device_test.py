@@ -79,6 +79,7 @@ def connected_device():
 
 
 def test_refresh_firmware_info(connected_device):
+    connected_device.model = 'mAP lite'
     routerboard_output = [
         '       routerboard: yes',
         '            model: RBmAPL-2nD',
@@ -94,6 +95,8 @@ def test_refresh_firmware_info(connected_device):
     assert connected_device.firmware_info_str == (
         'current firmware: 7.14.3, upgrade firmware: 7.16'
     )
+    # the model comes from the board-name only, see _get_model
+    assert connected_device.model == 'mAP lite'
 
 
 def test_refresh_firmware_info_up_to_date(connected_device):
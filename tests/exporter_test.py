@@ -0,0 +1,96 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from mu.config import Config
+from mu.device import Device
+from mu.exporter import escape_label
+from mu.exporter import read_last_success
+from mu.exporter import render
+from mu.exporter import write_textfile
+from mu.logger import Logger
+
+
+def _device(name, **attrs):
+    d = Device(
+        conf=MagicMock(spec=Config),
+        name=name,
+        address='10.0.0.1',
+        port=22,
+        username='admin',
+        update_type='online',
+        logger=MagicMock(spec=Logger),
+    )
+    for key, value in attrs.items():
+        setattr(d, key, value)
+    return d
+
+
+@pytest.fixture
+def devices():
+    ok = _device(
+        'router',
+        installed_version='7.16',
+        latest_version='7.16',
+        current_firmware='7.16',
+        model='RB5009',
+        backup_size=123456,
+        last_success=1700000000.0,
+        timings={'update': [100.0], 'reboot-wait': [40.0, 42.5]},
+    )
+    failed = _device('ap "1"', failures={'reboot-wait': 1})
+    return [ok, failed]
+
+
+def test_escape_label():
+    assert escape_label('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
+
+
+def test_render(devices):
+    text = render(devices, 1000.0, 1060.0)
+    lines = text.splitlines()
+    assert lines[-1] == '# EOF'
+    assert 'mu_run_duration_seconds 60.000' in lines
+    assert 'mu_run_devices 2' in lines
+    assert (
+        'mu_device_last_success_timestamp_seconds{device="router"} '
+        '1700000000.000'
+    ) in lines
+    assert (
+        'mu_device_version_info{device="router",installed="7.16",'
+        'latest="7.16",firmware="7.16",model="RB5009"} 1'
+    ) in lines
+    assert 'mu_device_update_duration_seconds{device="router"} 100.000' \
+        in lines
+    assert 'mu_device_backup_size_bytes{device="router"} 123456' in lines
+    assert 'mu_device_reboot_to_ssh_seconds{device="router"} 42.500' \
+        in lines
+    assert (
+        'mu_device_phase_failures{device="ap \\"1\\"",phase="reboot-wait"} 1'
+    ) in lines
+    assert '# TYPE mu_device_backup_size_bytes gauge' in lines
+
+
+def test_render_keeps_previous_last_success(devices):
+    text = render(devices, 0.0, 1.0, {'ap "1"': 1600000000.0})
+    assert (
+        'mu_device_last_success_timestamp_seconds{device="ap \\"1\\""} '
+        '1600000000.000'
+    ) in text.splitlines()
+
+
+def test_write_textfile_roundtrip(tmp_path, devices):
+    path = tmp_path / 'collector' / 'mu.prom'
+    write_textfile(path, devices, 1000.0, 1060.0)
+    assert oct(os.stat(path).st_mode & 0o777) == oct(0o644)
+    assert read_last_success(path) == {'router': 1700000000.0}
+    # the failed device keeps no value, the successful one is carried over
+    devices[0].last_success = None
+    write_textfile(path, devices, 2000.0, 2060.0)
+    assert read_last_success(path) == {'router': 1700000000.0}
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_read_last_success_missing_file(tmp_path):
+    assert read_last_success(tmp_path / 'missing.prom') == {}
@@ -0,0 +1,77 @@
+import argparse
+import json
+
+import paramiko
+import pytest
+
+from benchmarks.fleet_bench import compare
+from benchmarks.fleet_bench import median_run
+from benchmarks.fleet_bench import phase_stats
+from benchmarks.fleet_bench import run_case
+from benchmarks.fleet_bench import write_key
+
+
+def test_phase_stats(tmp_path):
+    log = tmp_path / 'mikrotik_update.jsonl'
+    log.write_text(
+        json.dumps({'msg': 'x'}) + '\n' +
+        ''.join(
+            json.dumps({'phase': 'connect', 'duration': d}) + '\n'
+            for d in (0.1, 0.2, 0.3)
+        ),
+    )
+    stats = phase_stats(log)
+    assert stats == {
+        'connect': {'count': 3, 'p50': 0.2, 'p95': 0.29, 'max': 0.3},
+    }
+
+
+def test_phase_stats_missing_log(tmp_path):
+    assert phase_stats(tmp_path / 'missing.jsonl') == {}
+
+
+def test_median_run():
+    runs = [{'wall_s': 3.0}, {'wall_s': 1.0}, {'wall_s': 2.0}]
+    result = median_run(runs)
+    assert result['wall_s'] == 2.0
+    assert result['runs'] == 3
+    assert result['wall_s_all'] == [3.0, 1.0, 2.0]
+
+
+def test_compare_reports_regressions_only():
+    baseline = [
+        {'size': 10, 'jobs': 1, 'devices_per_hour': 100.0},
+        {'size': 10, 'jobs': 8, 'devices_per_hour': 800.0},
+    ]
+    results = [
+        {'size': 10, 'jobs': 1, 'devices_per_hour': 95.0},
+        {'size': 10, 'jobs': 8, 'devices_per_hour': 600.0},
+        {'size': 50, 'jobs': 8, 'devices_per_hour': 1.0},
+    ]
+    assert compare(results, baseline, 0.1) == [
+        'size=10 jobs=8: 600.0 devices/hour, baseline 800.0',
+    ]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_case_dry_run(tmp_path, jobs):
+    key_file = tmp_path / 'id_ed25519'
+    write_key(key_file)
+    args = argparse.Namespace(
+        mode='dry-run',
+        boot_time=0.1,
+        boot_jitter=0.0,
+        latency=0.0,
+        bandwidth=0,
+        backup_size=1024,
+        firmware=False,
+        reboot_timeout=10,
+    )
+    result = run_case(
+        2, jobs, args, tmp_path, key_file, paramiko.RSAKey.generate(2048),
+    )
+    assert result['exit_code'] == 0
+    assert result['reboots'] == 0
+    assert result['max_rss_kib'] > 0
+    assert result['phases']['connect']['count'] == 2
+    assert result['phases']['check']['count'] == 2
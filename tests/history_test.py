@@ -0,0 +1,109 @@
+import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from mu.history import fit_deadline
+from mu.history import History
+from mu.history import longest_first
+from mu.history import predict
+from mu.history import reboot_plan
+from mu.history import seconds_until
+
+
+def _device(name, model='unknown'):
+    d = MagicMock()
+    d.name = name
+    d.model = model
+    return d
+
+
+def test_record_save_and_load(tmp_path):
+    history = History(tmp_path / 'history.json', keep=3)
+    for duration in (10, 20, 30, 40):
+        history.record('ap1', 'hAP', duration)
+    history.save()
+    loaded = History(tmp_path / 'history.json')
+    assert loaded.durations('ap1') == [20, 30, 40]
+    assert loaded.devices['ap1']['model'] == 'hAP'
+    assert not (tmp_path / 'history.json.tmp').exists()
+
+
+@pytest.mark.parametrize('content', ['', '{"devices": [', '[1, 2]'])
+def test_broken_file_is_empty_history(tmp_path, content):
+    (tmp_path / 'history.json').write_text(content)
+    assert History(tmp_path / 'history.json').devices == {}
+
+
+def test_estimate_fallbacks(tmp_path):
+    history = History(tmp_path / 'history.json')
+    history.record('ccr1', 'CCR2004', 300)
+    history.record('ccr1', 'CCR2004', 400)
+    history.record('ccr1', 'CCR2004', 320)
+    history.record('hap1', 'hAP', 40)
+    assert history.estimate(_device('ccr1'), 240) == 320
+    assert history.estimate(_device('ccr2', 'CCR2004'), 240) == 320
+    assert history.estimate(_device('new'), 240) == 310
+    assert History(tmp_path / 'none.json').estimate(_device('x'), 240) == 240
+
+
+def test_predict_and_longest_first():
+    devices = [_device(name) for name in ('a', 'b', 'c', 'd')]
+    estimates = {'a': 40, 'b': 40, 'c': 40, 'd': 360}
+    assert [d.name for d in longest_first(devices, estimates)] == [
+        'd', 'a', 'b', 'c',
+    ]
+    # the slow device started last drags on alone
+    assert predict(devices, estimates, jobs=2) == 400
+    assert predict(longest_first(devices, estimates), estimates, 2) == 360
+    assert predict([], estimates, 2) == 0
+
+
+def test_fit_deadline():
+    devices = [_device(name) for name in ('a', 'b', 'c', 'd')]
+    estimates = {'a': 100, 'b': 200, 'c': 300, 'd': 700}
+    scheduled, skipped = fit_deadline(devices, estimates, 2, 400)
+    assert [d.name for d in scheduled] == ['c', 'b', 'a']
+    assert [d.name for d in skipped] == ['d']
+
+
+def test_seconds_until():
+    now = datetime.datetime(2024, 5, 1, 22, 30)
+    assert seconds_until('23:00', now) == 30 * 60
+    assert seconds_until('05:00', now) == 6.5 * 3600
+    with pytest.raises(ValueError):
+        seconds_until('25:00', now)
+
+
+def test_reboot_plan():
+    first_probe, poll_interval, timeout = reboot_plan([40, 42, 44, 60])
+    assert first_probe == 32.2
+    assert poll_interval == 2.1
+    assert timeout == 116
+    # slow devices poll at most every 5 seconds
+    assert reboot_plan([360, 380, 400])[1:] == (5, 627)
+
+
+def test_reboots_fall_back_to_model(tmp_path):
+    history = History(tmp_path / 'history.json')
+    history.record_reboot('hap1', 'hAP', 40)
+    history.record_reboot('hap1', 'hAP', 42)
+    assert history.reboots(_device('hap1')) == []
+    history.record_reboot('hap2', 'hAP', 44)
+    assert history.reboots(_device('hap1')) == [40, 42, 44]
+    assert history.reboots(_device('hap3', 'hAP')) == [40, 42, 44]
+    assert history.reboots(_device('ccr1', 'CCR2004')) == []
+
+
+def test_adapt_reboot_keeps_configured_values(tmp_path):
+    history = History(tmp_path / 'history.json')
+    for seconds in (40, 42, 44, 60):
+        history.record_reboot('hap1', 'hAP', seconds)
+    d = _device('hap1')
+    d.reboot_first_probe = None
+    d.reboot_poll_interval = 10
+    d.reboot_timeout = None
+    assert history.adapt_reboot(d) is True
+    assert (d.reboot_first_probe, d.reboot_poll_interval, d.reboot_timeout) \
+        == (32.2, 10, 116)
+    assert history.adapt_reboot(_device('new')) is False
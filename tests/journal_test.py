@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from mu.journal import Journal
+from mu.journal import journal_path
+
+
+def test_mark_and_resume(tmp_path):
+    journal = Journal(tmp_path, 'run1')
+    journal.mark('r1', 'backup', file='r1-20240101-1200.backup')
+    journal.mark('r1', 'export')
+    journal.mark('r2', 'backup', file='r2.backup')
+    journal.close()
+
+    resumed = Journal.resume(tmp_path, 'run1', attempt='run2')
+    assert resumed.done('r1', 'export')
+    assert not resumed.done('r2', 'export')
+    assert resumed.get('r1', 'backup')['file'] == 'r1-20240101-1200.backup'
+    assert resumed.get('r1', 'backup')['attempt'] == 'run1'
+    resumed.mark('r2', 'export')
+    resumed.close()
+    lines = journal_path(tmp_path, 'run1').read_text().splitlines()
+    assert len(lines) == 4
+    assert json.loads(lines[-1])['attempt'] == 'run2'
+    assert Journal(tmp_path, 'run1').summary()['export'] == 2
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    journal = Journal(tmp_path, 'run1')
+    journal.mark('r1', 'backup')
+    journal.close()
+    with open(journal_path(tmp_path, 'run1'), 'a') as stream:
+        stream.write('{"device": "r1", "st')
+    resumed = Journal.resume(tmp_path, 'run1')
+    assert resumed.done('r1', 'backup')
+    assert resumed.steps.keys() == {'r1'}
+
+
+def test_resume_unknown_run(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Journal.resume(tmp_path, 'nope')
@@ -0,0 +1,75 @@
+import threading
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import paramiko
+import pytest
+
+from mu.keys import KeyProvider
+
+
+@pytest.fixture(scope='module')
+def key_files(tmp_path_factory):
+    path = tmp_path_factory.mktemp('keys')
+    files = []
+    for key in (
+        paramiko.RSAKey.generate(1024),
+        paramiko.ECDSAKey.generate(),
+    ):
+        key_file = path / f'id_{key.get_name()}'
+        key.write_private_key_file(str(key_file))
+        files.append(str(key_file))
+    return files
+
+
+def test_keys_loaded_once_for_all_threads(key_files):
+    provider = KeyProvider(key_files)
+    results = []
+    with patch(
+        'paramiko.PKey.from_path',
+        side_effect=paramiko.PKey.from_path,
+    ) as from_path:
+        threads = [
+            threading.Thread(target=lambda: results.append(provider.keys()))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert from_path.call_count == len(key_files)
+    assert all(keys is results[0] for keys in results)
+    assert [key.get_name() for key in results[0]] == [
+        'ssh-rsa', 'ecdsa-sha2-nistp256',
+    ]
+
+
+def test_missing_key_file_raises_oserror_once(tmp_path):
+    provider = KeyProvider([str(tmp_path / 'missing')])
+    with patch(
+        'paramiko.PKey.from_path',
+        side_effect=FileNotFoundError('missing'),
+    ) as from_path:
+        for _ in range(2):
+            with pytest.raises(OSError, match='cannot load private key'):
+                provider.keys()
+    from_path.assert_called_once()
+
+
+def test_auth_strategy_sources():
+    key = MagicMock(spec=paramiko.PKey)
+    agent_key = MagicMock(spec=paramiko.AgentKey)
+    provider = KeyProvider(keys=[key], use_agent=True)
+    with patch('paramiko.Agent') as agent:
+        agent.return_value.get_keys.return_value = (agent_key,)
+        sources = list(provider.auth_strategy('admin').get_sources())
+        provider.agent_keys()
+    assert [source.pkey for source in sources] == [key, agent_key]
+    assert all(source.username == 'admin' for source in sources)
+    # one agent connection per thread
+    agent.assert_called_once()
+
+
+def test_no_keys_disabled():
+    assert KeyProvider().enabled is False
+    assert KeyProvider().agent_keys() == []
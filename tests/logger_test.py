@@ -1,10 +1,14 @@
+import gzip
+import json
 import pathlib
+import threading
 from datetime import datetime
 from unittest.mock import mock_open
 from unittest.mock import patch
 
 import pytest
 
+from mu.logger import LogFile
 from mu.logger import Logger
 
 
@@ -39,6 +43,7 @@ def test_logger_log_to_file(tmpdir_path):
             mock_datetime.now.return_value = timestamp
             logger = Logger(str(tmpdir_path))
             logger.log('INFO', 'device1', 'Test message')
+            logger.flush()
             mock_file().write.assert_called_once_with(
                 f'{timestamp} - INFO - device1 - Test message \n',
             )
@@ -65,3 +70,196 @@ def test_logger_permission_error(capsys):
             logger.log('ERROR', 'device1', 'Test message')
         captured = capsys.readouterr()
         assert 'Unable to write to test.log' in captured.out
+
+
+def test_logger_keeps_handle_open(tmp_path):
+    logger = Logger(str(tmp_path))
+    with patch('builtins.open', mock_open()) as mock_file:
+        for i in range(5):
+            logger.log('INFO', 'device1', f'message {i}')
+        logger.flush()
+        mock_file.assert_called_once_with(logger.log_file, 'a')
+    logger.close()
+
+
+def test_logger_close_writes_pending_lines(tmp_path):
+    logger = Logger(str(tmp_path))
+    for i in range(100):
+        logger.log('INFO', 'device1', f'message {i}')
+    logger.close()
+    lines = logger.log_file.read_text().splitlines()
+    assert len(lines) == 100
+    assert lines[-1].endswith(' - INFO - device1 - message 99 ')
+
+
+def test_logger_log_after_close_is_not_written(tmp_path, capsys):
+    logger = Logger(str(tmp_path))
+    logger.log('INFO', 'device1', 'first')
+    logger.close()
+    logger.log('INFO', 'device1', 'second', stdout=True)
+    logger.close()
+    assert logger._writer is None
+    assert len(logger.log_file.read_text().splitlines()) == 1
+    assert 'second' in capsys.readouterr().out
+
+
+def test_logger_atexit_only_while_open(tmp_path):
+    with patch('mu.logger.atexit') as mock_atexit:
+        logger = Logger(str(tmp_path))
+        mock_atexit.register.assert_not_called()
+        logger.log('INFO', 'device1', 'first')
+        mock_atexit.register.assert_called_once_with(logger.close)
+        logger.close()
+        mock_atexit.unregister.assert_called_once_with(logger.close)
+
+
+def test_logger_threads_write_whole_lines(tmp_path):
+    logger = Logger(str(tmp_path), batch_size=7)
+
+    def worker(n):
+        for i in range(200):
+            logger.log('INFO', f'device{n}', 'x' * 100 + f' {i}')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    logger.close()
+    lines = logger.log_file.read_text().splitlines()
+    assert len(lines) == 1600
+    for line in lines:
+        assert line.split(' - ')[3].startswith('x' * 100)
+
+
+@pytest.mark.parametrize(
+    'policy, expected_calls', [
+        ('never', 0),
+        ('batch', 2),
+        ('close', 2),
+    ],
+)
+def test_logger_fsync_policy(tmp_path, policy, expected_calls):
+    logger = Logger(str(tmp_path), fsync=policy)
+    with patch('mu.logger.os.fsync') as mock_fsync:
+        logger.log('INFO', 'device1', 'one')
+        logger.flush()
+        logger.log('INFO', 'device1', 'two')
+        logger.close()
+    assert mock_fsync.call_count == expected_calls
+
+
+def test_logger_invalid_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        Logger(str(tmp_path), fsync='sometimes')
+
+
+def test_logger_json_lines(tmp_path):
+    logger = Logger(str(tmp_path), json_lines=True)
+    logger.log(
+        'info', 'device1', 'backup done', phase='backup', duration=1.5,
+    )
+    logger.close()
+    records = [
+        json.loads(line)
+        for line in logger.json_file.read_text().splitlines()
+    ]
+    assert len(records) == 1
+    assert records[0]['run_id'] == logger.run_id
+    assert records[0]['device'] == 'device1'
+    assert records[0]['msg'] == 'backup done'
+    assert records[0]['phase'] == 'backup'
+    assert records[0]['duration'] == 1.5
+    assert 'backup done' in logger.log_file.read_text()
+
+
+def test_logger_no_json_lines_by_default(tmp_path):
+    logger = Logger(str(tmp_path))
+    logger.log('info', 'device1', 'msg', phase='backup')
+    logger.close()
+    assert not logger.json_file.exists()
+
+
+def test_logger_per_device_files(tmp_path):
+    logger = Logger(str(tmp_path), per_device=True)
+    logger.log('info', 'script', 'started')
+    logger.log('info', 'ap 1', 'one')
+    logger.log('info', 'router', 'two')
+    logger.close()
+    assert 'one' in (tmp_path / 'devices' / 'ap_1.log').read_text()
+    assert 'two' in (tmp_path / 'devices' / 'router.log').read_text()
+    assert not (tmp_path / 'devices' / 'script.log').exists()
+    assert len(logger.log_file.read_text().splitlines()) == 3
+
+
+def test_logger_caps_open_per_device_files(tmp_path):
+    logger = Logger(str(tmp_path), per_device=True, max_open_files=2)
+    for name in ('r1', 'r2', 'r3', 'r1'):
+        logger.log('info', name, f'{name} line')
+        logger.flush()
+    open_files = {
+        path.name for path, log_file in logger._files.items()
+        if log_file.stream
+    }
+    assert open_files == {logger.log_file.name, 'r3.log', 'r1.log'}
+    logger.close()
+    assert (tmp_path / 'devices' / 'r1.log').read_text().count('r1 line') == 2
+
+
+def test_logger_size_rotation_compresses(tmp_path):
+    logger = Logger(str(tmp_path), max_bytes=200, backup_count=100)
+    for i in range(20):
+        logger.log('info', 'device1', f'message {i}')
+        logger.flush()
+    logger.close()
+    rotated = sorted(tmp_path.glob('mikrotik_update.log.*.gz'))
+    assert rotated
+    assert logger.log_file.stat().st_size <= 200
+    lines = []
+    for path in rotated:
+        with gzip.open(path, 'rt') as stream:
+            lines.extend(stream.read().splitlines())
+    lines.extend(logger.log_file.read_text().splitlines())
+    assert len(lines) == 20
+
+
+def test_logger_rotation_backup_count(tmp_path):
+    log_file = LogFile(tmp_path / 'test.log', backup_count=2, compress=False)
+    for _ in range(4):
+        log_file.write('line\n')
+        log_file.do_rotate()
+    log_file.close()
+    assert len(list(tmp_path.glob('test.log.*'))) == 2
+
+
+def test_logger_prune_keeps_newest_of_the_same_second(tmp_path):
+    for name in (
+        'test.log.20240101-120000-1.gz',
+        'test.log.20240101-120000.gz',
+        'test.log.20240101-115959.gz',
+        'test.log.20240101-120000-2.gz',
+        'test.log.20240101-120000-10.gz',
+        'test.log.gz',
+    ):
+        (tmp_path / name).touch()
+    LogFile(tmp_path / 'test.log', backup_count=2)._prune()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'test.log.20240101-120000-10.gz',
+        'test.log.20240101-120000-2.gz',
+        'test.log.gz',
+    ]
+
+
+def test_logger_time_rotation(tmp_path):
+    log_file = LogFile(tmp_path / 'test.log', rotate='daily')
+    log_file.write('yesterday\n')
+    log_file.period = '1970-01-01'
+    log_file.write('today\n')
+    log_file.close()
+    assert len(list(tmp_path.glob('test.log.*.gz'))) == 1
+    assert (tmp_path / 'test.log').read_text() == 'today\n'
+
+
+def test_logger_invalid_rotate(tmp_path):
+    with pytest.raises(ValueError):
+        Logger(str(tmp_path), rotate='hourly')
@@ -0,0 +1,139 @@
+import json
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from mu.metrics import CommandMetrics
+from mu.metrics import Histogram
+from mu.metrics import normalize_command
+from mu.metrics import output_failed
+
+
+@pytest.mark.parametrize(
+    'cmd, expected', [
+        ('system package update print', 'system package update print'),
+        ('system backup save name=r1-20240101-1200', 'system backup save'),
+        ('/export show-sensitive', 'export show-sensitive'),
+        ('system reboot\ny', 'system reboot'),
+        ('file remove r1-20240101-1200.backup', 'file remove'),
+        (
+            'user add name=mu password="a b" group=full',
+            'user add',
+        ),
+        (
+            'system package update set channel=testing',
+            'system package update set',
+        ),
+    ],
+)
+def test_normalize_command(cmd, expected):
+    assert normalize_command(cmd) == expected
+
+
+@pytest.mark.parametrize(
+    'lines, expected', [
+        (['  channel: stable'], False),
+        (['failure: backup failed'], True),
+        (['syntax error (line 1 column 5)'], True),
+        (['bad command name foo (line 1 column 1)'], True),
+        ([], False),
+    ],
+)
+def test_output_failed(lines, expected):
+    assert output_failed(lines) is expected
+
+
+def test_histogram_observe_and_quantile():
+    h = Histogram(bounds=(1.0, 2.0, float('inf')))
+    for value in (0.5, 0.7, 1.5, 10.0):
+        h.observe(value)
+    assert h.counts == [2, 1, 1]
+    assert h.count == 4
+    assert h.sum == pytest.approx(12.7)
+    assert h.min == 0.5
+    assert h.max == 10.0
+    assert h.quantile(0.5) == 1.0
+    assert h.quantile(0.75) == 2.0
+    assert h.quantile(1.0) == 10.0
+
+
+def test_histogram_quantile_capped_by_max():
+    h = Histogram()
+    h.observe(0.2)
+    assert h.quantile(0.95) == 0.2
+
+
+def test_command_metrics_record_groups_by_verb_and_model():
+    metrics = CommandMetrics()
+    metrics.record('file remove a.backup', 'hAP', 0.1, 10, 1, True)
+    metrics.record('file remove b.backup', 'hAP', 0.3, 0, 0, False)
+    metrics.record('file remove c.backup', 'CCR', 0.2, 0, 0, True)
+    stats = metrics.stats[('file remove', 'hAP')]
+    assert stats.calls == 2
+    assert stats.failures == 1
+    assert stats.bytes == 10
+    assert stats.lines == 1
+    assert stats.seconds.sum == pytest.approx(0.4)
+    assert ('file remove', 'CCR') in metrics.stats
+
+
+def test_command_metrics_summary_lines():
+    metrics = CommandMetrics()
+    assert metrics.summary_lines() == []
+    metrics.record('system identity print', 'hAP', 0.1, 20, 1, True)
+    metrics.record('/export show-sensitive', 'hAP', 3.0, 9000, 300, True)
+    lines = metrics.summary_lines()
+    assert lines[0].split()[:2] == ['command', 'model']
+    assert lines[1].startswith('export show-sensitive')
+    assert lines[2].startswith('system identity print')
+
+
+def test_command_metrics_write(tmp_path):
+    metrics = CommandMetrics()
+    metrics.record('system identity print', 'hAP', 0.1, 20, 1, True)
+    path = tmp_path / 'metrics.json'
+    metrics.write(path, run_id='run1')
+    data = json.loads(path.read_text())
+    assert data['run_id'] == 'run1'
+    assert data['commands'][0]['command'] == 'system identity print'
+    assert data['commands'][0]['seconds']['count'] == 1
+
+
+def test_ssh_call_records_metrics(disconnected_dev):
+    dev = disconnected_dev
+    dev.client = MagicMock()
+    dev.metrics = CommandMetrics()
+    dev.model = 'hAP'
+    mock_stdout = MagicMock()
+    mock_stdout.readlines.return_value = ['line1\n', 'line2\n']
+    dev.client.exec_command.return_value = (
+        MagicMock(), mock_stdout, MagicMock(),
+    )
+    with patch('mu.device.time.monotonic', side_effect=[1.0, 1.5]):
+        dev.ssh_call('system identity print')
+    stats = dev.metrics.stats[('system identity print', 'hAP')]
+    assert stats.calls == 1
+    assert stats.failures == 0
+    assert stats.bytes == 12
+    assert stats.lines == 2
+    assert stats.seconds.sum == pytest.approx(0.5)
+
+
+def test_ssh_call_records_failed_call(disconnected_dev):
+    dev = disconnected_dev
+    dev.client = MagicMock()
+    dev.metrics = CommandMetrics()
+    dev.client.exec_command.side_effect = Exception('boom')
+    with pytest.raises(Exception):
+        dev.ssh_call('system identity print')
+    stats = dev.metrics.stats[('system identity print', 'unknown')]
+    assert stats.failures == 1
+
+
+def test_get_model(disconnected_dev):
+    dev = disconnected_dev
+    dev.client = MagicMock()
+    output = ['        uptime: 1d', '    board-name: hAP ac^2']
+    with patch.object(dev, 'ssh_call', return_value=output):
+        assert dev._get_model() == 'hAP ac^2'
@@ -1,7 +1,19 @@
+import argparse
 import subprocess
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
 import pytest
 
+from mu.logger import Logger
+from mu.main import activate_device
+from mu.main import main
+from mu.main import run_devices
+from mu.main import stage_device
+from mu.main import version_groups
+from mu.staging import StagingRecord
+from mu.watchdog import SessionTimeout
+
 
 @pytest.mark.parametrize(
     'stdout, arg, expected_output', [
@@ -15,8 +27,15 @@ import pytest
         (
             False,
             '--dry-run',
-            'usage: mu [-h] [-D] [-U | -B] [-d DEVICE_NAME] [-V] ' +
-            'configuration_file\nmu: error: the following arguments ' +
+            'usage: mu [-h] [-D] [-U | -B] [-d DEVICE_NAME] ' +
+            '[--metrics-file METRICS_FILE]\n' +
+            '          [--textfile TEXTFILE] [--trace TRACE] ' +
+            '[--profile DIR]\n' +
+            '          [--record DIR | --replay DIR] [--resume RUN_ID] ' +
+            '[--report FILE]\n' +
+            '          [--deadline HH:MM] [-j JOBS] [-V]\n' +
+            '          configuration_file\n' +
+            'mu: error: the following arguments ' +
             'are required: configuration_file\n',
         ),
     ],
@@ -31,3 +50,179 @@ def test_mu_parameters(stdout, arg, expected_output):
         assert expected_output in result.stdout
     else:
         assert result.stderr == expected_output
+
+
+def test_check_config(tmp_path):
+    good = tmp_path / 'good.yaml'
+    good.write_text(
+        'global:\n'
+        '  backup_dir: /tmp\n'
+        '  private_key_file: /nonexistent\n'
+        'devices:\n'
+        '  - name: r1\n'
+        '    address: 10.0.0.1\n',
+    )
+    bad = tmp_path / 'bad.yaml'
+    bad.write_text('global:\n  backup_dir: /tmp\ndevices: []\n')
+    result = subprocess.run(
+        ['python3', '-X', 'importtime', '-m', 'mu', 'check-config', good],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+    assert f'{good}: OK' in result.stdout
+    # the key is not loaded and paramiko is not imported, nor the
+    # modules only the runs need
+    for module in ('paramiko', 'asyncio', 'concurrent', 'statistics'):
+        assert module not in result.stderr
+    result = subprocess.run(
+        ['python3', '-m', 'mu', 'check-config', good, bad],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    assert f'{bad}: invalid' in result.stdout
+
+
+def test_version_groups_sorted_numerically():
+    devices = [
+        MagicMock(installed_version=version)
+        for version in ('7.10', '7.9', 'unknown', '7.10')
+    ]
+    for i, d in enumerate(devices, 1):
+        d.name = f'r{i}'
+    assert version_groups(devices) == [
+        ('7.9', ['r2']),
+        ('7.10', ['r1', 'r4']),
+        ('unknown', ['r3']),
+    ]
+
+
+def test_stage_commands_reject_other_actions(capsys):
+    with pytest.raises(SystemExit):
+        main(['activate', '--update-only', 'mu.yaml'])
+    assert 'usage: mu activate' in capsys.readouterr().err
+
+
+def test_profile_rejects_parallel_jobs(capsys):
+    with pytest.raises(SystemExit):
+        main(['--dry-run', '--profile', 'prof', '-j', '4', 'mu.yaml'])
+    assert '--profile can not be used with --jobs above 1' in \
+        capsys.readouterr().err
+
+
+def test_profile_closed_on_early_return(tmp_path):
+    config_file = tmp_path / 'mu.yaml'
+    config_file.write_text(
+        'global:\n'
+        f'  backup_dir: {tmp_path}\n'
+        f'  log_dir: {tmp_path}\n'
+        '  private_key_file: /nonexistent\n'
+        'devices:\n'
+        '  - name: r1\n'
+        '    address: 10.0.0.1\n',
+    )
+    with patch('mu.profiler.Profiler') as mock_profiler:
+        assert main([
+            '--profile', str(tmp_path / 'prof'),
+            '--report', str(tmp_path / 'report.jsonl'),
+            '-d', 'r2',
+            str(config_file),
+        ]) == 1
+    mock_profiler.return_value.stop.assert_called_once()
+    mock_profiler.return_value.write.assert_called_once()
+    log = (tmp_path / 'mikrotik_update.log').read_text()
+    assert 'profile written to' in log
+
+    config_file.write_text('global:\n  backup_dir: /tmp\ndevices: []\n')
+    with patch('mu.profiler.Profiler') as mock_profiler:
+        assert main(['--profile', 'prof', str(config_file)]) == 1
+    mock_profiler.assert_not_called()
+
+
+def test_stage_device_records_staged_update(tmp_path):
+    staging = StagingRecord(tmp_path / 'staged.json')
+    d = MagicMock()
+    d.name = 'ap1'
+    d.backup.return_value = True
+    d.stage.return_value = {'type': 'online', 'version': '7.16'}
+    stage_device(d, MagicMock(spec=Logger), staging)
+    assert staging.get('ap1')['version'] == '7.16'
+    d.update.assert_not_called()
+    d.ssh_close.assert_called_once()
+
+
+def test_activate_device(tmp_path):
+    staging = StagingRecord(tmp_path / 'staged.json')
+    staging.mark('ap1', type='online', version='7.16')
+    d = MagicMock(update_firmware=False, failures={})
+    d.name = 'ap1'
+    d.activate.return_value = True
+    activate_device(d, MagicMock(spec=Logger), staging)
+    assert d.activate.call_args[0][0]['version'] == '7.16'
+    assert staging.get('ap1') is None
+    d.mark_step.assert_called_once_with('done')
+
+    other = MagicMock()
+    other.name = 'ap2'
+    activate_device(other, MagicMock(spec=Logger), staging)
+    other.ssh_test.assert_not_called()
+
+
+def test_activate_skips_firmware_after_failed_reboot(tmp_path):
+    staging = StagingRecord(tmp_path / 'staged.json')
+    staging.mark('ap1', type='online', version='7.16')
+    d = MagicMock(update_firmware=True, failures={})
+    d.name = 'ap1'
+
+    def activate(staged):
+        d.failures['reboot-wait'] = 1
+        return False
+
+    d.activate.side_effect = activate
+    activate_device(d, MagicMock(spec=Logger), staging)
+    d.firmware_update.assert_not_called()
+    d.mark_step.assert_not_called()
+
+
+def test_run_devices_survives_session_timeout():
+    args = argparse.Namespace(jobs=2)
+    hung = MagicMock(failures={}, session_timeout=0)
+    hung.name = 'hung'
+    ok = MagicMock(failures={}, session_timeout=0)
+    ok.name = 'ok'
+
+    def process(d, args, logger):
+        if d is hung:
+            raise SessionTimeout('session exceeded 60s')
+
+    with patch('mu.main.process_device', side_effect=process) as mock:
+        assert run_devices([hung, ok], args, MagicMock(spec=Logger))
+    assert mock.call_count == 2
+    hung.record_failure.assert_called_once_with('timeout')
+    hung.ssh_close.assert_called_once()
+    ok.record_failure.assert_not_called()
+
+
+def test_run_devices_survives_device_errors():
+    args = argparse.Namespace(jobs=2)
+    broken = MagicMock(failures={}, session_timeout=0)
+    broken.name = 'broken'
+    ok = MagicMock(failures={}, session_timeout=0)
+    ok.name = 'ok'
+    report = MagicMock()
+
+    def process(d, args, logger):
+        if d is broken:
+            raise ValueError('unexpected output')
+
+    with patch('mu.main.process_device', side_effect=process):
+        assert run_devices(
+            [broken, ok],
+            args,
+            MagicMock(spec=Logger),
+            report=report,
+        )
+    broken.record_failure.assert_called_once_with('error')
+    ok.record_failure.assert_not_called()
+    assert report.write.call_count == 2
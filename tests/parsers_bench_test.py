@@ -0,0 +1,54 @@
+import pytest
+
+from benchmarks.parsers_bench import compare
+from benchmarks.parsers_bench import measure
+from benchmarks.parsers_bench import recorded_cases
+from benchmarks.parsers_bench import synthetic_cases
+from benchmarks.parsers_bench import synthetic_router
+from mu.replay import Recorder
+
+
+@pytest.fixture(scope='module')
+def cases():
+    return synthetic_cases(synthetic_router(packages=40, files=20, users=5))
+
+
+def test_synthetic_cases_parse(cases):
+    assert len(cases['get_installed_packages[40]']()) == 40
+    assert cases['_get_channel']() == 'stable'
+    assert cases['check_key_file[21]']() is True
+    assert cases['user_exists[5]']() is False
+    assert cases['version_is_lower']() is True
+
+
+def test_measure(cases):
+    result = measure(cases['_get_channel'], repeat=1, min_time=0.01)
+    assert result['ns_per_call'] > 0
+    assert result['peak_bytes'] > 0
+    assert result['calls'] >= 1
+
+
+def test_recorded_cases(tmp_path):
+    recorder = Recorder(tmp_path)
+    event = {
+        'type': 'exec',
+        'cmd': 'system package update print',
+        'out': ['  channel: stable\r\n'],
+    }
+    recorder.record('r1', event)
+    recorder.close()
+    cases = recorded_cases(str(tmp_path))
+    assert list(cases) == ['recorded:r1:_get_channel']
+    assert cases['recorded:r1:_get_channel']() == 'stable'
+
+
+def test_compare():
+    baseline = {'a': {'ns_per_call': 100}, 'b': {'ns_per_call': 100}}
+    results = {
+        'a': {'ns_per_call': 120},
+        'b': {'ns_per_call': 200},
+        'c': {'ns_per_call': 1},
+    }
+    assert compare(results, baseline, 0.25) == [
+        'b: 200 ns/call, baseline 100 (2.00x)',
+    ]
@@ -0,0 +1,67 @@
+import socket
+from unittest.mock import MagicMock
+
+import pytest
+
+from mu.main import prescan_devices
+from mu.prescan import prescan
+
+
+@pytest.fixture
+def listening_port():
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        yield server.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_prescan(listening_port, closed_port):
+    targets = [
+        ('127.0.0.1', listening_port),
+        ('127.0.0.1', closed_port),
+        ('host.invalid', 22),
+        ('127.0.0.1', listening_port),
+    ]
+    errors = prescan(targets, timeout=2)
+    assert list(errors) == [
+        ('127.0.0.1', listening_port),
+        ('127.0.0.1', closed_port),
+        ('host.invalid', 22),
+    ]
+    assert errors[('127.0.0.1', listening_port)] is None
+    assert 'refused' in errors[('127.0.0.1', closed_port)].lower()
+    assert errors[('host.invalid', 22)].startswith(
+        'cannot resolve host.invalid',
+    )
+
+
+def test_prescan_limit(listening_port):
+    targets = [('127.0.0.1', listening_port)] * 3 + [
+        ('localhost', listening_port),
+    ]
+    assert prescan(targets, timeout=2, limit=1) == {
+        ('127.0.0.1', listening_port): None,
+        ('localhost', listening_port): None,
+    }
+
+
+def test_prescan_devices(listening_port, closed_port):
+    up = MagicMock(address='127.0.0.1', port=listening_port)
+    down = MagicMock(address='127.0.0.1', port=closed_port)
+    down.name = 'down'
+    logger = MagicMock()
+    reachable, unreachable = prescan_devices([up, down], 2, logger)
+    assert (reachable, unreachable) == ([up], [down])
+    up.record_failure.assert_not_called()
+    down.record_failure.assert_called_once_with('connect')
+    assert logger.log.call_args_list[0].args[:2] == ('error', 'down')
+    assert logger.log.call_args_list[1].args[2].startswith(
+        'prescan: 1 of 2 devices reachable',
+    )
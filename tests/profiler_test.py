@@ -0,0 +1,52 @@
+from mu.profiler import Profiler
+
+
+def _busy():
+    return sum(i * i for i in range(1000))
+
+
+def _parse():
+    return [line.split() for line in ['a b c'] * 100]
+
+
+def test_profiler_sections(tmp_path):
+    profiler = Profiler()
+    profiler.start()
+    _busy()
+    with profiler.section('router', 'check'):
+        _parse()
+        with profiler.section('router', 'connect'):
+            _busy()
+    profiler.stop()
+    profiler.write(tmp_path, top=10)
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names == [
+        'all.pstats',
+        'router.check.pstats',
+        'router.connect.pstats',
+        'script.main.pstats',
+        'summary.txt',
+    ]
+    summary = (tmp_path / 'summary.txt').read_text()
+    assert '===== router / check =====' in summary
+    check = summary.split('===== router / check =====')[1].split('=====')[0]
+    assert '_parse' in check
+    assert '_busy' not in check
+
+
+def test_profiler_section_without_start(tmp_path):
+    profiler = Profiler()
+    with profiler.section('router', 'check'):
+        _busy()
+    profiler.write(tmp_path)
+    assert (tmp_path / 'summary.txt').read_text() == ''
+
+
+def test_device_phase_uses_profiler(disconnected_dev):
+    profiler = Profiler()
+    disconnected_dev.profiler = profiler
+    profiler.start()
+    with disconnected_dev.phase('backup'):
+        _busy()
+    profiler.stop()
+    assert ('router', 'backup') in profiler.profiles
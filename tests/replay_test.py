@@ -0,0 +1,222 @@
+import gzip
+import json
+import time
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import paramiko
+import pytest
+import yaml
+
+from mu.config import Config
+from mu.device import Device
+from mu.keys import KeyProvider
+from mu.logger import Logger
+from mu.main import main
+from mu.replay import command_key
+from mu.replay import Recorder
+from mu.replay import Recording
+from mu.replay import recording_path
+from mu.replay import redact
+from mu.replay import ReplayClient
+from mu.replay import Replayer
+from mu.simulator import Fleet
+from mu.simulator import SimulatedRouter
+
+_sleep = time.sleep
+
+
+@pytest.mark.parametrize(
+    'text, expected', [
+        (
+            'user add name=a password=abc',
+            'user add name=a password=<redacted>',
+        ),
+        (
+            'set wpa2-pre-shared-key="a b\\"c" mode=x',
+            'set wpa2-pre-shared-key=<redacted> mode=x',
+        ),
+        ('add secret=s;add', 'add secret=<redacted>;add'),
+        (
+            'user ssh-keys import public-key-file=k.pub',
+            'user ssh-keys import public-key-file=k.pub',
+        ),
+        ('set auto-upgrade=yes', 'set auto-upgrade=yes'),
+        (
+            '/snmp community\nset [ find default=yes ] name=public\n'
+            'add addresses=10.0.0.0/8 name="b c"\n'
+            '/system identity\nset name=r1\n',
+            '/snmp community\nset [ find default=yes ] name=<redacted>\n'
+            'add addresses=10.0.0.0/8 name=<redacted>\n'
+            '/system identity\nset name=r1\n',
+        ),
+        (
+            'snmp community set 0 name=x',
+            'snmp community set 0 name=<redacted>',
+        ),
+    ],
+)
+def test_redact(text, expected):
+    assert redact(text) == expected
+
+
+def test_command_key_ignores_backup_timestamp():
+    assert command_key('system backup save name=r1-20240101-1200') == \
+        command_key('system backup save name=r1-20251231-2359')
+
+
+def test_recording_repeats_last_response():
+    recording = Recording([
+        {'type': 'exec', 'cmd': 'a', 'out': ['1\n']},
+        {'type': 'exec', 'cmd': 'a', 'out': ['2\n']},
+    ])
+    client = ReplayClient(recording)
+    outputs = [client.exec_command('a')[1].readlines() for _ in range(3)]
+    assert outputs == [['1\n'], ['2\n'], ['2\n']]
+
+
+def test_replay_unknown_command_raises():
+    client = ReplayClient(Recording([]))
+    with pytest.raises(paramiko.SSHException):
+        client.exec_command('system identity print')
+
+
+@pytest.mark.parametrize(
+    'error, exception', [
+        ('auth', paramiko.AuthenticationException),
+        ('ssh', paramiko.SSHException),
+        ('os', OSError),
+    ],
+)
+def test_replay_connect_failures(error, exception):
+    recording = Recording([
+        {'type': 'connect', 'ok': False, 'error': error, 'message': 'x'},
+    ])
+    client = ReplayClient(recording)
+    with pytest.raises(exception):
+        client.connect(hostname='h')
+    # once the recorded attempts run out, connecting succeeds
+    client.connect(hostname='h')
+
+
+def test_replayer_missing_recording(tmp_path, disconnected_dev):
+    with pytest.raises(FileNotFoundError):
+        Replayer(tmp_path).attach(disconnected_dev)
+
+
+def _device(conf, port):
+    return Device(
+        conf=conf,
+        name='sim1',
+        address='127.0.0.1',
+        port=port,
+        username='admin',
+        update_type='online',
+        logger=MagicMock(spec=Logger),
+    )
+
+
+def test_recorded_scp_keeps_socket_timeout(tmp_path, disconnected_dev):
+    recorder = Recorder(tmp_path)
+    recorder.attach(disconnected_dev)
+    disconnected_dev.command_timeout = 42
+    disconnected_dev.client = MagicMock()
+    with patch('mu.replay.SCPClient') as mock_scp:
+        disconnected_dev._open_scp()
+    recorder.close()
+    assert mock_scp.call_args.kwargs == {'socket_timeout': 42}
+
+
+def test_record_and_replay_update(tmp_path):
+    router = SimulatedRouter('sim1', boot_time=0.2)
+    router.start()
+    conf = MagicMock(spec=Config)
+    conf.keys = KeyProvider(keys=[paramiko.RSAKey.generate(2048)])
+    conf.reboot_timeout = 10
+    conf.backup_dir = tmp_path / 'recorded'
+    conf.delete_backup_after_download = False
+    recorder = Recorder(tmp_path / 'sessions')
+    dev = _device(conf, router.port)
+    recorder.attach(dev)
+    try:
+        with patch('mu.device.time.sleep', lambda s: _sleep(min(s, 0.5))):
+            dev.ssh_connect()
+            assert dev.get_update_available() is True
+            assert dev.backup() is True
+            dev.update()
+            dev.ssh_close()
+    finally:
+        recorder.close()
+        router.stop()
+    assert dev.installed_version == '7.16'
+
+    path = recording_path(tmp_path / 'sessions', 'sim1')
+    with gzip.open(path, 'rt') as stream:
+        content = stream.read()
+    assert 'simulated-secret' not in content
+    assert 'simulated-community' not in content
+    assert 'wpa2-pre-shared-key=<redacted>' in content
+    header = json.loads(content.splitlines()[0])
+    assert header['device'] == 'sim1'
+
+    # the router is gone, the replay must not need it
+    conf.backup_dir = tmp_path / 'replayed'
+    replayed = _device(conf, router.port)
+    Replayer(tmp_path / 'sessions').attach(replayed)
+    assert replayed.reboot_poll_interval == 0
+    start = time.monotonic()
+    with patch('mu.device.time.sleep'):
+        replayed.ssh_connect()
+        assert replayed.get_update_available() is True
+        assert replayed.backup() is True
+        replayed.update()
+    assert time.monotonic() - start < 2
+    assert replayed.installed_version == '7.16'
+    assert replayed.identity == 'sim1'
+    assert replayed.backup_size == router.backup_size
+    assert replayed.failures == {}
+    export = conf.backup_dir / replayed.export_file_full_name
+    assert 'wpa2-pre-shared-key=<redacted>' in export.read_text()
+
+
+def test_replayed_run_leaves_the_state_alone(tmp_path):
+    key_file = tmp_path / 'id_rsa'
+    paramiko.RSAKey.generate(2048).write_private_key_file(str(key_file))
+    log_dir = tmp_path / 'log'
+    with Fleet(1, boot_time=0.2) as fleet:
+        config = fleet.config(
+            private_key_file=str(key_file),
+            backup_dir=str(tmp_path / 'backups'),
+            log_dir=str(log_dir),
+            textfile=str(tmp_path / 'mu.prom'),
+        )
+        config_file = tmp_path / 'mu.yaml'
+        config_file.write_text(yaml.safe_dump(config))
+        with patch('mu.device.time.sleep', lambda s: _sleep(min(s, 0.5))):
+            assert main([
+                '--record', str(tmp_path / 'sessions'),
+                str(config_file),
+            ]) == 0
+    state = {
+        path: path.read_bytes()
+        for path in [*log_dir.glob('journal/*'), log_dir / 'history.json']
+    }
+    textfile = (tmp_path / 'mu.prom').read_bytes()
+    backups = {
+        path: path.read_bytes() for path in (tmp_path / 'backups').iterdir()
+    }
+    assert len(state) == 2
+    assert backups
+
+    assert main([
+        '--replay', str(tmp_path / 'sessions'),
+        str(config_file),
+    ]) == 0
+    assert {
+        path: path.read_bytes()
+        for path in [*log_dir.glob('journal/*'), log_dir / 'history.json']
+    } == state
+    assert (tmp_path / 'mu.prom').read_bytes() == textfile
+    assert {
+        path: path.read_bytes() for path in (tmp_path / 'backups').iterdir()
+    } == backups
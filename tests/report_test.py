@@ -0,0 +1,72 @@
+import csv
+import json
+from unittest.mock import MagicMock
+
+from mu.report import device_row
+from mu.report import Report
+from mu.report import summary_lines
+
+
+def _device(name, installed='7.15', latest='7.15', failures=None):
+    d = MagicMock(
+        address='10.0.0.1',
+        identity=name,
+        model='hAP',
+        channel='stable',
+        installed_version=installed,
+        latest_version=latest,
+        update_available=installed != latest,
+        current_firmware='7.15',
+        upgrade_firmware='7.15',
+        installed_packages=[f'routeros {installed}'],
+        failures=failures or {},
+    )
+    d.name = name
+    return d
+
+
+def test_report_json_lines(tmp_path):
+    report = Report(tmp_path / 'report.jsonl')
+    report.write(_device('ap1', latest='7.16'))
+    # rows are flushed as they are written
+    row = json.loads((tmp_path / 'report.jsonl').read_text())
+    report.close()
+    assert row['name'] == 'ap1'
+    assert row['reachable'] is True
+    assert row['update_available'] is True
+    assert row['packages'] == ['routeros 7.15']
+
+
+def test_report_csv(tmp_path):
+    report = Report(tmp_path / 'report.csv')
+    report.write(_device('ap1'))
+    report.write(_device('ap2', failures={'connect': 1}))
+    report.close()
+    with open(tmp_path / 'report.csv') as stream:
+        rows = list(csv.DictReader(stream))
+    assert [r['name'] for r in rows] == ['ap1', 'ap2']
+    assert rows[0]['packages'] == 'routeros 7.15'
+    assert rows[1]['reachable'] == 'False'
+    assert rows[1]['failures'] == 'connect'
+
+
+def test_summary_lines_sorted_by_status_and_version():
+    rows = [
+        device_row(d) for d in (
+            _device('ok1'),
+            _device('down', installed='unknown', failures={'connect': 1}),
+            _device('new', installed='7.10', latest='7.16'),
+            _device('old', installed='7.9', latest='7.16'),
+        )
+    ]
+    lines = summary_lines(rows)
+    assert lines[0].split() == [
+        'device', 'status', 'installed', 'latest', 'firmware',
+    ]
+    assert [line.split()[:2] for line in lines[1:]] == [
+        ['old', 'update'],
+        ['new', 'update'],
+        ['down', 'unreachable'],
+        ['ok1', 'ok'],
+    ]
+    assert summary_lines([]) == []
@@ -0,0 +1,117 @@
+import pytest
+
+from mu.routeros import parse_properties
+from mu.routeros import parse_terse
+from mu.routeros import RouterOSVersion
+
+
+def test_parse_terse_items():
+    output = [
+        ' 0   name=routeros version=7.15 build-time=2024-05-17 12:00:00\r\n',
+        ' 1 X name=wireless version=7.15 scheduled=\r\n',
+    ]
+    assert parse_terse(output) == [
+        {
+            '.index': '0',
+            '.flags': '',
+            'name': 'routeros',
+            'version': '7.15',
+            'build-time': '2024-05-17 12:00:00',
+        },
+        {
+            '.index': '1',
+            '.flags': 'X',
+            'name': 'wireless',
+            'version': '7.15',
+            'scheduled': '',
+        },
+    ]
+
+
+def test_parse_terse_values_with_spaces():
+    output = [
+        ' 0   name=my key.pub type=.pub file size=400',
+        ' 1   name="quoted \\"name\\"" comment=x=y',
+    ]
+    items = parse_terse(output)
+    assert items[0]['name'] == 'my key.pub'
+    assert items[0]['type'] == '.pub file'
+    assert items[1]['name'] == 'quoted "name"'
+    assert items[1]['comment'] == 'x=y'
+
+
+def test_parse_terse_skips_other_lines():
+    output = [
+        'Columns: NAME, VERSION',
+        '# NAME VERSION',
+        '',
+        'bad command name print (line 1 column 1)',
+        ' 0 routeros 7.15',
+    ]
+    assert parse_terse(output) == []
+
+
+def test_parse_properties():
+    output = [
+        '          channel: stable\r\n',
+        '  installed-version: 7.15\r\n',
+        '             status: finding out latest version...\r\n',
+        '             status: New version is available\r\n',
+        '   build-time: 2024-05-17 12:00:00',
+        '   comment:',
+        'Columns: NAME',
+    ]
+    assert parse_properties(output) == {
+        'channel': 'stable',
+        'installed-version': '7.15',
+        'status': 'New version is available',
+        'build-time': '2024-05-17 12:00:00',
+        'comment': '',
+    }
+
+
+def test_parse_terse_selected_keys():
+    output = [
+        ' 0   name=my key.pub type=.pub file size=400\r\n',
+        ' 1 X name=wireless version=7.15\r\n',
+        ' 2   comment=no name here\r\n',
+        'Columns: NAME',
+    ]
+    assert parse_terse(output, keys=('name', 'size')) == [
+        {'name': 'my key.pub', 'size': '400'},
+        {'name': 'wireless'},
+    ]
+
+
+def test_routeros_version_order():
+    versions = [
+        '7.10', '7.9', '7.16', '7.16.1', '7.16rc1', '7.16beta2',
+        '7.16alpha1', '6.49.17', '10.0',
+    ]
+    assert sorted(versions, key=RouterOSVersion.parse) == [
+        '6.49.17', '7.9', '7.10', '7.16alpha1', '7.16beta2', '7.16rc1',
+        '7.16', '7.16.1', '10.0',
+    ]
+    assert RouterOSVersion.parse('7.16') == RouterOSVersion.parse('7.16.0')
+    assert RouterOSVersion.parse('7.16') is RouterOSVersion.parse('7.16')
+    assert RouterOSVersion.parse('7.16.1') >= RouterOSVersion.parse('7.16')
+    assert RouterOSVersion.parse('7.16rc1') <= RouterOSVersion.parse('7.16')
+
+
+def test_routeros_version_compared_with_other_types():
+    version = RouterOSVersion.parse('7.16')
+    assert version != '7.16'
+    for compare in (
+        lambda: version < '7.16',
+        lambda: version <= '7.16',
+        lambda: version > '7.16',
+        lambda: version >= 7,
+    ):
+        with pytest.raises(TypeError):
+            compare()
+
+
+@pytest.mark.parametrize('text', ['unknown', '', '7.16-beta', 'v7'])
+def test_routeros_version_invalid(text):
+    with pytest.raises(ValueError):
+        RouterOSVersion.parse(text)
@@ -0,0 +1,343 @@
+import time
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import paramiko
+import pytest
+
+from mu.config import Config
+from mu.device import Device
+from mu.journal import Journal
+from mu.keys import KeyProvider
+from mu.logger import Logger
+from mu.simulator import Fleet
+from mu.simulator import SimulatedRouter
+from mu.watchdog import SessionTimeout
+from mu.watchdog import Watchdog
+
+_sleep = time.sleep
+
+
+@pytest.fixture(scope='module')
+def host_key():
+    return paramiko.RSAKey.generate(2048)
+
+
+@pytest.fixture(scope='module')
+def client_key():
+    return paramiko.RSAKey.generate(2048)
+
+
+@pytest.fixture
+def router(host_key):
+    r = SimulatedRouter('sim1', host_key=host_key, boot_time=0.2)
+    r.start()
+    yield r
+    r.stop()
+
+
+@pytest.fixture
+def sim_dev(router, client_key, tmp_path):
+    conf = MagicMock(spec=Config)
+    conf.keys = KeyProvider(keys=[client_key])
+    conf.reboot_timeout = 10
+    conf.backup_dir = tmp_path / 'backups'
+    conf.delete_backup_after_download = True
+    dev = Device(
+        conf=conf,
+        name='sim1',
+        address=router.host,
+        port=router.port,
+        username='admin',
+        update_type='online',
+        logger=MagicMock(spec=Logger),
+    )
+    # reboot_and_wait polls every 5 seconds
+    with patch('mu.device.time.sleep', lambda s: _sleep(min(s, 0.5))):
+        yield dev
+    dev.ssh_close()
+
+
+def test_execute_unknown_command(host_key):
+    r = SimulatedRouter('sim1', host_key=host_key)
+    lines, after = r.execute('interface bogus print')
+    assert lines[0].startswith('bad command name')
+    assert after is None
+
+
+def test_execute_reboot_is_deferred(host_key):
+    r = SimulatedRouter('sim1', host_key=host_key)
+    _, after = r.execute('system reboot\ny')
+    assert after == 'reboot'
+    _, after = r.execute('system package downgrade\ny')
+    assert after == 'downgrade'
+
+
+def test_device_reads_simulated_router(sim_dev, router):
+    sim_dev.ssh_connect()
+    assert sim_dev.identity == 'sim1'
+    assert sim_dev.get_update_available() is True
+    assert sim_dev.installed_version == '7.15'
+    assert sim_dev.latest_version == '7.16'
+    assert sim_dev.get_installed_packages() == ['routeros 7.15']
+    sim_dev.refresh_firmware_info()
+    assert sim_dev.model == 'RB5009UG+S+'
+    assert sim_dev.current_firmware == '7.15'
+
+
+def test_device_backup_against_simulated_router(sim_dev, router):
+    sim_dev.ssh_connect()
+    assert sim_dev.backup() is True
+    backup = sim_dev.conf.backup_dir / sim_dev.backup_file_full_name
+    assert backup.stat().st_size == router.backup_size
+    assert sim_dev.backup_size == router.backup_size
+    export = sim_dev.conf.backup_dir / sim_dev.export_file_full_name
+    assert 'set name=sim1' in export.read_text()
+    # delete_backup_after_download
+    assert router.files == {}
+
+
+def test_device_online_update_against_simulated_router(sim_dev, router):
+    sim_dev.ssh_connect()
+    sim_dev.update()
+    assert router.reboots == 1
+    assert router.installed_version == '7.16'
+    assert sim_dev.installed_version == '7.16'
+    assert sim_dev.update_available is False
+    assert 'reboot-wait' in sim_dev.timings
+    assert sim_dev.failures == {}
+
+
+def test_device_manual_downgrade_against_simulated_router(
+        sim_dev,
+        router,
+        tmp_path,
+):
+    package = tmp_path / 'routeros-7.14-arm64.npk'
+    package.write_bytes(b'npk' * 1000)
+    sim_dev.update_type = 'manual'
+    sim_dev.packages = [str(package)]
+    sim_dev.ssh_connect()
+    sim_dev.update()
+    assert 'system package downgrade\ny' in router.commands
+    assert router.installed_version == '7.14'
+    assert sim_dev.installed_version == '7.14'
+    assert router.files == {}
+
+
+def test_device_firmware_update_against_simulated_router(
+        host_key,
+        client_key,
+        tmp_path,
+):
+    router = SimulatedRouter(
+        'sim1',
+        host_key=host_key,
+        boot_time=0.2,
+        firmware='7.12',
+    )
+    router.start()
+    conf = MagicMock(spec=Config)
+    conf.keys = KeyProvider(keys=[client_key])
+    conf.reboot_timeout = 10
+    dev = Device(
+        conf=conf,
+        name='sim1',
+        address=router.host,
+        port=router.port,
+        username='admin',
+        update_type='online',
+        logger=MagicMock(spec=Logger),
+    )
+    try:
+        with patch('mu.device.time.sleep', lambda s: _sleep(min(s, 0.5))):
+            dev.ssh_connect()
+            assert dev.firmware_update() is True
+        assert router.current_firmware == '7.15'
+        assert dev.current_firmware == '7.15'
+    finally:
+        dev.ssh_close()
+        router.stop()
+
+
+def test_router_is_down_while_booting(router):
+    router.boot_time = 0.5
+    port = router.port
+    router.handle_exec(MagicMock(), 'system reboot\ny')
+    _sleep(0.3)
+    assert router.is_up is False
+    assert router.wait_up(5) is True
+    assert router.port == port
+
+
+def test_fleet_config(host_key):
+    fleet = Fleet(3, host_key=host_key)
+    with fleet:
+        ports = [r.port for r in fleet.routers]
+        assert all(ports)
+        assert len(set(ports)) == 3
+        data = fleet.config(private_key_file='id_ed25519')
+    assert data['global']['private_key_file'] == 'id_ed25519'
+    assert [d['name'] for d in data['devices']] == [
+        'sim0001', 'sim0002', 'sim0003',
+    ]
+    assert [d['port'] for d in data['devices']] == ports
+    assert not any(r.is_up for r in fleet.routers)
+
+
+def test_update_records_journal(sim_dev, router, tmp_path):
+    sim_dev.journal = Journal(tmp_path / 'journal', 'run1')
+    sim_dev.ssh_connect()
+    assert sim_dev.backup() is True
+    sim_dev.update()
+    for step in ('backup', 'export', 'downloaded', 'rebooted', 'verified'):
+        assert sim_dev.step_done(step)
+    assert sim_dev.step_info('verified')['version'] == '7.16'
+
+
+def test_resume_reboots_downloaded_update(sim_dev, router, tmp_path):
+    journal = Journal(tmp_path / 'journal', 'run1')
+    journal.mark('sim1', 'backup', file='sim1-20240101-1200.backup')
+    journal.mark('sim1', 'export')
+    journal.mark('sim1', 'downloaded', version='7.16')
+    journal.close()
+    # the interrupted run downloaded the update
+    router.downloaded_version = '7.16'
+    sim_dev.journal = Journal.resume(tmp_path / 'journal', 'run1', 'run2')
+    sim_dev.ssh_connect()
+    assert sim_dev.get_update_available() is False
+    assert sim_dev.update_pending() is True
+    assert sim_dev.backup() is True
+    sim_dev.update()
+    assert not any('backup save' in cmd for cmd in router.commands)
+    assert not any('update download' in cmd for cmd in router.commands)
+    assert router.reboots == 1
+    assert router.installed_version == '7.16'
+    assert sim_dev.step_done('verified')
+
+
+def test_resume_verifies_rebooted_device(sim_dev, router, tmp_path):
+    journal = Journal(tmp_path / 'journal', 'run1')
+    journal.mark('sim1', 'downloaded', version='7.16')
+    journal.mark('sim1', 'rebooted')
+    journal.close()
+    router.packages['routeros'] = '7.16'
+    sim_dev.journal = Journal.resume(tmp_path / 'journal', 'run1', 'run2')
+    sim_dev.ssh_connect()
+    assert sim_dev.update_pending() is True
+    sim_dev.update()
+    assert router.reboots == 0
+    assert sim_dev.installed_version == '7.16'
+    assert sim_dev.step_done('verified')
+    assert sim_dev.update_pending() is False
+
+
+def test_stage_and_activate_online_update(sim_dev, router):
+    sim_dev.ssh_connect()
+    staged = sim_dev.stage()
+    assert staged == {'type': 'online', 'version': '7.16'}
+    assert router.reboots == 0
+    assert router.downloaded_version == '7.16'
+    # staging again finds the download
+    assert sim_dev.stage() == staged
+    assert 'package-download' in sim_dev.timings
+    assert len(sim_dev.timings['package-download']) == 1
+    assert sim_dev.activate(staged) is True
+    assert router.reboots == 1
+    assert router.installed_version == '7.16'
+    assert sim_dev.failures == {}
+
+
+def test_stage_and_activate_manual_update(sim_dev, router, tmp_path):
+    package = tmp_path / 'routeros-7.16-arm64.npk'
+    package.write_bytes(b'npk' * 1000)
+    sim_dev.update_type = 'manual'
+    sim_dev.packages = [str(package)]
+    sim_dev.ssh_connect()
+    staged = sim_dev.stage()
+    assert staged == {
+        'type': 'manual',
+        'packages': ['routeros-7.16-arm64.npk'],
+        'downgrade': False,
+    }
+    assert router.reboots == 0
+    assert sim_dev.activate(staged) is True
+    assert router.installed_version == '7.16'
+
+
+def test_activate_without_staged_update(sim_dev, router):
+    sim_dev.ssh_connect()
+    assert sim_dev.activate({'type': 'online', 'version': '7.16'}) is False
+    assert router.reboots == 0
+    assert sim_dev.failures == {'update': 1}
+
+
+def test_update_flashes_firmware_during_update_reboot(
+        host_key,
+        client_key,
+        tmp_path,
+):
+    router = SimulatedRouter(
+        'sim1',
+        host_key=host_key,
+        boot_time=0.2,
+        firmware='7.12',
+    )
+    router.start()
+    conf = MagicMock(spec=Config)
+    conf.keys = KeyProvider(keys=[client_key])
+    conf.reboot_timeout = 10
+    dev = Device(
+        conf=conf,
+        name='sim1',
+        address=router.host,
+        port=router.port,
+        username='admin',
+        update_type='online',
+        logger=MagicMock(spec=Logger),
+    )
+    dev.update_firmware = True
+    try:
+        with patch('mu.device.time.sleep', lambda s: _sleep(min(s, 0.5))):
+            dev.ssh_connect()
+            dev.update()
+            assert router.installed_version == '7.16'
+            assert router.firmware_upgrade_pending
+            assert dev.firmware_update() is True
+    finally:
+        dev.ssh_close()
+        router.stop()
+    assert router.reboots == 2
+    assert router.current_firmware == '7.16'
+    assert 'system routerboard upgrade' not in router.commands
+    # the auto-upgrade setting is restored
+    assert router.auto_upgrade is False
+    assert len(dev.timings['reboot-wait']) == 2
+    assert 'firmware' not in dev.timings
+
+
+def test_command_timeout_against_hung_router(sim_dev, router):
+    router.hang = ('system package update check-for-updates',)
+    sim_dev.command_timeout = 0.5
+    sim_dev.ssh_connect()
+    start = time.monotonic()
+    with pytest.raises(SessionTimeout, match='check-for-updates'):
+        sim_dev.refresh_update_info()
+    assert time.monotonic() - start < 5
+    # the session still works for the next command
+    assert sim_dev._get_identity() == 'sim1'
+
+
+def test_watchdog_aborts_hung_session(sim_dev, router):
+    router.hang = ('system package update check-for-updates',)
+    sim_dev.session_timeout = 0.5
+    sim_dev.ssh_connect()
+    watchdog = Watchdog(MagicMock(spec=Logger), interval=0.1)
+    start = time.monotonic()
+    with pytest.raises(SessionTimeout, match='session exceeded 0.5s'):
+        with watchdog.watch(sim_dev):
+            sim_dev.refresh_update_info()
+    watchdog.stop()
+    assert time.monotonic() - start < 5
+    with pytest.raises(SessionTimeout):
+        sim_dev.ssh_connect()
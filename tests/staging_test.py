@@ -0,0 +1,25 @@
+from mu.staging import StagingRecord
+
+
+def test_mark_clear_and_reload(tmp_path):
+    record = StagingRecord(tmp_path / 'staged.json')
+    record.mark('ap1', type='online', version='7.16')
+    record.mark('ap2', type='manual', packages=['routeros-7.16-arm.npk'])
+    record.clear('ap2')
+    record.clear('unknown')
+    loaded = StagingRecord(tmp_path / 'staged.json')
+    assert loaded.get('ap1')['version'] == '7.16'
+    assert loaded.get('ap2') is None
+    assert not (tmp_path / 'staged.json.tmp').exists()
+
+
+def test_broken_file_is_empty(tmp_path):
+    (tmp_path / 'staged.json').write_text('{"ap1": ')
+    assert StagingRecord(tmp_path / 'staged.json').devices == {}
+
+
+def test_read_only(tmp_path):
+    record = StagingRecord(tmp_path / 'staged.json', read_only=True)
+    record.mark('ap1', type='online', version='7.16')
+    assert record.get('ap1')['version'] == '7.16'
+    assert not (tmp_path / 'staged.json').exists()
@@ -0,0 +1,81 @@
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from mu.timing import merge_timings
+from mu.timing import percentile
+from mu.timing import summary_lines
+
+
+@pytest.mark.parametrize(
+    'values, pct, expected', [
+        ([], 50, 0.0),
+        ([3.0], 95, 3.0),
+        ([1.0, 2.0, 3.0], 50, 2.0),
+        ([1.0, 2.0, 3.0, 4.0], 50, 2.5),
+        ([4.0, 1.0, 3.0, 2.0], 100, 4.0),
+        ([0.0, 10.0], 95, 9.5),
+    ],
+)
+def test_percentile(values, pct, expected):
+    assert percentile(values, pct) == pytest.approx(expected)
+
+
+def test_merge_timings():
+    merged = merge_timings([
+        {'connect': [1.0], 'backup': [2.0]},
+        {'connect': [3.0]},
+    ])
+    assert merged == {'connect': [1.0, 3.0], 'backup': [2.0]}
+
+
+def test_summary_lines_order_and_values():
+    lines = summary_lines({
+        'custom': [1.0],
+        'backup': [1.0, 3.0],
+        'connect': [0.5],
+    })
+    assert lines[0].split() == ['phase', 'count', 'p50', 'p95', 'max', 'total']
+    assert [line.split()[0] for line in lines[1:]] == [
+        'connect', 'backup', 'custom',
+    ]
+    assert lines[2].split() == ['backup', '2', '2.00', '2.90', '3.00', '4.00']
+
+
+def test_summary_lines_empty():
+    assert summary_lines({}) == []
+
+
+def test_device_phase_records_timing(disconnected_dev):
+    with patch('mu.device.time.monotonic', side_effect=[10.0, 12.5]):
+        with disconnected_dev.phase('backup'):
+            pass
+    assert disconnected_dev.timings == {'backup': [2.5]}
+    disconnected_dev.logger.log.assert_called_once_with(
+        'info',
+        'router',
+        'phase backup took 2.50s',
+        phase='backup',
+        duration=2.5,
+    )
+
+
+def test_device_phase_records_timing_on_exception(disconnected_dev):
+    disconnected_dev.logger = MagicMock()
+    with pytest.raises(RuntimeError):
+        with disconnected_dev.phase('export'):
+            raise RuntimeError('boom')
+    assert len(disconnected_dev.timings['export']) == 1
+    assert disconnected_dev.failures == {'export': 1}
+
+
+def test_reboot_and_wait_records_phase(disconnected_dev):
+    dev = disconnected_dev
+    dev.client = MagicMock()
+    dev.conf.reboot_timeout = 30
+    with patch.object(dev, '_reboot'):
+        with patch.object(dev, 'simple_ssh_test', return_value=True):
+            with patch('time.sleep'):
+                dev.reboot_and_wait()
+    assert list(dev.timings) == ['reboot-wait']
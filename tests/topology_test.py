@@ -0,0 +1,66 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from mu.topology import check_topology
+from mu.topology import find_cycle
+from mu.topology import leaves_first
+from mu.topology import upstream_names
+
+
+def _device(name, upstream=()):
+    d = MagicMock()
+    d.name = name
+    d.upstream = list(upstream)
+    return d
+
+
+@pytest.mark.parametrize(
+    'value, expected', [
+        (None, []),
+        ('core', ['core']),
+        (['core', 'backup-core'], ['core', 'backup-core']),
+    ],
+)
+def test_upstream_names(value, expected):
+    assert upstream_names(value) == expected
+
+
+def test_find_cycle():
+    assert find_cycle({'ap1': ['core'], 'core': []}) is None
+    assert find_cycle({'a': ['b'], 'b': ['c'], 'c': ['a']}) == [
+        'a', 'b', 'c', 'a',
+    ]
+    assert find_cycle({'x': [], 'a': ['a']}) == ['a', 'a']
+    # unknown upstream names are not followed
+    assert find_cycle({'a': ['missing']}) is None
+
+
+def test_check_topology():
+    devices = [
+        {'name': 'core', 'upstream': 'ap1'},
+        {'name': 'ap1', 'upstream': ['core']},
+        {'name': 'ap2', 'upstream': 'gone'},
+    ]
+    assert check_topology(devices) == [
+        'Unknown upstream device gone of ap2!',
+        'Upstream cycle: core -> ap1 -> core',
+    ]
+
+
+def test_leaves_first():
+    devices = [
+        _device('core'),
+        _device('dist', ['core']),
+        _device('ap1', ['dist']),
+        _device('other'),
+        _device('ap2', ['dist', 'core']),
+    ]
+    ordered = [d.name for d in leaves_first(devices)]
+    assert ordered == ['ap1', 'other', 'ap2', 'dist', 'core']
+
+
+def test_leaves_first_ignores_devices_out_of_scope():
+    assert [d.name for d in leaves_first([_device('ap1', ['core'])])] == [
+        'ap1',
+    ]
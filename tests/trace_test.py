@@ -0,0 +1,85 @@
+import json
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from mu.trace import Tracer
+
+
+def _spans(tracer):
+    return [e for e in tracer.events if e['ph'] == 'X']
+
+
+def test_tracer_tracks_get_metadata():
+    tracer = Tracer()
+    assert tracer.track('router') == 1
+    assert tracer.track('ap1') == 2
+    assert tracer.track('router') == 1
+    names = [
+        e['args']['name'] for e in tracer.events
+        if e['name'] == 'thread_name'
+    ]
+    assert names == ['router', 'ap1']
+
+
+def test_tracer_span_nesting():
+    tracer = Tracer()
+    with tracer.span('router', 'backup', category='step'):
+        with tracer.span('router', 'system backup save', 'ssh') as args:
+            args['lines'] = 1
+    inner, outer = _spans(tracer)
+    assert outer['name'] == 'backup'
+    assert inner['args'] == {'lines': 1}
+    assert inner['cat'] == 'ssh'
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+    assert inner['tid'] == outer['tid'] == 1
+
+
+def test_tracer_span_recorded_on_exception():
+    tracer = Tracer()
+    with pytest.raises(RuntimeError):
+        with tracer.span('router', 'export'):
+            raise RuntimeError('boom')
+    assert _spans(tracer)[0]['name'] == 'export'
+
+
+def test_tracer_write(tmp_path):
+    tracer = Tracer()
+    with tracer.span('router', 'connect'):
+        pass
+    tracer.instant('router', 'connect failed')
+    path = tmp_path / 'trace.json'
+    tracer.write(path)
+    data = json.loads(path.read_text())
+    phases = [e['ph'] for e in data['traceEvents']]
+    assert phases.count('X') == 1
+    assert phases.count('i') == 1
+
+
+def test_device_spans(disconnected_dev):
+    dev = disconnected_dev
+    dev.tracer = Tracer()
+    dev.client = MagicMock()
+    dev.conf.reboot_timeout = 30
+    mock_stdout = MagicMock()
+    mock_stdout.readlines.return_value = ['ok\n']
+    dev.client.exec_command.return_value = (
+        MagicMock(), mock_stdout, MagicMock(),
+    )
+    with patch.object(dev, 'simple_ssh_test', return_value=True):
+        with patch('time.sleep'):
+            dev.reboot_and_wait()
+    spans = {e['name']: e for e in _spans(dev.tracer)}
+    assert spans['reboot_and_wait']['cat'] == 'step'
+    assert spans['reboot-wait']['cat'] == 'phase'
+    assert spans['system reboot']['cat'] == 'ssh'
+    assert spans['system reboot']['args'] == {
+        'lines': 1, 'bytes': 3, 'ok': True,
+    }
+
+
+def test_device_without_tracer(disconnected_dev):
+    with disconnected_dev.span('anything') as args:
+        args['x'] = 1
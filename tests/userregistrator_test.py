@@ -139,7 +139,7 @@ def test_check_key_file_found(connected_ur):
     connected_ur.public_key_file = pathlib.Path('mykey.pub')
     mock_stdout = MagicMock()
     mock_stdout.readlines.return_value = [
-        '0  mykey.pub  500\n',
+        ' 0   name=mykey.pub type=.pub file size=500\n',
     ]
     connected_ur.client.exec_command.return_value = (
         MagicMock(), mock_stdout, MagicMock(),
@@ -148,11 +148,24 @@ def test_check_key_file_found(connected_ur):
     assert result is True
 
 
+def test_check_key_file_name_with_spaces(connected_ur):
+    connected_ur.public_key_file = pathlib.Path('my key.pub')
+    mock_stdout = MagicMock()
+    mock_stdout.readlines.return_value = [
+        ' 0   name=my key.pub type=.pub file size=500\n',
+    ]
+    connected_ur.client.exec_command.return_value = (
+        MagicMock(), mock_stdout, MagicMock(),
+    )
+    assert connected_ur.check_key_file() is True
+    connected_ur.client.exec_command.assert_called_with('file print terse')
+
+
 def test_check_key_file_not_found(connected_ur):
     connected_ur.public_key_file = pathlib.Path('mykey.pub')
     mock_stdout = MagicMock()
     mock_stdout.readlines.return_value = [
-        '0  otherkey.pub  500\n',
+        ' 0   name=otherkey.pub type=.pub file size=500\n',
     ]
     connected_ur.client.exec_command.return_value = (
         MagicMock(), mock_stdout, MagicMock(),
@@ -171,7 +184,7 @@ def test_check_key_file_exception(connected_ur):
 def test_check_key_file_short_line(connected_ur):
     connected_ur.public_key_file = pathlib.Path('mykey.pub')
     mock_stdout = MagicMock()
-    # Lines with <= 2 words are skipped
+    # lines which are not terse items are skipped
     mock_stdout.readlines.return_value = ['short\n']
     connected_ur.client.exec_command.return_value = (
         MagicMock(), mock_stdout, MagicMock(),
@@ -192,7 +205,7 @@ def test_user_exists_found(connected_ur):
     connected_ur.username = 'scriptuser'
     mock_stdout = MagicMock()
     mock_stdout.readlines.return_value = [
-        '0  scriptuser  full\n',
+        ' 0   name=scriptuser group=full\n',
     ]
     connected_ur.client.exec_command.return_value = (
         MagicMock(), mock_stdout, MagicMock(),
@@ -205,7 +218,7 @@ def test_user_exists_not_found(connected_ur):
     connected_ur.username = 'scriptuser'
     mock_stdout = MagicMock()
     mock_stdout.readlines.return_value = [
-        '0  otheruser  full\n',
+        ' 0   name=otheruser group=full\n',
     ]
     connected_ur.client.exec_command.return_value = (
         MagicMock(), mock_stdout, MagicMock(),
@@ -0,0 +1,55 @@
+import time
+from unittest.mock import MagicMock
+
+from mu.logger import Logger
+from mu.watchdog import Watchdog
+
+
+def _device(name, session_timeout):
+    d = MagicMock(session_timeout=session_timeout)
+    d.name = name
+    return d
+
+
+def test_watchdog_aborts_expired_sessions():
+    logger = MagicMock(spec=Logger)
+    watchdog = Watchdog(logger, interval=60)
+    slow = _device('slow', 10)
+    fast = _device('fast', 100)
+    with watchdog.watch(slow), watchdog.watch(fast):
+        assert watchdog.check(time.monotonic() + 50) == [slow]
+        # an aborted session is not aborted again
+        assert watchdog.check(time.monotonic() + 50) == []
+    watchdog.stop()
+    slow.abort.assert_called_once_with('session exceeded 10s')
+    fast.abort.assert_not_called()
+    assert logger.log.call_args.args[:2] == ('error', 'slow')
+
+
+def test_watchdog_forgets_finished_sessions():
+    watchdog = Watchdog(MagicMock(spec=Logger), interval=60)
+    d = _device('ap1', 10)
+    with watchdog.watch(d):
+        pass
+    watchdog.stop()
+    assert watchdog.check(time.monotonic() + 50) == []
+    d.abort.assert_not_called()
+
+
+def test_watchdog_without_session_timeout():
+    watchdog = Watchdog(MagicMock(spec=Logger))
+    d = _device('ap1', 0)
+    with watchdog.watch(d):
+        assert watchdog.check(time.monotonic() + 10 ** 6) == []
+    assert watchdog._thread is None
+
+
+def test_watchdog_thread():
+    watchdog = Watchdog(MagicMock(spec=Logger), interval=0.01)
+    d = _device('ap1', 0.05)
+    with watchdog.watch(d):
+        deadline = time.monotonic() + 5
+        while not d.abort.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+    watchdog.stop()
+    d.abort.assert_called_once()
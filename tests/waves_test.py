@@ -0,0 +1,224 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from mu.logger import Logger
+from mu.waves import interleave_sites
+from mu.waves import plan_waves
+from mu.waves import wave_size
+from mu.waves import WaveScheduler
+
+
+def _devices(count, canaries=(), sites=None):
+    devices = []
+    for i in range(count):
+        d = MagicMock()
+        d.name = f'r{i}'
+        d.canary = i in canaries
+        d.site = sites[i % len(sites)] if sites else ''
+        d.failures = {}
+        d.upstream = []
+        devices.append(d)
+    return devices
+
+
+@pytest.mark.parametrize(
+    'size, total, expected', [
+        (1, 100, 1),
+        ('5%', 100, 5),
+        ('5%', 10, 1),
+        ('25%', 801, 201),
+        ('100%', 7, 7),
+    ],
+)
+def test_wave_size(size, total, expected):
+    assert wave_size(size, total) == expected
+
+
+@pytest.mark.parametrize('size', [0, -1, '0%', '150%', 'x', 'five'])
+def test_wave_size_invalid(size):
+    with pytest.raises(ValueError):
+        wave_size(size, 100)
+
+
+def test_plan_waves_canaries_first():
+    devices = _devices(100, canaries=(50, 60))
+    waves = plan_waves(devices, [1, '5%', '25%'])
+    assert [len(w) for w in waves] == [2, 1, 5, 25, 67]
+    assert [d.name for d in waves[0]] == ['r50', 'r60']
+    assert waves[1][0].name == 'r0'
+    assert sum(len(w) for w in waves) == 100
+
+
+def test_plan_waves_small_fleet():
+    assert [len(w) for w in plan_waves(_devices(3), [1, '5%', '25%'])] == [
+        1, 1, 1,
+    ]
+    assert [len(w) for w in plan_waves(_devices(3), [])] == [3]
+
+
+def test_plan_waves_upstream_waits_for_devices_behind_it():
+    devices = _devices(6, canaries=(0,))
+    # planned: [r0] [r1] [r2 r3] [r4 r5], r0 and r1 wait for r3 and r5
+    devices[3].upstream = ['r0']
+    devices[5].upstream = ['r1']
+    waves = plan_waves(devices, [1, 2])
+    assert [[d.name for d in w] for w in waves] == [
+        ['r0', 'r2', 'r3'],
+        ['r1', 'r4', 'r5'],
+    ]
+
+
+def test_scheduler_waves_with_upstream():
+    devices = _devices(4)
+    for d in devices[1:]:
+        d.upstream = ['r0']
+    order = []
+    scheduler = WaveScheduler([1], MagicMock(spec=Logger), jobs=4)
+    assert scheduler.run(devices, lambda d: order.append(d.name))
+    assert order[-1] == 'r0'
+
+
+def test_interleave_sites():
+    devices = _devices(6, sites=['a', 'a', 'a', 'b', 'b', 'c'])
+    for d, site in zip(devices, 'aaabbc'):
+        d.site = site
+    assert [d.site for d in interleave_sites(devices)] == list('abcaba')
+
+
+def test_scheduler_aborts_after_failed_wave():
+    devices = _devices(20)
+    processed = []
+
+    def process(d):
+        processed.append(d.name)
+        if d.name in ('r1', 'r2'):
+            d.failures['reboot-wait'] = 1
+
+    scheduler = WaveScheduler(
+        [1, 4],
+        MagicMock(spec=Logger),
+        max_failure_rate=0.25,
+    )
+    assert scheduler.run(devices, process) is False
+    assert scheduler.aborted is True
+    # waves of 1 and 4 devices, 2 of 4 failed in the second one
+    assert processed == ['r0', 'r1', 'r2', 'r3', 'r4']
+
+
+def test_scheduler_timeout_rate():
+    devices = _devices(10)
+
+    def process(d):
+        if d.name == 'r1':
+            d.failures['connect'] = 1
+
+    scheduler = WaveScheduler(
+        [2],
+        MagicMock(spec=Logger),
+        max_failure_rate=1.0,
+        max_timeout_rate=0.2,
+    )
+    assert scheduler.run(devices, process) is False
+
+
+def test_scheduler_completes_and_last_wave_never_aborts():
+    devices = _devices(5)
+
+    def process(d):
+        d.failures['update'] = 1
+
+    scheduler = WaveScheduler([], MagicMock(spec=Logger), jobs=3)
+    assert scheduler.run(devices, process) is True
+
+
+def test_scheduler_site_concurrency():
+    devices = _devices(12, sites=['a', 'b'])
+    running: dict[str, int] = {'a': 0, 'b': 0}
+    peak: dict[str, int] = {'a': 0, 'b': 0}
+    lock = threading.Lock()
+
+    def process(d):
+        with lock:
+            running[d.site] += 1
+            peak[d.site] = max(peak[d.site], running[d.site])
+        time.sleep(0.01)
+        with lock:
+            running[d.site] -= 1
+
+    scheduler = WaveScheduler(
+        [],
+        MagicMock(spec=Logger),
+        jobs=6,
+        site_concurrency=2,
+    )
+    assert scheduler.run(devices, process) is True
+    assert peak == {'a': 2, 'b': 2}
+
+
+def test_scheduler_site_cap_keeps_workers_free():
+    devices = _devices(6, sites=['a', 'b'])
+    finished: list[str] = []
+    lock = threading.Lock()
+
+    def process(d):
+        time.sleep(0.2 if d.site == 'a' else 0.01)
+        with lock:
+            finished.append(d.site)
+
+    scheduler = WaveScheduler(
+        [],
+        MagicMock(spec=Logger),
+        jobs=2,
+        site_concurrency=1,
+    )
+    assert scheduler.run(devices, process) is True
+    # the devices of site b don't wait behind a worker blocked on site a
+    assert finished == ['b', 'b', 'b', 'a', 'a', 'a']
+
+
+def test_scheduler_updates_children_before_upstream():
+    core, dist, ap1, ap2, other = _devices(5)
+    dist.upstream = [core.name]
+    ap1.upstream = [dist.name]
+    ap2.upstream = [dist.name]
+    finished: list[str] = []
+    started: dict[str, list[str]] = {}
+    lock = threading.Lock()
+
+    def process(d):
+        with lock:
+            started[d.name] = list(finished)
+        time.sleep(0.02)
+        with lock:
+            finished.append(d.name)
+
+    scheduler = WaveScheduler([], MagicMock(spec=Logger), jobs=4)
+    assert scheduler.run([core, dist, ap1, ap2, other], process) is True
+    assert set(started[dist.name]) >= {ap1.name, ap2.name}
+    assert dist.name in started[core.name]
+    # the independent leaves ran in parallel
+    assert started[ap1.name] == started[ap2.name] == []
+
+
+def test_scheduler_starts_longest_chains_first():
+    fast1, fast2, slow, core = _devices(4)
+    core.upstream = []
+    fast1.upstream = [core.name]
+    estimates = {
+        fast1.name: 10, fast2.name: 20, slow.name: 50, core.name: 100,
+    }
+    order: list[str] = []
+
+    def process(d):
+        order.append(d.name)
+
+    scheduler = WaveScheduler(
+        [], MagicMock(spec=Logger), jobs=2, estimates=estimates,
+    )
+    assert scheduler.run([fast2, slow, fast1, core], process) is True
+    # fast1 leads to core, the longest chain (110s)
+    assert order[:2] == [fast1.name, slow.name]
+    assert order.index(core.name) > order.index(fast1.name)